@@ -1,32 +1,51 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
 
 from database.session import get_db
 from database import models
+from database.counters import USERS, analytics_from_counters, bump_counters_statement, read_counters_statement
 from schemas import admin as admin_schemas
 from schemas.auth import User as UserSchema 
-from auth import get_current_admin_user, get_password_hash
+from auth import get_current_admin_user, invalidate_user
+from api.v1.uploads import invalidate_upload_responses
+from core.cache import cache_stats
+from core.hashing import password_hasher
+from core.pagination import decode_cursor, finish_page, page_limit
 
 router = APIRouter()
 
 PROTECTED = [Depends(get_current_admin_user)]
 
-# fetch all users
+# fetch the users a page at a time, ordered by id
 @router.get("/users", response_model=List[UserSchema], dependencies=PROTECTED)
-def get_all_users(db: Session = Depends(get_db)):
-    return db.query(models.User).all()
+async def get_all_users(response: Response, cursor: Optional[str] = None, limit: int = Depends(page_limit), db: AsyncSession = Depends(get_db)):
+
+    query = (
+        select(models.User.id, models.User.email, models.User.nickname, models.User.is_admin)
+        .order_by(models.User.id)
+        .limit(limit + 1)
+    )
+    if cursor:
+        (last_id,) = decode_cursor(cursor, (int,))
+        query = query.where(models.User.id > last_id)
+    rows = (await db.execute(query)).all()
+    return finish_page(rows, limit, response, lambda row: (row.id,))
 
 # create a new user
 @router.post("/users", response_model=UserSchema, status_code=status.HTTP_201_CREATED, dependencies=PROTECTED)
-def create_new_user(user: admin_schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_new_user(user: admin_schemas.UserCreate, db: AsyncSession = Depends(get_db)):
 
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+    # a duplicate is turned away before paying for the hash
+    db_user = await db.scalar(select(models.User.id).where(models.User.email == user.email))
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    
-    hashed_password = get_password_hash(user.password)
+    # no connection is held while bcrypt runs, the insert starts a new transaction
+    await db.close()
+    hashed_password = await password_hasher.hash(user.password)
+
     new_user = models.User(
         email=user.email,
         hashed_password=hashed_password,
@@ -34,56 +53,93 @@ def create_new_user(user: admin_schemas.UserCreate, db: Session = Depends(get_db
         is_admin=user.is_admin
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.execute(bump_counters_statement(db.bind.dialect.name, {USERS: 1}))
+    try:
+        await db.commit()
+    except IntegrityError:
+        # registered by a concurrent request while the password was hashed
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Email already registered")
     return new_user
 
 # update user having user_id
 @router.put("/users/{user_id}", response_model=UserSchema, dependencies=PROTECTED)
-def update_existing_user(user_id: int, user_update: admin_schemas.UserUpdate, db: Session = Depends(get_db)):
+async def update_existing_user(user_id: int, user_update: admin_schemas.UserUpdate, db: AsyncSession = Depends(get_db)):
 
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    previous_email = db_user.email
     update_data = user_update.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_user, key, value)
         
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    # the old and the new email can both be token subjects
+    invalidate_user(previous_email, db_user.email)
     return db_user
 
 # delete user having user_id
 @router.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=PROTECTED)
-def delete_existing_user(user_id: int, db: Session = Depends(get_db)):
+async def delete_existing_user(user_id: int, db: AsyncSession = Depends(get_db)):
 
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    db.delete(db_user)
-    db.commit()
+    upload_ids = (await db.scalars(select(models.Upload.id).where(models.Upload.user_id == user_id))).all()
+    await db.delete(db_user)
+    await db.execute(bump_counters_statement(db.bind.dialect.name, {USERS: -1}))
+    await db.commit()
+    invalidate_user(db_user.email)
+    invalidate_upload_responses(*upload_ids)
     return
 
 # get all analytics data
+# The totals are counters maintained by the writes themselves, so this reads a handful of rows
+# instead of scanning the tables. reconcile_counters.py fixes any drift.
 @router.get("/analytics", response_model=admin_schemas.AnalyticsData, dependencies=PROTECTED)
-def get_platform_analytics(db: Session = Depends(get_db)):
-    
-    total_users = db.query(models.User).count()
-    total_uploads = db.query(models.Upload).count()
-    total_analysis_results = db.query(models.AnalysisResult).count()
-    
-    status_counts = db.query(
-        models.Upload.status, 
-        func.count(models.Upload.id)
-    ).group_by(models.Upload.status).all()
-    
-    uploads_by_status = {status: count for status, count in status_counts}
-    
-    return {
-        "total_users": total_users,
-        "total_uploads": total_uploads,
-        "total_analysis_results": total_analysis_results,
-        "uploads_by_status": uploads_by_status
-    }
\ No newline at end of file
+async def get_platform_analytics(db: AsyncSession = Depends(get_db)):
+
+    counters = dict((await db.execute(read_counters_statement())).all())
+    return analytics_from_counters(counters)
+
+def percentile(values: List[float], q: float) -> float:
+    # linear interpolation between the closest ranks, values must be sorted
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return round(values[lower] + (values[upper] - values[lower]) * (position - lower), 4)
+
+# p50/p95 of every pipeline stage over the most recent jobs, from the metrics the worker stores per upload
+@router.get("/stage-metrics", response_model=Dict[str, admin_schemas.StageStats], dependencies=PROTECTED)
+async def get_stage_metrics(last: int = Query(500, ge=1, le=10000), db: AsyncSession = Depends(get_db)):
+
+    all_metrics = (await db.scalars(
+        select(models.Upload.stage_metrics)
+        .where(models.Upload.stage_metrics.is_not(None))
+        .order_by(models.Upload.id.desc())
+        .limit(last)
+    )).all()
+
+    samples = {}
+    for job_metrics in all_metrics:
+        for stage, entry in job_metrics.items():
+            stage_samples = samples.setdefault(stage, {"wall_seconds": [], "cpu_seconds": [], "peak_rss_mb": []})
+            for key, values in stage_samples.items():
+                values.append(entry.get(key, 0.0))
+
+    stats = {}
+    for stage, stage_samples in samples.items():
+        stats[stage] = {"jobs": len(stage_samples["wall_seconds"])}
+        for key, values in stage_samples.items():
+            values.sort()
+            stats[stage][f"{key}_p50"] = percentile(values, 0.50)
+            stats[stage][f"{key}_p95"] = percentile(values, 0.95)
+    return stats
+
+# hit rates of the in-process caches
+@router.get("/cache-stats", response_model=Dict[str, admin_schemas.CacheStats], dependencies=PROTECTED)
+async def get_cache_stats():
+    return cache_stats()
@@ -1,25 +1,40 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
 from database.session import get_db
 from database import models
 from schemas import auth as schemas
 from core.config import settings
-from auth import create_access_token, verify_password, get_current_user
+from core.hashing import password_hasher
+from auth import create_access_token, get_current_user
 
 router = APIRouter()
 
 # endpoint for user login
 @router.post("/token")
-def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = (await db.execute(
+        select(models.User.id, models.User.email, models.User.hashed_password).where(models.User.email == form_data.username)
+    )).first()
+    # hand the connection back to the pool while bcrypt runs, a login burst must not drain it
+    await db.rollback()
+
+    verified, new_hash = (False, None)
+    if user:
+        verified, new_hash = await password_hasher.verify_and_update(form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
         )
+
+    # the stored hash used an older cost, replace it now that we know the password
+    if new_hash:
+        await db.execute(update(models.User).where(models.User.id == user.id).values(hashed_password=new_hash))
+        await db.commit()
     
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -38,11 +53,11 @@ def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestF
 
 # logout user
 @router.post("/logout")
-def logout(response: Response):
+async def logout(response: Response):
     response.delete_cookie("access_token")
     return {"msg": "Logout successful"}
 
 # get the current user details
 @router.get("/users/me", response_model=schemas.User)
-def read_users_me(current_user: models.User = Depends(get_current_user)):
+async def read_users_me(current_user: schemas.User = Depends(get_current_user)):
     return current_user
\ No newline at end of file
@@ -1,19 +1,60 @@
-from typing import List
+import asyncio
+import hashlib
+import json
+import secrets
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Literal, Optional
 import boto3
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from core.cache import register_cache
 from core.config import settings
+from core.documents import open_document_artifact
+from core.pagination import decode_cursor, finish_page, page_limit
 from database import models
-from database.session import get_db
+from database.session import get_db, upload_events
 from schemas import analysis as schemas
+from schemas.auth import User as UserSchema
 from auth import get_current_user
 import re
 
 router = APIRouter()
 
-# generates a presigned URL for uploading a file to S3
+# upload_id -> (user_id, serialized UploadResponse, ETag). Only finished uploads are cached,
+# their results don't change unless the upload is reprocessed or deleted.
+upload_response_cache = register_cache("upload_responses", settings.UPLOAD_CACHE_SIZE, settings.UPLOAD_CACHE_TTL_SECONDS)
+CACHEABLE_STATUSES = {"completed"}
+
+def invalidate_upload_responses(*upload_ids: int):
+    upload_response_cache.invalidate(*upload_ids)
+
+# a status change means the upload's results may have changed too (e.g. when it is reprocessed)
+upload_events.add_hook(lambda event: invalidate_upload_responses(event.get("upload_id")))
+
+# If-None-Match uses the weak comparison, so W/"x" matches "x"
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+# Building a boto3 client is slow and blocking, so one client is shared by all requests
+@lru_cache(maxsize=1)
+def get_s3_client():
+    return boto3.client(
+        "s3",
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_REGION
+    )
+
+# generates a presigned URL for uploading a file to S3.
+# product_line names the stored topic model the worker keeps for this kind of file, and an
+# "incremental" upload is analyzed with that model instead of fitting a new one
 @router.post("/presigned-url", response_model=schemas.PresignedUrlResponse)
-def create_presigned_url(filename: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def create_presigned_url(filename: str, product_line: str = "default", mode: Literal["full", "incremental"] = "full", db: AsyncSession = Depends(get_db), current_user: UserSchema = Depends(get_current_user)):
 
     # check if the filename is valid
     if re.search(r"[^a-zA-Z0-9._-]", filename):
@@ -22,15 +63,21 @@ def create_presigned_url(filename: str, db: Session = Depends(get_db), current_u
             detail="Invalid filename. Please use only letters, numbers, dots, underscores, and hyphens."
         )
 
+    if not re.fullmatch(r"[a-zA-Z0-9._-]{1,100}", product_line):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid product line. Please use up to 100 letters, numbers, dots, underscores, and hyphens."
+        )
+
     # Check if the file is a CSV
     if not filename.lower().endswith('.csv'):
         raise HTTPException(status_code=400, detail="Invalid file type. Only .csv files are allowed.")
     
     # Check for uniqueness for this user
-    existing_upload = db.query(models.Upload).filter(
+    existing_upload = await db.scalar(select(models.Upload.id).where(
         models.Upload.user_id == current_user.id,
         models.Upload.filename == filename
-    ).first()
+    ))
 
     if existing_upload:
         raise HTTPException(
@@ -39,12 +86,7 @@ def create_presigned_url(filename: str, db: Session = Depends(get_db), current_u
         )
     
 
-    s3_client = boto3.client(
-        "s3",
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_REGION
-    )
+    s3_client = get_s3_client()
     try:
 
         s3_key = f"{current_user.id}/{filename}"
@@ -52,10 +94,16 @@ def create_presigned_url(filename: str, db: Session = Depends(get_db), current_u
         response = s3_client.generate_presigned_post(
             Bucket=settings.S3_BUCKET_NAME,
             Key=s3_key,
-            Fields={"acl": "private", "Content-Type": "text/csv"},
+            # the worker reads the analysis options back from the object's metadata
+            Fields={
+                "acl": "private", "Content-Type": "text/csv",
+                "x-amz-meta-product-line": product_line, "x-amz-meta-analysis-mode": mode,
+            },
             Conditions=[
                 {"acl": "private"},
-                {"Content-Type": "text/csv"}
+                {"Content-Type": "text/csv"},
+                {"x-amz-meta-product-line": product_line},
+                {"x-amz-meta-analysis-mode": mode},
             ],
             ExpiresIn=3600  
         )
@@ -63,21 +111,152 @@ def create_presigned_url(filename: str, db: Session = Depends(get_db), current_u
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Could not generate presigned URL: {e}")
 
-# fetch all the uploaded files for current user
+# one page of a user's uploads, newest first. Served by the (user_id, created_at, id) index.
+def upload_page_query(user_id: int, limit: int, cursor: Optional[str] = None):
+    query = (
+        select(models.Upload.id, models.Upload.filename, models.Upload.status, models.Upload.created_at)
+        .where(models.Upload.user_id == user_id)
+        .order_by(models.Upload.created_at.desc(), models.Upload.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        created_at, upload_id = decode_cursor(cursor, (datetime.fromisoformat, int))
+        query = query.where(tuple_(models.Upload.created_at, models.Upload.id) < (created_at, upload_id))
+    return query
+
+# fetch the uploaded files for current user, a page at a time
 @router.get("/", response_model=List[schemas.UploadInfo])
-def get_all_uploads(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def get_all_uploads(response: Response, cursor: Optional[str] = None, limit: int = Depends(page_limit), db: AsyncSession = Depends(get_db), current_user: UserSchema = Depends(get_current_user)):
+
+    rows = (await db.execute(upload_page_query(current_user.id, limit, cursor))).all()
+    return finish_page(rows, limit, response, lambda row: (row.created_at, row.id))
+
+# stream status changes of the current user's uploads as server-sent events.
+# Declared before /{upload_id} so "events" isn't taken for an upload id.
+@router.get("/events")
+async def stream_upload_events(request: Request, db: AsyncSession = Depends(get_db), current_user: UserSchema = Depends(get_current_user)):
+
+    # the stream can stay open for hours, so it must not hold on to a pooled connection
+    await db.close()
+    user_id = current_user.id
 
-    all_uploads = db.query(models.Upload).filter(models.Upload.user_id == current_user.id).order_by(models.Upload.created_at.desc()).all()
-    return all_uploads
+    async def event_stream():
+        queue = upload_events.subscribe(user_id)
+        try:
+            # tells the client it is connected, it refetches whatever it missed in between
+            yield "retry: 5000\nevent: ready\ndata: {}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+        finally:
+            upload_events.unsubscribe(user_id, queue)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
+
+# publish a status change with the in-memory notifier, for local runs without LISTEN/NOTIFY.
+# Called by the worker after it commits, only the id is taken and the event is read back from the database.
+@router.post("/events", status_code=204)
+async def publish_upload_event(event: schemas.UploadEvent, x_upload_events_token: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+
+    if settings.NOTIFIER_BACKEND != "memory" or not settings.UPLOAD_EVENTS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_upload_events_token or not secrets.compare_digest(x_upload_events_token, settings.UPLOAD_EVENTS_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid upload events token")
+
+    upload = (await db.execute(
+        select(models.Upload.id, models.Upload.user_id, models.Upload.status).where(models.Upload.id == event.upload_id)
+    )).first()
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    upload_events.publish({"upload_id": upload.id, "user_id": upload.user_id, "status": upload.status})
+    return Response(status_code=204)
 
 # fetch the results of a specific upload by its id
 @router.get("/{upload_id}", response_model=schemas.UploadResponse)
-def get_upload_results(upload_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def get_upload_results(upload_id: int, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db), current_user: UserSchema = Depends(get_current_user)):
+
+    cached = upload_response_cache.get(upload_id)
+    if cached:
+        owner_id, body, etag = cached
+    else:
+        # a status event while the upload is read keeps the response out of the cache, see TTLCache
+        generation = upload_response_cache.generation(upload_id)
+        # results can't be lazy loaded on an async session, so they come with the upload
+        upload = await db.scalar(
+            select(models.Upload).options(selectinload(models.Upload.results)).where(models.Upload.id == upload_id)
+        )
+        if not upload:
+            raise HTTPException(status_code=404, detail="Upload not found")
+
+        owner_id = upload.user_id
+        body = schemas.UploadResponse.model_validate(upload).model_dump_json().encode()
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        if upload.status in CACHEABLE_STATUSES:
+            upload_response_cache.set(upload_id, (owner_id, body, etag), generation)
+
+    if owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this resource")
+
+    # the browser keeps the body and revalidates it every time, unchanged results come back as a 304
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag_matches(etag, if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 
-    upload = db.query(models.Upload).filter(models.Upload.id == upload_id).first()
+def _cursor_rank(value) -> int:
+    # ranks start at 0, the first page is the one after rank -1
+    rank = int(value)
+    if rank < 0:
+        raise ValueError
+    return rank
+
+
+# reviews of one topic of an upload, filtered by sentiment and sorted, a page at a time.
+# Served from the per-review files the worker wrote, memory-mapped so only the returned rows are read.
+@router.get("/{upload_id}/documents", response_model=List[schemas.DocumentResult])
+async def get_upload_documents(
+    upload_id: int,
+    response: Response,
+    topic_id: int = Query(..., ge=0),
+    sort: Literal["sentiment", "-sentiment", "-probability"] = "sentiment",
+    sentiment_min: Optional[float] = Query(None, ge=-1, le=1),
+    sentiment_max: Optional[float] = Query(None, ge=-1, le=1),
+    cursor: Optional[str] = None,
+    limit: int = Depends(page_limit),
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSchema = Depends(get_current_user),
+):
+
+    upload = (await db.execute(
+        select(models.Upload.user_id, models.Upload.documents_key).where(models.Upload.id == upload_id)
+    )).first()
+    # the files may have to be downloaded first, which shouldn't hold on to a pooled connection
+    await db.close()
     if not upload:
         raise HTTPException(status_code=404, detail="Upload not found")
-    
     if upload.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to access this resource")
-    return upload
\ No newline at end of file
+    if not upload.documents_key or not settings.DOCUMENTS_BUCKET_NAME:
+        raise HTTPException(status_code=404, detail="Per-review results are not available for this upload")
+
+    after = decode_cursor(cursor, (_cursor_rank,))[0] if cursor else -1
+
+    def read_page():
+        artifact = open_document_artifact(get_s3_client(), upload.documents_key)
+        return artifact.page(topic_id, sort, sentiment_min, sentiment_max, after, limit + 1)
+
+    try:
+        rows = await asyncio.to_thread(read_page)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Could not read the per-review results: {e}")
+
+    page = finish_page(rows, limit, response, lambda row: (row[0],))
+    return [review for _, review in page]
+
@@ -4,22 +4,19 @@ from typing import Optional
 from fastapi import Depends, HTTPException, status, Cookie
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from core.cache import register_cache
 from core.config import settings
 from database.session import get_db
 from database import models
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from schemas.auth import User as UserSchema
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# token subject (email) -> snapshot of the user, so polling requests don't query postgres every time
+user_cache = register_cache("users", settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL_SECONDS)
 
 # create j JWT token
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -33,7 +30,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 # get the current user from the access token
-def get_current_user(access_token: Optional[str] = Cookie(None), db: Session = Depends(get_db)):
+async def get_current_user(access_token: Optional[str] = Cookie(None), db: AsyncSession = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -49,13 +46,23 @@ def get_current_user(access_token: Optional[str] = Cookie(None), db: Session = D
     except JWTError:
         raise credentials_exception
     
-    user = db.query(models.User).filter(models.User.email == email).first()
+    user = user_cache.get(email)
     if user is None:
-        raise credentials_exception
+        # an invalidate_user while postgres is queried means the row read may be stale, it isn't cached then
+        generation = user_cache.generation(email)
+        db_user = await db.scalar(select(models.User).where(models.User.email == email))
+        if db_user is None:
+            raise credentials_exception
+        user = UserSchema.model_validate(db_user)
+        user_cache.set(email, user, generation)
     return user
 
+# drop cached users after their account was changed or deleted
+def invalidate_user(*emails: str):
+    user_cache.invalidate(*emails)
+
 # check if the user is an admin
-def get_current_admin_user(current_user: models.User = Depends(get_current_user)):
+async def get_current_admin_user(current_user: UserSchema = Depends(get_current_user)):
     
     if not current_user.is_admin:
         raise HTTPException(
@@ -0,0 +1,121 @@
+# Closed-loop HTTP load test for the dashboard endpoints. Logs in once, then keeps
+# --concurrency requests in flight for --duration seconds and reports requests per second
+# and latency percentiles as JSON.
+#
+# To compare two builds, run the same command against each server and diff the reports, e.g.
+# a checkout of the sync stack on :8001 and the current tree on :8000:
+#
+#   python benchmarks/load_test.py --base-url http://localhost:8001 --label sync --output sync.json
+#   python benchmarks/load_test.py --base-url http://localhost:8000 --label async --output async.json
+#   python benchmarks/load_test.py --compare sync.json async.json
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+DEFAULT_PATHS = ["/api/v1/users/me", "/api/v1/uploads/"]
+
+
+def percentile(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str):
+    response = await client.post("/api/v1/token", data={"username": email, "password": password})
+    response.raise_for_status()
+    # The auth cookie is marked secure, so it is copied over by hand for plain http targets
+    client.cookies.set("access_token", response.cookies["access_token"])
+
+
+async def run_client(client: httpx.AsyncClient, paths: list, deadline: float, latencies: list, errors: list):
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(path)
+
+
+async def load_test(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        await login(client, args.email, args.password)
+
+        # Warm up the connection pools on both sides before measuring
+        await asyncio.gather(*(client.get(path) for path in args.paths for _ in range(args.concurrency)))
+
+        latencies, errors = [], []
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(
+            run_client(client, args.paths, deadline, latencies, errors) for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "label": args.label,
+        "base_url": args.base_url,
+        "paths": args.paths,
+        "concurrency": args.concurrency,
+        "seconds": round(elapsed, 2),
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def compare(baseline_path: str, candidate_path: str) -> dict:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+    return {
+        "baseline": baseline["label"],
+        "candidate": candidate["label"],
+        "rps_ratio": round(candidate["rps"] / baseline["rps"], 2) if baseline["rps"] else None,
+        "p99_ratio": round(candidate["p99_ms"] / baseline["p99_ms"], 2) if baseline["p99_ms"] else None,
+        "results": [baseline, candidate],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--email", default="admin@example.com")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--paths", nargs="+", default=DEFAULT_PATHS)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                        help="compare two saved reports instead of running a load test")
+    args = parser.parse_args()
+
+    if args.compare:
+        print(json.dumps(compare(*args.compare), indent=2))
+    else:
+        report = asyncio.run(load_test(args))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,95 @@
+# Checks that a burst of logins doesn't slow the rest of the API down. A probe client requests
+# --probe-path at a steady rate, first on its own and then while --storm-concurrency clients
+# hammer /token. Reports the probe's latency in both phases and how the logins fared
+# (accepted, rejected with 429, failed).
+#
+# Usage: python benchmarks/login_storm.py --base-url http://localhost:8000 --storm-concurrency 200
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load_test import login, percentile  # noqa: E402
+
+
+async def probe(client: httpx.AsyncClient, path: str, interval: float, deadline: float) -> list:
+    latencies = []
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get(path)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(max(0.0, interval - (time.perf_counter() - start)))
+    return latencies
+
+
+async def storm_client(client: httpx.AsyncClient, email: str, password: str, deadline: float, outcomes: Counter):
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.post("/api/v1/token", data={"username": email, "password": password})
+            outcomes[response.status_code] += 1
+            if response.status_code == 429:
+                # a well-behaved client backs off for a moment
+                await asyncio.sleep(0.05)
+        except httpx.HTTPError:
+            outcomes["error"] += 1
+
+
+def summarize(latencies: list) -> dict:
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0) * 1000, 2),
+    }
+
+
+async def run(args) -> dict:
+    interval = 1 / args.probe_rate
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as probe_client:
+        await login(probe_client, args.email, args.password)
+
+        baseline = await probe(probe_client, args.probe_path, interval, time.perf_counter() + args.duration)
+
+        outcomes = Counter()
+        limits = httpx.Limits(max_connections=args.storm_concurrency)
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as storm:
+            deadline = time.perf_counter() + args.duration
+            storm_tasks = [
+                asyncio.create_task(storm_client(storm, args.email, args.password, deadline, outcomes))
+                for _ in range(args.storm_concurrency)
+            ]
+            during_storm = await probe(probe_client, args.probe_path, interval, deadline)
+            await asyncio.gather(*storm_tasks)
+
+    return {
+        "probe_path": args.probe_path,
+        "storm_concurrency": args.storm_concurrency,
+        "seconds_per_phase": args.duration,
+        "probe_baseline": summarize(baseline),
+        "probe_during_storm": summarize(during_storm),
+        "logins": {str(status): count for status, count in sorted(outcomes.items(), key=str)},
+        "logins_per_second": round(outcomes[200] / args.duration, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--email", default="admin@example.com")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--probe-path", default="/api/v1/uploads/")
+    parser.add_argument("--probe-rate", type=float, default=20.0, help="probe requests per second")
+    parser.add_argument("--storm-concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per phase")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
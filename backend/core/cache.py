@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# In-process caches. The API runs as a single gunicorn worker (see the Dockerfile), so
+# invalidating an entry here takes effect for every following request.
+
+
+class TTLCache:
+    # Thread-safe LRU cache whose entries also expire after ttl_seconds.
+    # A value read while its key is invalidated must not be cached, so callers filling a miss take the
+    # key's generation before reading the source and hand it to set(), which skips the value if the
+    # key was invalidated in between.
+    # on_evict(key, value) is called, outside the lock, for every entry that is evicted, expires or is
+    # invalidated, e.g. to delete files behind the value. Replacing the value of a key doesn't call it.
+    def __init__(self, name: str, maxsize: int, ttl_seconds: float, on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> number of the invalidation that last dropped it, only the most recent maxsize keys are
+        # remembered. A forgotten key is as new as the last generation forgotten, which can only make
+        # set() skip a value it would have kept.
+        self._generations = OrderedDict()
+        self._invalidation_count = 0
+        self._forgotten_generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _dropped(self, entries: list):
+        if self.on_evict:
+            for key, value in entries:
+                self.on_evict(key, value)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        expired = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                expired.append((key, value))
+            self.misses += 1
+        self._dropped(expired)
+        return None
+
+    def generation(self, key: Hashable) -> int:
+        with self._lock:
+            return self._generations.get(key, self._forgotten_generation)
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        if self.maxsize <= 0:
+            self._dropped([(key, value)])
+            return
+        evicted = []
+        with self._lock:
+            if generation is not None and self._generations.get(key, self._forgotten_generation) != generation:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                evicted_key, (evicted_value, _) = self._entries.popitem(last=False)
+                evicted.append((evicted_key, evicted_value))
+                self.evictions += 1
+        self._dropped(evicted)
+
+    def invalidate(self, *keys: Hashable):
+        dropped = []
+        with self._lock:
+            for key in keys:
+                self._invalidation_count += 1
+                self._generations[key] = self._invalidation_count
+                self._generations.move_to_end(key)
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    dropped.append((key, entry[0]))
+                    self.invalidations += 1
+            while len(self._generations) > max(self.maxsize, 0):
+                _, generation = self._generations.popitem(last=False)
+                self._forgotten_generation = max(self._forgotten_generation, generation)
+        self._dropped(dropped)
+
+    def clear(self):
+        with self._lock:
+            dropped = [(key, value) for key, (value, _) in self._entries.items()]
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            # every key counts as invalidated
+            self._invalidation_count += 1
+            self._forgotten_generation = self._invalidation_count
+            self._generations.clear()
+        self._dropped(dropped)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# Every cache registers itself here so the admin API can report on all of them
+_registry = {}
+
+
+def register_cache(name: str, maxsize: int, ttl_seconds: float, on_evict: Optional[Callable[[Hashable, Any], None]] = None) -> TTLCache:
+    cache = TTLCache(name, maxsize, ttl_seconds, on_evict)
+    _registry[name] = cache
+    return cache
+
+
+def cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in _registry.items()}
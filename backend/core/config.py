@@ -19,6 +19,51 @@ class Settings(BaseSettings):
     ENVIRONMENT: str = "development"
     CORS_ORIGINS: Union[str, List[str]] = ""
 
+    # Database connection pool
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_COMMAND_TIMEOUT: float = 30
+
+    # Password hashing. Changing the rounds rehashes stored passwords on the next login.
+    # HASH_WORKERS=0 means one process per core but one.
+    BCRYPT_ROUNDS: int = 12
+    HASH_WORKERS: int = 0
+    HASH_NICENESS: int = 10
+    HASH_MAX_PENDING: int = 64
+    HASH_RETRY_AFTER_SECONDS: int = 2
+
+    # Authenticated users are cached for this long, admin changes invalidate them right away
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: int = 300
+
+    # Serialized results of finished uploads
+    UPLOAD_CACHE_SIZE: int = 1000
+    UPLOAD_CACHE_TTL_SECONDS: int = 3600
+
+    # Upload status events. "postgres" listens for the worker's NOTIFYs, "memory" only sees
+    # events published in this process: a local worker posts them to /api/v1/uploads/events,
+    # authenticated with UPLOAD_EVENTS_TOKEN (no token, no endpoint).
+    NOTIFIER_BACKEND: str = "postgres"
+    UPLOAD_EVENTS_TOKEN: str = ""
+    UPLOAD_EVENTS_CHANNEL: str = "upload_status"
+    SSE_QUEUE_SIZE: int = 100
+    SSE_KEEPALIVE_SECONDS: int = 15
+
+    # Per-review results written by the worker. They are downloaded to DOCUMENTS_CACHE_DIR on first use
+    # and memory-mapped from there, the cache holds the mapped files of recently viewed uploads.
+    # No bucket means the drill-down isn't available.
+    DOCUMENTS_BUCKET_NAME: str = ""
+    DOCUMENTS_CACHE_DIR: str = "/tmp/productpulse-documents"
+    DOCUMENTS_CACHE_SIZE: int = 32
+    DOCUMENTS_CACHE_TTL_SECONDS: int = 3600
+
+    # Page sizes of the paginated listings
+    PAGE_SIZE_DEFAULT: int = 50
+    PAGE_SIZE_MAX: int = 200
+
     @field_validator("CORS_ORIGINS", mode="before")
     def parse_cors_origins(cls, v):
         if isinstance(v, str):
@@ -0,0 +1,120 @@
+import mmap
+import os
+import shutil
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from core.cache import register_cache
+from core.config import settings
+
+# Per-review results of an upload, as written by the worker (see worker/documents.py):
+#   documents.npy          one record per review, ordered by topic_id and then sentiment
+#   probability_order.npy  positions into documents.npy, ordered by topic_id and then topic probability (highest first)
+#   reviews.bin            the raw review texts, each record points at its text_offset/text_length
+# All three are memory-mapped, a page of results only reads the records and texts it returns.
+DOCUMENT_FILES = ("documents.npy", "probability_order.npy", "reviews.bin")
+DOCUMENT_SORTS = ("sentiment", "-sentiment", "-probability")
+
+
+def _artifact_directory(documents_key: str) -> str:
+    return os.path.join(settings.DOCUMENTS_CACHE_DIR, documents_key)
+
+
+def _delete_files(documents_key: str, artifact):
+    # Pages still being read keep their memory maps, the files only go away once those are closed
+    shutil.rmtree(_artifact_directory(documents_key), ignore_errors=True)
+
+
+# documents_key -> DocumentArtifact, the downloaded files are deleted with the entry
+document_artifacts = register_cache(
+    "document_artifacts", settings.DOCUMENTS_CACHE_SIZE, settings.DOCUMENTS_CACHE_TTL_SECONDS, on_evict=_delete_files,
+)
+
+
+class DocumentArtifact:
+    def __init__(self, directory: str):
+        self.documents = np.load(os.path.join(directory, "documents.npy"), mmap_mode="r")
+        self.probability_order = np.load(os.path.join(directory, "probability_order.npy"), mmap_mode="r")
+        reviews_path = os.path.join(directory, "reviews.bin")
+        if os.path.getsize(reviews_path):
+            with open(reviews_path, "rb") as f:
+                # the mapping stays valid after the file is closed
+                self.reviews = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.reviews = b""
+
+    def topic_range(self, topic_id: int) -> Tuple[int, int]:
+        # the records of a topic are contiguous, found by binary search on the sorted topic_id column
+        topic_ids = self.documents["topic_id"]
+        return int(np.searchsorted(topic_ids, topic_id, side="left")), int(np.searchsorted(topic_ids, topic_id, side="right"))
+
+    def page(
+        self, topic_id: int, sort: str, sentiment_min: Optional[float], sentiment_max: Optional[float], after: int, limit: int,
+    ) -> List[Tuple[int, dict]]:
+        # Up to limit (rank, review) pairs of the topic in the given order, starting after the review ranked `after`
+        start, stop = self.topic_range(topic_id)
+
+        if sort in ("sentiment", "-sentiment"):
+            # the topic's records are already sorted by sentiment, the bounds narrow them down directly
+            sentiments = self.documents["sentiment"][start:stop]
+            low = start + (int(np.searchsorted(sentiments, sentiment_min, side="left")) if sentiment_min is not None else 0)
+            high = start + (int(np.searchsorted(sentiments, sentiment_max, side="right")) if sentiment_max is not None else stop - start)
+            ranks = np.arange(after + 1, min(after + 1 + limit, max(high - low, 0)))
+            positions = low + ranks if sort == "sentiment" else high - 1 - ranks
+        else:
+            # probability order, reviews outside the sentiment bounds are skipped a batch at a time
+            order = self.probability_order[start:stop]
+            ranks, positions = [], []
+            batch_start = after + 1
+            while len(ranks) < limit and batch_start < len(order):
+                batch = np.asarray(order[batch_start:batch_start + limit * 4])
+                keep = np.ones(len(batch), dtype=bool)
+                if sentiment_min is not None or sentiment_max is not None:
+                    sentiments = self.documents["sentiment"][batch]
+                    if sentiment_min is not None:
+                        keep &= sentiments >= sentiment_min
+                    if sentiment_max is not None:
+                        keep &= sentiments <= sentiment_max
+                kept = np.flatnonzero(keep)[:limit - len(ranks)]
+                ranks.extend((batch_start + kept).tolist())
+                positions.extend(batch[kept].tolist())
+                batch_start += len(batch)
+
+        records = self.documents[np.asarray(positions, dtype=np.int64)]
+        return [(int(rank), self._review(record)) for rank, record in zip(ranks, records)]
+
+    def _review(self, record) -> dict:
+        offset, length = int(record["text_offset"]), int(record["text_length"])
+        return {
+            "doc_id": int(record["doc_id"]),
+            "topic_id": int(record["topic_id"]),
+            "sentiment": float(record["sentiment"]),
+            "topic_probability": float(record["topic_probability"]),
+            "text": bytes(self.reviews[offset:offset + length]).decode("utf-8", errors="replace"),
+        }
+
+
+def _download(s3_client, documents_key: str, directory: str):
+    os.makedirs(directory, exist_ok=True)
+    for name in DOCUMENT_FILES:
+        path = os.path.join(directory, name)
+        if os.path.exists(path): continue
+        # a file only appears under its name once it is complete
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+        s3_client.download_file(settings.DOCUMENTS_BUCKET_NAME, f"{documents_key}/{name}", temporary_path)
+        os.replace(temporary_path, path)
+
+
+def open_document_artifact(s3_client, documents_key: str) -> DocumentArtifact:
+    # Blocking (downloads and maps files), run it off the event loop.
+    # Files stay in DOCUMENTS_CACHE_DIR while the artifact is cached. The worker writes every analysis of an
+    # upload under a new documents_key, so the files behind a key never change.
+    artifact = document_artifacts.get(documents_key)
+    if artifact is None:
+        directory = _artifact_directory(documents_key)
+        _download(s3_client, documents_key, directory)
+        artifact = DocumentArtifact(directory)
+        document_artifacts.set(documents_key, artifact)
+    return artifact
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# bcrypt is slow on purpose. Hashes are computed in a separate pool of processes so a burst of
+# logins can't hold the GIL or the request threads, and the pool only takes so much work before
+# new requests are turned away with a 429 instead of queueing for ever.
+
+# Hashes with a different cost (or scheme) are upgraded on the next successful login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    # (matches, new hash when the stored one should be replaced)
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+def _lower_priority(niceness: int):
+    # hashing yields the CPU to the API process when they compete for it
+    try:
+        os.nice(niceness)
+    except OSError:
+        pass
+
+
+def _warm_up() -> int:
+    return os.getpid()
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_pending: int, retry_after_seconds: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retry_after_seconds = retry_after_seconds
+        self.pending = 0
+        self._executor = None
+
+    def start(self):
+        if self._executor is not None:
+            return
+        try:
+            # spawn, because forking a process that already runs an event loop and threads isn't safe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_lower_priority,
+                initargs=(settings.HASH_NICENESS,),
+            )
+            # start the workers now rather than on the first login
+            for _ in range(self.workers):
+                self._executor.submit(_warm_up)
+        except (OSError, NotImplementedError) as e:
+            logger.warning(f"Process pool unavailable for password hashing, using threads: {e}")
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many sign-in requests, please try again shortly.",
+                headers={"Retry-After": str(self.retry_after_seconds)},
+            )
+        self.start()
+        # pending is only touched on the event loop, so it needs no lock
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self._run(verify_and_update, password, hashed_password)
+
+
+password_hasher = PasswordHasher(
+    # by default one core is left to the event loop
+    workers=settings.HASH_WORKERS or max(1, (os.cpu_count() or 1) - 1),
+    max_pending=settings.HASH_MAX_PENDING,
+    retry_after_seconds=settings.HASH_RETRY_AFTER_SECONDS,
+)
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List, Set
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Upload status changes, published by the worker as {"upload_id", "user_id", "status"}.
+# The in-memory notifier only sees events published inside this process (local runs and tests).
+# The postgres one LISTENs on the channel the worker NOTIFYs on when it commits a status change.
+
+
+class InMemoryNotifier:
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._hooks: List[Callable[[dict], None]] = []
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def add_hook(self, hook: Callable[[dict], None]):
+        # hooks see every event, e.g. to invalidate caches
+        self._hooks.append(hook)
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=settings.SSE_QUEUE_SIZE)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def publish(self, event: dict):
+        for hook in self._hooks:
+            try:
+                hook(event)
+            except Exception as e:
+                logger.error(f"Upload event hook failed: {e}")
+
+        for queue in self._subscribers.get(event.get("user_id"), ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # a client that stopped reading misses events, it refetches when it reconnects
+                logger.warning(f"Dropping upload event for a slow subscriber of user {event.get('user_id')}")
+
+
+class PostgresNotifier(InMemoryNotifier):
+    def __init__(self, dsn: str, channel: str):
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._listen_forever())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def _on_notification(self, connection, pid, channel, payload):
+        try:
+            self.publish(json.loads(payload))
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Ignoring malformed notification on {channel}: {e}")
+
+    async def _listen_forever(self):
+        # One dedicated connection per API process, reopened when it drops
+        import asyncpg
+
+        backoff = 1
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(self.channel, self._on_notification)
+                logger.info(f"Listening for upload events on '{self.channel}'")
+                backoff = 1
+                await closed.wait()
+                logger.warning("Upload event connection closed, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Upload event listener failed, retrying in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+
+def build_notifier(dsn: str):
+    if settings.NOTIFIER_BACKEND == "memory":
+        return InMemoryNotifier()
+    return PostgresNotifier(dsn, settings.UPLOAD_EVENTS_CHANNEL)
@@ -0,0 +1,40 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, Query, Response, status
+
+from core.config import settings
+
+# Listings are paged with keyset cursors: the cursor holds the sort key of the last row of a
+# page and the next page starts right after it, so deep pages cost as much as the first one.
+# The cursor for the next page is sent in this header, the body stays a plain JSON array.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, parsers: tuple) -> list:
+    # parsers turns each value back into its column type, e.g. (datetime.fromisoformat, int)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError
+        return [parse(value) for parse, value in zip(parsers, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def page_limit(limit: int = Query(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX)) -> int:
+    return limit
+
+
+def finish_page(rows: list, limit: int, response: Response, cursor_of) -> list:
+    # rows were fetched with limit + 1, the extra row only tells whether there is another page
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*cursor_of(rows[-1]))
+    return rows
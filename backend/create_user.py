@@ -1,19 +1,15 @@
 # For first-time user (Admin) creation
 
-from passlib.context import CryptContext
 from database.session import SessionLocal, engine
 from database.models import User, Base
+from database.counters import USERS, bump_counters_statement
+from core.hashing import hash_password
 import logging
 from core.logging_config import setup_logging
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
 def create_user(nickname, email, password, is_admin: bool = False):
     db = SessionLocal()
     try:
@@ -23,7 +19,7 @@ def create_user(nickname, email, password, is_admin: bool = False):
             user.is_admin = is_admin
         else:
             logger.info(f"Creating new user: {email}")
-            hashed_password = get_password_hash(password)
+            hashed_password = hash_password(password)
             user = User(
                 nickname=nickname,
                 email=email,
@@ -31,6 +27,7 @@ def create_user(nickname, email, password, is_admin: bool = False):
                 is_admin=is_admin 
             )
             db.add(user)
+            db.execute(bump_counters_statement(engine.dialect.name, {USERS: 1}))
         
         db.commit()
         logger.info(f"Successfully configured user: {nickname} ({email}) with admin_status={is_admin}")
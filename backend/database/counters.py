@@ -0,0 +1,78 @@
+from typing import Dict
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database.models import AnalysisResult, AnalyticsCounter, Upload, User
+
+# Counter names. Upload statuses are counted under "uploads_status:<status>".
+USERS = "users"
+UPLOADS = "uploads"
+ANALYSIS_RESULTS = "analysis_results"
+STATUS_PREFIX = "uploads_status:"
+
+
+def status_counter(status: str) -> str:
+    return f"{STATUS_PREFIX}{status}"
+
+
+def bump_counters_statement(dialect_name: str, deltas: Dict[str, int]):
+    # One upsert that adds the deltas. Execute it in the transaction that makes the change it counts.
+    # Rows are locked in name order, so concurrent transactions can't deadlock on them.
+    insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    stmt = insert(AnalyticsCounter).values([
+        {"name": name, "value": delta} for name, delta in sorted(deltas.items())
+    ])
+    return stmt.on_conflict_do_update(
+        index_elements=[AnalyticsCounter.name],
+        set_={"value": AnalyticsCounter.value + stmt.excluded.value},
+    )
+
+
+def read_counters_statement():
+    return select(AnalyticsCounter.name, AnalyticsCounter.value)
+
+
+def analytics_from_counters(counters: Dict[str, int]) -> dict:
+    return {
+        "total_users": counters.get(USERS, 0),
+        "total_uploads": counters.get(UPLOADS, 0),
+        "total_analysis_results": counters.get(ANALYSIS_RESULTS, 0),
+        "uploads_by_status": {
+            name[len(STATUS_PREFIX):]: value
+            for name, value in counters.items()
+            if name.startswith(STATUS_PREFIX) and value
+        },
+    }
+
+
+def exact_counts(db) -> Dict[str, int]:
+    # The full scans the counters replace
+    counts = {
+        USERS: db.scalar(select(func.count()).select_from(User)),
+        UPLOADS: db.scalar(select(func.count()).select_from(Upload)),
+        ANALYSIS_RESULTS: db.scalar(select(func.count()).select_from(AnalysisResult)),
+    }
+    for status, count in db.execute(select(Upload.status, func.count(Upload.id)).group_by(Upload.status)):
+        counts[status_counter(status)] = count
+    return counts
+
+
+def reconcile_counters(db) -> Dict[str, int]:
+    # Recomputes every counter from the tables and overwrites the stored values.
+    # Returns the drift that was fixed (exact - stored) for every counter that was off. Commits.
+    if db.bind.dialect.name == "postgresql":
+        # Writers bump the counters in the same transaction as their change. Holding this lock
+        # makes them wait until the recount is stored, so no increment gets overwritten.
+        db.execute(text("LOCK TABLE analytics_counters IN EXCLUSIVE MODE"))
+
+    stored = dict(db.execute(read_counters_statement()).all())
+    exact = exact_counts(db)
+    # statuses that no longer exist go back to zero
+    exact.update({name: 0 for name in stored if name not in exact})
+
+    drift = {name: value - stored.get(name, 0) for name, value in exact.items() if value != stored.get(name, 0)}
+    if drift:
+        db.execute(bump_counters_statement(db.bind.dialect.name, drift))
+    db.commit()
+    return drift
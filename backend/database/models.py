@@ -1,4 +1,4 @@
-from sqlalchemy import JSON, Column, Integer, String, Text, DateTime, Float, ForeignKey, UniqueConstraint, func, Boolean
+from sqlalchemy import JSON, BigInteger, Column, Integer, String, Text, DateTime, Float, ForeignKey, UniqueConstraint, Index, func, Boolean
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
@@ -21,13 +21,26 @@ class Upload(Base):
     filename = Column(String(255), nullable=False)
     status = Column(String(50), default='pending', index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    n_topics = Column(Integer)
+    topic_sweep = Column(JSON)
+    stage_metrics = Column(JSON)
+    product_line = Column(String(100))
+    model_version = Column(String(255))
+    documents_key = Column(String(255))
+    # the SQS message analyzing the upload, and since when; a claim older than the lease is abandoned
+    claimed_by = Column(String(100))
+    claimed_at = Column(DateTime(timezone=True))
     
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     owner = relationship("User", back_populates="uploads")
     
     results = relationship("AnalysisResult", back_populates="upload", cascade="all, delete-orphan")
 
-    __table_args__ = (UniqueConstraint('user_id', 'filename', name='_user_filename_uc'),)
+    __table_args__ = (
+        UniqueConstraint('user_id', 'filename', name='_user_filename_uc'),
+        # keyset pagination of a user's uploads, newest first
+        Index('ix_uploads_user_created_id', 'user_id', 'created_at', 'id'),
+    )
 
 
 class AnalysisResult(Base):
@@ -39,6 +52,16 @@ class AnalysisResult(Base):
     sentiment_score = Column(Float)
     review_count = Column(Integer)
     sentiment_details = Column(JSON)
+    prompt_tokens = Column(Integer)
+    topic_id = Column(Integer)
     
     upload_id = Column(Integer, ForeignKey('uploads.id'), nullable=False)
-    upload = relationship("Upload", back_populates="results")
\ No newline at end of file
+    upload = relationship("Upload", back_populates="results")
+
+
+class AnalyticsCounter(Base):
+    # Platform totals kept up to date by the transactions that change them, see counters.py
+    __tablename__ = 'analytics_counters'
+
+    name = Column(String(100), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
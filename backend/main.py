@@ -3,7 +3,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
 from core.config import settings
-from database.session import engine
+from core.hashing import password_hasher
+from core.pagination import NEXT_CURSOR_HEADER
+from database.session import async_engine, upload_events
 from database.models import Base
 from api.v1 import uploads, auth, admin
 from core.logging_config import setup_logging
@@ -15,9 +17,15 @@ async def lifespan(app: FastAPI):
     # This function runs on application startup and shutdown
     setup_logging()
     logger.info("Application startup...")
-    Base.metadata.create_all(bind=engine)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
     logger.info("Database tables checked/created.")
+    await upload_events.start()
+    password_hasher.start()
     yield # The application runs while the server is active
+    password_hasher.stop()
+    await upload_events.stop()
+    await async_engine.dispose()
     logger.info("Application shutdown.")
 
 
@@ -29,6 +37,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 app.include_router(auth.router, prefix="/api/v1", tags=["auth"])
@@ -0,0 +1,23 @@
+# Recomputes the analytics counters from the tables and fixes any drift.
+# Run it once after deploying the counters table, then on a schedule (e.g. nightly).
+
+from database.session import SessionLocal, engine
+from database.models import Base
+from database.counters import reconcile_counters
+import logging
+from core.logging_config import setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        drift = reconcile_counters(db)
+        if drift:
+            logger.warning(f"Fixed drift in {len(drift)} analytics counters: {drift}")
+        else:
+            logger.info("Analytics counters are exact.")
+    finally:
+        db.close()
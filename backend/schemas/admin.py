@@ -16,4 +16,23 @@ class AnalyticsData(BaseModel):
     total_users: int
     total_uploads: int
     total_analysis_results: int
-    uploads_by_status: Dict[str, int]
\ No newline at end of file
+    uploads_by_status: Dict[str, int]
+
+class CacheStats(BaseModel):
+    size: int
+    maxsize: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    hit_rate: float
+    evictions: int
+    invalidations: int
+
+class StageStats(BaseModel):
+    jobs: int
+    wall_seconds_p50: float
+    wall_seconds_p95: float
+    cpu_seconds_p50: float
+    cpu_seconds_p95: float
+    peak_rss_mb_p50: float
+    peak_rss_mb_p95: float
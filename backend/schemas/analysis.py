@@ -11,6 +11,10 @@ class UploadInfo(BaseModel):
     class Config:
         from_attributes = True
 
+class UploadEvent(BaseModel):
+    upload_id: int
+
+
 class PresignedUrlResponse(BaseModel):
     url: str
     fields: Dict[str, Any]
@@ -18,6 +22,7 @@ class PresignedUrlResponse(BaseModel):
 
 class AnalysisResultBase(BaseModel):
     topic: str
+    topic_id: int | None = None
     summary: str | None = None
     sentiment_score: float | None = None
     review_count: int | None = None
@@ -26,11 +31,22 @@ class AnalysisResultBase(BaseModel):
         from_attributes = True
 
 
+class DocumentResult(BaseModel):
+    doc_id: int
+    topic_id: int
+    sentiment: float
+    topic_probability: float
+    text: str
+
+
 class UploadResponse(BaseModel):
     id: int
     filename: str
     status: str
     created_at: datetime
+    n_topics: int | None = None
+    product_line: str | None = None
+    model_version: str | None = None
     results: List[AnalysisResultBase] = []
 
     class Config:
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from "react";
 import { useParams, Link } from "react-router-dom";
 import api from "../services/api";
+import { subscribeToUploadEvents } from "../services/uploadEvents";
 
 const DetailSkeleton = () => (
     <div className="max-w-7xl mx-auto py-6 sm:px-6 lg:px-8 animate-pulse">
@@ -51,6 +52,26 @@ const DetailPage = () => {
         fetchDetails();
     }, [uploadId]);
 
+    // While the upload is being processed, reload it as soon as the worker finishes
+    const isProcessing = upload && upload.status !== "completed" && upload.status !== "failed";
+    useEffect(() => {
+        if (!isProcessing) return;
+        const refetch = async () => {
+            try {
+                const response = await api.get(`/api/v1/uploads/${uploadId}`);
+                setUpload(response.data);
+            } catch (err) {
+                console.error(err);
+            }
+        };
+        return subscribeToUploadEvents({
+            onReady: refetch,
+            onStatus: (event) => {
+                if (String(event.upload_id) === String(uploadId)) refetch();
+            },
+        });
+    }, [uploadId, isProcessing]);
+
     if (isLoading) return <DetailSkeleton />;
     if (error)
         return <div className="text-center p-10 text-red-500">{error}</div>;
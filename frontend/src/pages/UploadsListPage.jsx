@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useCallback } from "react";
 import api from "../services/api";
+import { subscribeToUploadEvents } from "../services/uploadEvents";
 import axios from "axios";
 import { useDropzone } from "react-dropzone";
 import { Link } from "react-router-dom";
@@ -13,6 +14,8 @@ import {
 
 const FileUpload = ({ onUploadSuccess }) => {
     const [isUploading, setIsUploading] = useState(false);
+    const [productLine, setProductLine] = useState("default");
+    const [incremental, setIncremental] = useState(false);
 
     const validateCsvHeader = (file) => {
         return new Promise((resolve, reject) => {
@@ -54,7 +57,15 @@ const FileUpload = ({ onUploadSuccess }) => {
 
             const uploadPromise = async () => {
                 const presignedUrlResponse = await api.post(
-                    `/api/v1/uploads/presigned-url?filename=${file.name}`
+                    "/api/v1/uploads/presigned-url",
+                    null,
+                    {
+                        params: {
+                            filename: file.name,
+                            product_line: productLine,
+                            mode: incremental ? "incremental" : "full",
+                        },
+                    }
                 );
                 const { url, fields } = presignedUrlResponse.data;
 
@@ -75,14 +86,14 @@ const FileUpload = ({ onUploadSuccess }) => {
                         err.response?.data?.detail ??
                         "Upload failed. Please try again.",
                 });
-                setTimeout(() => onUploadSuccess(), 1000);
+                onUploadSuccess();
             } catch (err) {
                 console.error(err);
             } finally {
                 setIsUploading(false);
             }
         },
-        [onUploadSuccess]
+        [onUploadSuccess, productLine, incremental]
     );
 
     const { getRootProps, getInputProps } = useDropzone({
@@ -97,6 +108,27 @@ const FileUpload = ({ onUploadSuccess }) => {
             <h2 className="text-lg font-medium text-gray-900 mb-4">
                 Upload New Feedback File
             </h2>
+            <div className="mb-4 flex flex-wrap items-center gap-4 text-sm text-gray-700">
+                <label className="flex items-center gap-2">
+                    Product line
+                    <input
+                        type="text"
+                        value={productLine}
+                        onChange={(e) => setProductLine(e.target.value)}
+                        disabled={isUploading}
+                        className="px-2 py-1 border border-gray-300 rounded"
+                    />
+                </label>
+                <label className="flex items-center gap-2">
+                    <input
+                        type="checkbox"
+                        checked={incremental}
+                        onChange={(e) => setIncremental(e.target.checked)}
+                        disabled={isUploading}
+                    />
+                    Reuse the topics of earlier uploads of this product line
+                </label>
+            </div>
             <div
                 {...getRootProps()}
                 className="p-8 border-2 border-dashed border-gray-300 rounded-lg cursor-pointer text-center hover:border-blue-500 transition-colors"
@@ -141,12 +173,15 @@ const FileUpload = ({ onUploadSuccess }) => {
 const UploadsListPage = () => {
     const [uploads, setUploads] = useState([]);
     const [isLoading, setIsLoading] = useState(true);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [isLoadingMore, setIsLoadingMore] = useState(false);
 
     const fetchUploads = useCallback(async () => {
         if (uploads.length === 0) setIsLoading(true);
         try {
             const response = await api.get("/api/v1/uploads/");
             setUploads(response.data);
+            setNextCursor(response.headers["x-next-cursor"] ?? null);
         } catch (error) {
             console.error("Failed to fetch uploads", error);
         } finally {
@@ -154,10 +189,63 @@ const UploadsListPage = () => {
         }
     }, [uploads.length]);
 
+    // Brings the newest uploads in without dropping the pages already loaded: the first page replaces
+    // the uploads it contains and the rest of the list stays as it is, so nextCursor still follows it
+    const refreshFirstPage = useCallback(async () => {
+        try {
+            const response = await api.get("/api/v1/uploads/");
+            const firstPage = response.data;
+            const refreshed = new Set(firstPage.map((upload) => upload.id));
+            setUploads((current) => [
+                ...firstPage,
+                ...current.filter((upload) => !refreshed.has(upload.id)),
+            ]);
+        } catch (error) {
+            console.error("Failed to refresh uploads", error);
+        }
+    }, []);
+
+    const loadMoreUploads = async () => {
+        setIsLoadingMore(true);
+        try {
+            const response = await api.get("/api/v1/uploads/", {
+                params: { cursor: nextCursor },
+            });
+            setUploads((current) => [...current, ...response.data]);
+            setNextCursor(response.headers["x-next-cursor"] ?? null);
+        } catch (error) {
+            console.error("Failed to fetch more uploads", error);
+        } finally {
+            setIsLoadingMore(false);
+        }
+    };
+
     useEffect(() => {
         fetchUploads();
     }, []);
 
+    // The worker's status changes are pushed over one long-lived connection instead of polling
+    useEffect(() => {
+        const unsubscribe = subscribeToUploadEvents({
+            onReady: () => refreshFirstPage(),
+            onStatus: (event) => {
+                if (event.status === "processing") {
+                    // the worker created a new upload, it goes on top of the list
+                    refreshFirstPage();
+                    return;
+                }
+                setUploads((current) =>
+                    current.map((upload) =>
+                        upload.id === event.upload_id
+                            ? { ...upload, status: event.status }
+                            : upload
+                    )
+                );
+            },
+        });
+        return unsubscribe;
+    }, []);
+
     const SkeletonRow = () => (
         <li className="px-4 py-4 sm:px-6">
             <div className="animate-pulse flex space-x-4">
@@ -172,7 +260,7 @@ const UploadsListPage = () => {
 
     return (
         <div className="max-w-7xl mx-auto py-6 sm:px-6 lg:px-8">
-            <FileUpload onUploadSuccess={fetchUploads} />
+            <FileUpload onUploadSuccess={refreshFirstPage} />
             <div className="bg-white shadow overflow-hidden sm:rounded-md">
                 <div className="px-4 py-3 sm:px-6 border-b border-gray-200">
                     <h2 className="text-lg leading-6 font-medium text-gray-900">
@@ -228,6 +316,17 @@ const UploadsListPage = () => {
                         ))
                     )}
                 </ul>
+                {nextCursor && (
+                    <div className="px-4 py-3 border-t border-gray-200 text-center">
+                        <button
+                            onClick={loadMoreUploads}
+                            disabled={isLoadingMore}
+                            className="text-sm font-medium text-indigo-600 hover:text-indigo-800 disabled:text-gray-400"
+                        >
+                            {isLoadingMore ? "Loading..." : "Load more"}
+                        </button>
+                    </div>
+                )}
                 {isLoading && uploads.length === 0 && (
                     <p className="text-center p-4 text-gray-500">
                         Loading uploads...
@@ -135,12 +135,15 @@ const UserManagementPage = () => {
     const [loading, setLoading] = useState(true);
     const [editingUser, setEditingUser] = useState(null);
     const [isCreateModalOpen, setCreateModalOpen] = useState(false);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     const fetchUsers = useCallback(async () => {
         try {
             setLoading(true);
             const response = await api.get("/api/v1/admin/users");
             setUsers(response.data);
+            setNextCursor(response.headers["x-next-cursor"] ?? null);
         } catch (error) {
             console.error("Failed to fetch users", error);
         } finally {
@@ -148,6 +151,21 @@ const UserManagementPage = () => {
         }
     }, []);
 
+    const loadMoreUsers = async () => {
+        try {
+            setLoadingMore(true);
+            const response = await api.get("/api/v1/admin/users", {
+                params: { cursor: nextCursor },
+            });
+            setUsers((current) => [...current, ...response.data]);
+            setNextCursor(response.headers["x-next-cursor"] ?? null);
+        } catch (error) {
+            console.error("Failed to fetch more users", error);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     useEffect(() => {
         fetchUsers();
     }, [fetchUsers]);
@@ -293,6 +311,17 @@ const UserManagementPage = () => {
                             ))
                         )}
                     </ul>
+                    {!loading && nextCursor && (
+                        <div className="px-4 py-3 border-t border-gray-200 text-center">
+                            <button
+                                onClick={loadMoreUsers}
+                                disabled={loadingMore}
+                                className="text-sm font-medium text-indigo-600 hover:text-indigo-800 disabled:text-gray-400"
+                            >
+                                {loadingMore ? "Loading..." : "Load more"}
+                            </button>
+                        </div>
+                    )}
                 </div>
             </div>
             {(isCreateModalOpen || editingUser) && (
@@ -0,0 +1,21 @@
+const API_URL = import.meta.env.VITE_API_BASE_URL;
+
+// Opens one server-sent events connection for the current user's upload status changes.
+// onReady runs on every (re)connect, so callers can refetch what they missed meanwhile.
+// Returns a function that closes the connection.
+export const subscribeToUploadEvents = ({ onStatus, onReady }) => {
+    const source = new EventSource(`${API_URL}/api/v1/uploads/events`, {
+        withCredentials: true,
+    });
+
+    source.addEventListener("ready", () => onReady?.());
+    source.addEventListener("status", (message) => {
+        try {
+            onStatus?.(JSON.parse(message.data));
+        } catch (error) {
+            console.error("Malformed upload event", error);
+        }
+    });
+
+    return () => source.close();
+};
@@ -0,0 +1,61 @@
+# Checks that clean_series matches clean_text exactly and compares their throughput.
+#
+# Usage: python benchmarks/bench_clean.py --rows 200000 --chunk-rows 50000
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENROUTER_API_KEY", "stub")
+
+import pandas as pd
+
+from worker import clean_text, clean_series
+from corpus import make_reviews
+
+
+def check_equivalence():
+    # Every codepoint, plus the edge cases clean_text has to handle
+    codepoints = "".join(chr(i) for i in range(0x110000) if not 0xD800 <= i < 0xE000)
+    texts = [codepoints[i:i + 40] for i in range(0, len(codepoints), 40)]
+    texts += [None, float("nan"), "", "   ", "ΟΔΟΣ Σ", "İstanbul", "Don't  stop!\n\tNow\x1c", "café “quoted”"]
+    texts += ["".join(chr(i) for i in range(128)) * 2]
+    series = pd.Series(texts, dtype=object)
+
+    expected = [clean_text(text) for text in texts]
+    actual = clean_series(series).tolist()
+    mismatches = [i for i, (a, b) in enumerate(zip(expected, actual)) if a.encode() != b.encode()]
+    assert not mismatches, f"clean_series differs from clean_text at rows {mismatches[:10]}"
+    return len(texts)
+
+
+def rows_per_second(clean, chunks) -> float:
+    start = time.perf_counter()
+    for chunk in chunks:
+        clean(chunk)
+    return sum(len(chunk) for chunk in chunks) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--chunk-rows", type=int, default=50_000)
+    args = parser.parse_args()
+
+    checked = check_equivalence()
+
+    reviews = pd.Series(make_reviews(args.rows, duplicate_rate=0.2), dtype=object)
+    chunks = [reviews.iloc[i:i + args.chunk_rows] for i in range(0, len(reviews), args.chunk_rows)]
+    per_row = rows_per_second(lambda chunk: chunk.apply(clean_text), chunks)
+    vectorized = rows_per_second(clean_series, chunks)
+
+    print(json.dumps({
+        "equivalence_rows_checked": checked,
+        "rows": args.rows,
+        "per_row_rows_per_sec": round(per_row),
+        "vectorized_rows_per_sec": round(vectorized),
+        "speedup": round(vectorized / per_row, 2),
+    }, indent=2))
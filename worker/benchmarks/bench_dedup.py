@@ -0,0 +1,147 @@
+# Compares process_feedback_file with and without near-duplicate collapsing on a corpus full of
+# copied and lightly edited reviews. Both runs use the same seeded file and a stub LLM without latency,
+# and each runs in a fresh interpreter. Reports the time and peak RSS of every stage, and the topics
+# side by side so the effect on the results can be checked (review counts must add up to the same total).
+# First checks that collapsing doesn't change the pruned vocabulary, on exact copies and on a templated
+# export made of only a few distinct reviews.
+#
+# Usage: python benchmarks/bench_dedup.py --rows 100000 --duplicate-rate 0.4 --near-duplicate-rate 0.3
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+WORKER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, WORKER_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(filepath: str) -> dict:
+    import summarizer
+    import worker
+    from instrumentation import StageMetrics, span
+    from stubs import StubLLMClient
+
+    summarizer.client = StubLLMClient(0)
+    metrics = StageMetrics()
+    with span("total", metrics):
+        results = worker.process_feedback_file(filepath, metrics=metrics)
+    if results is None:
+        raise RuntimeError("the pipeline failed, see the worker logs")
+
+    return {
+        "stages": {stage: entry["wall_seconds"] for stage, entry in metrics.as_dict().items() if stage != "llm_call"},
+        "peak_rss_mb": metrics.as_dict()["total"]["peak_rss_mb"],
+        "topics": [
+            {"top_words": r["top_words"], "review_count": r["review_count"], "avg_sentiment": round(float(r["avg_sentiment"]), 4)}
+            for r in results
+        ],
+    }
+
+
+def check_vocabulary_equivalence(seed: int):
+    # min_df/max_df must see the copies a representative stands for, so the vocabulary is the one
+    # of the uncollapsed reviews, in both vectorizer modes. Returns the vocabulary size of each case.
+    import numpy as np
+    import pandas as pd
+    from corpus import make_reviews
+    from dedup import collapse_duplicates
+    from vectorizers import MAX_DF, MIN_DF, HashedCountVectorizer, fit_counts
+    from sklearn.feature_extraction.text import CountVectorizer
+    from worker import clean_series
+
+    def vocabulary(vectorizer) -> list:
+        return list(vectorizer.columns_ if isinstance(vectorizer, HashedCountVectorizer) else vectorizer.get_feature_names_out())
+
+    sizes = {}
+    cases = {
+        "templated": make_reviews(3000, seed, distinct_reviews=6),
+        "copies": make_reviews(20_000, seed, duplicate_rate=0.5, vocabulary_size=500),
+    }
+    modes = {
+        "count": lambda: CountVectorizer(max_df=MAX_DF, min_df=MIN_DF, stop_words="english"),
+        "hashing": HashedCountVectorizer,
+    }
+    for name, reviews in cases.items():
+        texts = clean_series(pd.Series(reviews, dtype=object))
+        groups, representatives = collapse_duplicates(texts)
+        for mode, make_vectorizer in modes.items():
+            expected = make_vectorizer()
+            expected.fit(texts)
+            collapsed = make_vectorizer()
+            fit_counts(collapsed, texts.iloc[representatives], np.bincount(groups))
+            assert vocabulary(collapsed) == vocabulary(expected), f"collapsing changed the {mode} vocabulary of the {name} corpus"
+            sizes[f"{name}_{mode}"] = len(vocabulary(collapsed))
+    return sizes
+
+
+def run_isolated(filepath: str, args, dedup: bool) -> dict:
+    env = dict(
+        os.environ, OPENROUTER_API_KEY="stub", SUMMARY_CACHE_PERSIST="false",
+        N_TOPICS=str(args.n_topics), DEDUP_ENABLED=str(dedup).lower(), DEDUP_THRESHOLD=str(args.threshold),
+    )
+    output = subprocess.run(
+        [sys.executable, __file__, "--measure", filepath], check=True, capture_output=True, text=True, env=env,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--duplicate-rate", type=float, default=0.4)
+    parser.add_argument("--near-duplicate-rate", type=float, default=0.3)
+    parser.add_argument("--vocabulary-size", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--n-topics", type=int, default=7)
+    parser.add_argument("--measure", metavar="FILE", help=argparse.SUPPRESS)
+    parser.add_argument("--check-vocabulary", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure or args.check_vocabulary:
+        # Silence the worker's JSON logs so only the measurement reaches stdout
+        import logging
+        logging.disable(logging.CRITICAL)
+        print(json.dumps(check_vocabulary_equivalence(args.seed) if args.check_vocabulary else measure(args.measure)))
+        sys.exit(0)
+
+    from corpus import write_synthetic_csv
+
+    output = subprocess.run(
+        [sys.executable, __file__, "--check-vocabulary", "--seed", str(args.seed)], check=True, capture_output=True, text=True,
+        env=dict(os.environ, OPENROUTER_API_KEY="stub"),
+    ).stdout
+    vocabulary_sizes = json.loads(output.strip().splitlines()[-1])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # a templated export has to be analyzed with and without collapsing alike
+        templated = write_synthetic_csv(os.path.join(tmp, "templated.csv"), 3000, seed=args.seed, distinct_reviews=6)
+        for dedup in (False, True):
+            topics = run_isolated(templated, args, dedup=dedup)["topics"]
+            assert sum(topic["review_count"] for topic in topics) == 3000, "the templated export lost reviews"
+
+        filepath = write_synthetic_csv(
+            os.path.join(tmp, "reviews.csv"), args.rows, seed=args.seed, duplicate_rate=args.duplicate_rate,
+            vocabulary_size=args.vocabulary_size, near_duplicate_rate=args.near_duplicate_rate,
+        )
+        without = run_isolated(filepath, args, dedup=False)
+        collapsed = run_isolated(filepath, args, dedup=True)
+
+    total_without = sum(topic["review_count"] for topic in without["topics"])
+    total_collapsed = sum(topic["review_count"] for topic in collapsed["topics"])
+    assert total_without == total_collapsed, "collapsing must not change the number of reviews counted"
+
+    print(json.dumps({
+        "rows": args.rows,
+        "duplicate_rate": args.duplicate_rate,
+        "near_duplicate_rate": args.near_duplicate_rate,
+        "threshold": args.threshold,
+        "vocabulary_sizes": vocabulary_sizes,
+        "speedup": round(without["stages"]["total"] / collapsed["stages"]["total"], 2),
+        "without_dedup": without,
+        "with_dedup": collapsed,
+    }, indent=2))
@@ -0,0 +1,89 @@
+# Compares the old full-file read + clean with the streaming ingestion layer.
+# Every measurement runs in a fresh interpreter so peak RSS is not shared between runs.
+# The file has a few rows with too many and too few fields, both reads must keep the same reviews.
+#
+# Usage: python benchmarks/bench_ingest.py --rows 10000 100000 1000000
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+WORKER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, WORKER_DIR)
+
+
+def legacy_read(filepath: str) -> int:
+    import pandas as pd
+    from worker import clean_text
+
+    df = pd.read_csv(filepath, engine='python', on_bad_lines='skip')
+    df['cleaned_feedback'] = df['Review Text'].apply(clean_text)
+    return int((df['cleaned_feedback'] != '').sum())
+
+
+def streaming_read(filepath: str) -> int:
+    from ingest import read_cleaned_reviews
+    from worker import clean_text
+
+    return len(read_cleaned_reviews(filepath, lambda chunk: chunk.apply(clean_text)))
+
+
+def measure(mode: str, filepath: str) -> dict:
+    # Import up front so module loading is not part of the measurement
+    import ingest, worker
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    rows = legacy_read(filepath) if mode == "legacy" else streaming_read(filepath)
+    seconds = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in kilobytes on linux
+    return {"mode": mode, "rows": rows, "seconds": round(seconds, 3), "peak_rss_mb": round(peak_rss / 1024, 1),
+            "after_import_rss_mb": round(baseline_rss / 1024, 1)}
+
+
+def run_isolated(mode: str, filepath: str) -> dict:
+    env = dict(os.environ, OPENROUTER_API_KEY="stub", SUMMARY_CACHE_PERSIST="false")
+    output = subprocess.run(
+        [sys.executable, __file__, "--measure", mode, filepath],
+        check=True, capture_output=True, text=True, env=env,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--bad-line-rate", type=float, default=0.001)
+    parser.add_argument("--short-row-rate", type=float, default=0.001)
+    parser.add_argument("--measure", nargs=2, metavar=("MODE", "FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        # Silence the worker's JSON logs so only the measurement reaches stdout
+        import logging
+        logging.disable(logging.CRITICAL)
+        print(json.dumps(measure(*args.measure)))
+        sys.exit(0)
+
+    from corpus import write_synthetic_csv
+
+    report = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in args.rows:
+            filepath = write_synthetic_csv(
+                os.path.join(tmp, f"reviews_{n_rows}.csv"), n_rows,
+                bad_line_rate=args.bad_line_rate, short_row_rate=args.short_row_rate,
+            )
+            entry = {"rows": n_rows, "file_mb": round(os.path.getsize(filepath) / 1024 / 1024, 1)}
+            for mode in ("legacy", "streaming"):
+                entry[mode] = run_isolated(mode, filepath)
+            assert entry["legacy"]["rows"] == entry["streaming"]["rows"], "streaming ingestion kept different reviews"
+            report.append(entry)
+            print(json.dumps(entry), file=sys.stderr)
+
+    print(json.dumps(report, indent=2))
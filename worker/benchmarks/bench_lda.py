@@ -0,0 +1,51 @@
+# Compares batch and online LDA on the same count matrix: wall time and held-out perplexity.
+#
+# Usage: python benchmarks/bench_lda.py --rows 20000 200000
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sklearn.decomposition import LatentDirichletAllocation
+from sklearn.feature_extraction.text import CountVectorizer
+
+import topics
+from corpus import make_reviews
+
+
+def run(n_rows: int, n_topics: int) -> dict:
+    reviews = [review.lower() for review in make_reviews(n_rows, duplicate_rate=0.1)]
+    text_counts = CountVectorizer(max_df=0.9, min_df=5, stop_words='english').fit_transform(reviews)
+
+    rng = np.random.RandomState(0)
+    held_out = np.zeros(n_rows, dtype=bool)
+    held_out[rng.choice(n_rows, size=max(1, n_rows // 10), replace=False)] = True
+    train, test = text_counts[~held_out], text_counts[held_out]
+
+    start = time.perf_counter()
+    batch = LatentDirichletAllocation(n_components=n_topics, random_state=42).fit(train)
+    batch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    online = topics.fit_online_lda(train, n_topics)
+    online_seconds = time.perf_counter() - start
+
+    return {
+        "rows": n_rows,
+        "batch": {"seconds": round(batch_seconds, 2), "held_out_perplexity": round(batch.perplexity(test), 1)},
+        "online": {"seconds": round(online_seconds, 2), "held_out_perplexity": round(online.perplexity(test), 1)},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[20_000, 200_000])
+    parser.add_argument("--topics", type=int, default=7)
+    args = parser.parse_args()
+
+    print(json.dumps([run(n_rows, args.topics) for n_rows in args.rows], indent=2))
@@ -0,0 +1,163 @@
+# End-to-end benchmark of process_feedback_file on seeded synthetic corpora, timing every stage:
+# read, clean, dedup, vectorize, topic selection, LDA, sentiment, fetching the reviews for the summaries,
+# summarize (against a stub LLM with a fixed latency) and persist (into a scratch sqlite database).
+# Every size runs in a fresh interpreter so caches and peak RSS are not shared between runs.
+# The report is JSON on stdout, meant to be kept per release and compared.
+#
+# Usage: python benchmarks/bench_pipeline.py --rows 10000 100000 1000000 --output pipeline.json
+#        python benchmarks/bench_pipeline.py --rows 10000 --duplicate-rate 0.3 --bad-line-rate 0.01 --llm-latency 0.5
+#        python benchmarks/bench_pipeline.py --rows 100000 --vectorizer hashing
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+WORKER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, WORKER_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+STAGES = ["read", "clean", "dedup", "vectorize", "select_topics", "lda", "sentiment", "fetch_reviews", "summarize", "persist"]
+
+
+def instrument(timings: dict):
+    # Wraps the functions process_feedback_file calls so every stage is timed without changing the pipeline
+    import worker
+
+    def timed(stage, fn):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings[stage] += time.perf_counter() - start
+        return wrapper
+
+    # cleaning runs inside the read, chunk by chunk, its time is taken out of the read below
+    worker.clean_series = timed("clean", worker.clean_series)
+    worker.read_cleaned_reviews = timed("read", worker.read_cleaned_reviews)
+    worker.collapse_duplicates = timed("dedup", worker.collapse_duplicates)
+    worker.select_n_topics = timed("select_topics", worker.select_n_topics)
+    worker.fit_topic_model = timed("lda", worker.fit_topic_model)
+    worker.compound_scores = timed("sentiment", worker.compound_scores)
+    worker.fetch_reviews = timed("fetch_reviews", worker.fetch_reviews)
+    worker.summarize_topics = timed("summarize", worker.summarize_topics)
+    # fitting whichever vectorizer make_vectorizer returned (VECTORIZER), pruning included
+    worker.fit_counts = timed("vectorize", worker.fit_counts)
+
+
+def measure(filepath: str, llm_latency: float) -> dict:
+    import lambda_function
+    import summarizer
+    import worker
+    from models import Upload
+    from stubs import StubLLMClient
+
+    summarizer.client = StubLLMClient(llm_latency)
+    lambda_function.ensure_schema()
+    timings = defaultdict(float)
+    instrument(timings)
+
+    start = time.perf_counter()
+    results = worker.process_feedback_file(filepath)
+    if results is None:
+        raise RuntimeError("the pipeline failed, see the worker logs")
+    analysis_seconds = time.perf_counter() - start
+
+    db = lambda_function.SessionLocal()
+    try:
+        upload = Upload(filename=os.path.basename(filepath), status='processing', user_id=1)
+        db.add(upload)
+        db.commit()
+        start = time.perf_counter()
+        lambda_function.save_results_to_db(results, upload.id, db)
+        upload.status = 'completed'
+        db.commit()
+        timings["persist"] = time.perf_counter() - start
+    finally:
+        db.close()
+
+    timings["read"] -= timings["clean"]
+    stages = {stage: round(timings[stage], 4) for stage in STAGES}
+    return {
+        "stages": stages,
+        "total_seconds": round(analysis_seconds + timings["persist"], 4),
+        # topic loop, aggregation and everything else that isn't one of the stages
+        "other_seconds": round(analysis_seconds - sum(v for k, v in timings.items() if k != "persist"), 4),
+        "topics": len(results),
+        "llm_calls": summarizer.client.calls,
+        # ru_maxrss is reported in kilobytes on linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_isolated(filepath: str, args, db_path: str) -> dict:
+    env = dict(
+        os.environ, OPENROUTER_API_KEY="stub", SUMMARY_CACHE_PERSIST="false",
+        DATABASE_URL=f"sqlite:///{db_path}", VECTORIZER=args.vectorizer,
+    )
+    if args.n_topics:
+        env["N_TOPICS"] = str(args.n_topics)
+    output = subprocess.run(
+        [sys.executable, __file__, "--measure", filepath, "--llm-latency", str(args.llm_latency)],
+        check=True, capture_output=True, text=True, env=env,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--duplicate-rate", type=float, default=0.1)
+    parser.add_argument("--vocabulary-size", type=int, default=2000)
+    parser.add_argument("--bad-line-rate", type=float, default=0.001)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="seconds per stub LLM call")
+    parser.add_argument("--n-topics", type=int, default=7, help="pins the topic count, 0 runs the sweep")
+    parser.add_argument("--vectorizer", choices=["count", "hashing"], default="count")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--measure", metavar="FILE", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        # Silence the worker's JSON logs so only the measurement reaches stdout
+        import logging
+        logging.disable(logging.CRITICAL)
+        print(json.dumps(measure(args.measure, args.llm_latency)))
+        sys.exit(0)
+
+    from corpus import write_synthetic_csv
+
+    report = {
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "corpus": {
+            "seed": args.seed, "duplicate_rate": args.duplicate_rate,
+            "vocabulary_size": args.vocabulary_size, "bad_line_rate": args.bad_line_rate,
+        },
+        "llm_latency": args.llm_latency,
+        "n_topics": args.n_topics or "sweep",
+        "vectorizer": args.vectorizer,
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in args.rows:
+            filepath = write_synthetic_csv(
+                os.path.join(tmp, f"reviews_{n_rows}.csv"), n_rows, seed=args.seed, duplicate_rate=args.duplicate_rate,
+                vocabulary_size=args.vocabulary_size, bad_line_rate=args.bad_line_rate,
+            )
+            entry = {"rows": n_rows, "file_mb": round(os.path.getsize(filepath) / 1024 / 1024, 1)}
+            entry.update(run_isolated(filepath, args, os.path.join(tmp, f"results_{n_rows}.db")))
+            report["runs"].append(entry)
+            print(json.dumps(entry), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,46 @@
+# Times compound scoring at different worker counts on a corpus with duplicates.
+#
+# Usage: python benchmarks/bench_sentiment.py --rows 200000 --duplicate-rate 0.3 --workers 1 2 4
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import sentiment
+from corpus import make_reviews
+
+
+def run(n_rows: int, duplicate_rate: float, worker_counts: list) -> list:
+    texts = pd.Series([review.lower() for review in make_reviews(n_rows, duplicate_rate=duplicate_rate)])
+
+    start = time.perf_counter()
+    reference = texts.apply(lambda t: sentiment.get_analyzer().polarity_scores(t)['compound']).to_numpy()
+    report = [{"mode": "per_row_apply", "seconds": round(time.perf_counter() - start, 3)}]
+
+    for workers in worker_counts:
+        sentiment.SENTIMENT_WORKERS = workers
+        sentiment.SENTIMENT_PARALLEL_THRESHOLD = 0
+        sentiment._memo.clear()
+        start = time.perf_counter()
+        scores = sentiment.compound_scores(texts)
+        report.append({"mode": "deduplicated", "workers": workers, "seconds": round(time.perf_counter() - start, 3)})
+        assert (scores == reference).all(), "scores must match per-row scoring"
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.3)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    runs = run(args.rows, args.duplicate_rate, args.workers)
+    print(json.dumps({"rows": args.rows, "duplicate_rate": args.duplicate_rate, "runs": runs}, indent=2))
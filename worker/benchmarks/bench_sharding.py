@@ -0,0 +1,109 @@
+# Compares the sharded analysis (sharding.analyze_sharded) with process_feedback_file on the same seeded
+# file, put in a local file store so no AWS is needed. Each run gets a fresh interpreter and a stub LLM
+# without latency. Reports the time and coordinator peak RSS of every stage, and the topics side by side
+# (review counts must add up to the same total). Some reviews span lines so shard boundaries are exercised.
+#
+# Usage: python benchmarks/bench_sharding.py --rows 200000 --shard-mb 8 --workers 4 --backend process
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+WORKER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, WORKER_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BUCKET = "uploads"
+KEY = "1/reviews.csv"
+
+
+def measure(store_root: str, sharded: bool) -> dict:
+    import summarizer
+    import sharding
+    import worker
+    from instrumentation import StageMetrics, span
+    from stubs import StubLLMClient
+
+    summarizer.client = StubLLMClient(0)
+    metrics = StageMetrics()
+    metadata = {}
+    with span("total", metrics):
+        if sharded:
+            results = sharding.analyze_sharded(BUCKET, KEY, metadata, metrics)
+        else:
+            results = worker.process_feedback_file(os.path.join(store_root, BUCKET, KEY), metadata, metrics)
+    if results is None:
+        raise RuntimeError("the pipeline failed, see the worker logs")
+
+    return {
+        "shards": metadata.get("shards"),
+        "stages": {stage: entry["wall_seconds"] for stage, entry in metrics.as_dict().items() if stage != "llm_call"},
+        "peak_rss_mb": metrics.as_dict()["total"]["peak_rss_mb"],
+        "topics": [
+            {"top_words": r["top_words"], "review_count": r["review_count"], "avg_sentiment": round(float(r["avg_sentiment"]), 4)}
+            for r in results
+        ],
+    }
+
+
+def run_isolated(store_root: str, args, sharded: bool) -> dict:
+    env = dict(
+        os.environ, OPENROUTER_API_KEY="stub", SUMMARY_CACHE_PERSIST="false",
+        N_TOPICS=str(args.n_topics), WORKER_FILE_STORE=f"local:{store_root}", SHARD_BUCKET="shards",
+        SHARD_SIZE_MB=str(args.shard_mb), SHARD_WORKERS=str(args.workers), SHARD_BACKEND=args.backend,
+        SHARD_QUEUE_DIR=os.path.join(store_root, "queue"),
+    )
+    command = [sys.executable, __file__, "--measure", store_root] + (["--sharded"] if sharded else [])
+    output = subprocess.run(command, check=True, capture_output=True, text=True, env=env).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--duplicate-rate", type=float, default=0.1)
+    parser.add_argument("--vocabulary-size", type=int, default=2000)
+    parser.add_argument("--multiline-rate", type=float, default=0.05)
+    parser.add_argument("--shard-mb", type=float, default=8)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--backend", choices=["process", "queue"], default="process")
+    parser.add_argument("--n-topics", type=int, default=7)
+    parser.add_argument("--measure", metavar="STORE_ROOT", help=argparse.SUPPRESS)
+    parser.add_argument("--sharded", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        # Silence the worker's JSON logs so only the measurement reaches stdout
+        import logging
+        logging.disable(logging.CRITICAL)
+        print(json.dumps(measure(args.measure, args.sharded)))
+        sys.exit(0)
+
+    from corpus import write_synthetic_csv
+
+    with tempfile.TemporaryDirectory() as store_root:
+        os.makedirs(os.path.dirname(os.path.join(store_root, BUCKET, KEY)))
+        write_synthetic_csv(
+            os.path.join(store_root, BUCKET, KEY), args.rows, seed=args.seed, duplicate_rate=args.duplicate_rate,
+            vocabulary_size=args.vocabulary_size, multiline_rate=args.multiline_rate,
+        )
+        single = run_isolated(store_root, args, sharded=False)
+        sharded = run_isolated(store_root, args, sharded=True)
+
+    total_single = sum(topic["review_count"] for topic in single["topics"])
+    total_sharded = sum(topic["review_count"] for topic in sharded["topics"])
+    assert total_single == total_sharded, "sharding must not change the number of reviews counted"
+
+    print(json.dumps({
+        "rows": args.rows,
+        "shard_mb": args.shard_mb,
+        "workers": args.workers,
+        "backend": args.backend,
+        "speedup": round(single["stages"]["total"] / sharded["stages"]["total"], 2),
+        "single": single,
+        "sharded": sharded,
+    }, indent=2))
@@ -0,0 +1,111 @@
+# Measures worker cold start in fresh interpreters: importing the handler module, the first invocation
+# and a second, warm one. Both invocations analyze a small upload end to end, against sqlite and a local
+# file store with a stub LLM, so the first one pays for creating the schema and importing the analysis
+# pipeline, and the difference between the two is what a cold container adds to an upload.
+#
+# Usage: python benchmarks/bench_startup.py --runs 5 --max-import-seconds 1.0
+
+import argparse
+import csv
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+WORKER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS_DIR = os.path.join(WORKER_DIR, "benchmarks")
+BUCKET = "uploads"
+UPLOAD_ROWS = 300
+
+PROBE = """
+import importlib.abc, importlib.util, json, sys, time
+
+
+class StubLLM(importlib.abc.MetaPathFinder):
+    # Puts the stub client into summarizer as the pipeline imports it, so no call leaves the machine
+    def find_spec(self, name, path, target=None):
+        if name != "summarizer": return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(name)
+        exec_module = spec.loader.exec_module
+        def exec_with_stub(module):
+            exec_module(module)
+            from stubs import StubLLMClient
+            module.client = StubLLMClient(0)
+        spec.loader.exec_module = exec_with_stub
+        return spec
+
+
+sys.meta_path.insert(0, StubLLM())
+from events import s3_sqs_record, sqs_event
+
+def invoke(message_id, key):
+    response = lambda_function.lambda_handler(sqs_event([s3_sqs_record(message_id, BUCKET, key)]), None)
+    assert response == {"batchItemFailures": []}, response
+
+start = time.perf_counter()
+import lambda_function
+imported = time.perf_counter()
+invoke("1", "1/cold.csv")
+invoked = time.perf_counter()
+invoke("2", "1/warm.csv")
+warm = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - start,
+    "first_invocation_seconds": invoked - imported,
+    "warm_invocation_seconds": warm - invoked,
+}))
+"""
+
+
+def write_upload(path: str):
+    # the first rows of the sample file, enough for a topic model
+    with open(os.path.join(WORKER_DIR, "sample.csv"), newline="", encoding="utf-8") as source, \
+            open(path, "w", newline="", encoding="utf-8") as destination:
+        writer = csv.writer(destination)
+        for i, row in enumerate(csv.reader(source)):
+            if i > UPLOAD_ROWS: break
+            writer.writerow(row)
+
+
+def probe() -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, "store", BUCKET, "1"))
+        for name in ("cold.csv", "warm.csv"):
+            write_upload(os.path.join(tmp, "store", BUCKET, "1", name))
+        env = dict(
+            os.environ,
+            PYTHONPATH=BENCHMARKS_DIR,
+            OPENROUTER_API_KEY="stub",
+            DATABASE_URL=f"sqlite:///{tmp}/worker.db",
+            WORKER_FILE_STORE=f"local:{tmp}/store",
+            N_TOPICS="3",
+            SUMMARY_CACHE_PERSIST="false",
+            DOCUMENTS_BUCKET="",
+            MODEL_STORE_BUCKET="",
+            SHARD_THRESHOLD_MB="0",
+            UPLOAD_EVENTS_URL="",
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", f"BUCKET = {BUCKET!r}\n{PROBE}"], cwd=WORKER_DIR, env=env, check=True,
+            capture_output=True, text=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-seconds", type=float, default=None,
+                        help="exit with an error when the median handler import is slower than this")
+    args = parser.parse_args()
+
+    samples = [probe() for _ in range(args.runs)]
+    report = {key: round(statistics.median(s[key] for s in samples), 4) for key in samples[0]}
+    report["runs"] = args.runs
+    print(json.dumps(report, indent=2))
+
+    if args.max_import_seconds is not None and report["import_seconds"] > args.max_import_seconds:
+        sys.exit(f"handler import took {report['import_seconds']}s, limit is {args.max_import_seconds}s")
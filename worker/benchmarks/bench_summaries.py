@@ -0,0 +1,53 @@
+# Compares sequential and concurrent topic summarization against a stubbed LLM client.
+#
+# Usage: python benchmarks/bench_summaries.py --topics 7 --latency 1.5 --concurrency 4
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENROUTER_API_KEY", "stub")
+os.environ.setdefault("SUMMARY_CACHE_PERSIST", "false")
+
+import summarizer
+from summary_cache import SummaryCache
+from stubs import StubLLMClient
+
+
+def run(n_topics: int, latency: float, concurrency: int) -> dict:
+    jobs = [([f"review {i} for topic {t}" for i in range(10)], f"topic {t} words") for t in range(n_topics)]
+    summarizer.client = StubLLMClient(latency=latency)
+    # Both runs must pay for every call, so the summary cache is switched off
+    summarizer.summary_cache = SummaryCache(max_size=0, persist=False)
+
+    start = time.perf_counter()
+    sequential = [summarizer.get_ai_summary(*job) for job in jobs]
+    sequential_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    concurrent = summarizer.summarize_topics(jobs, max_workers=concurrency)
+    concurrent_seconds = time.perf_counter() - start
+
+    assert concurrent == sequential, "concurrent summaries must keep topic order"
+
+    return {
+        "topics": n_topics,
+        "latency_seconds": latency,
+        "concurrency": concurrency,
+        "sequential_seconds": round(sequential_seconds, 3),
+        "concurrent_seconds": round(concurrent_seconds, 3),
+        "speedup": round(sequential_seconds / concurrent_seconds, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--topics", type=int, default=7)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=summarizer.SUMMARY_CONCURRENCY)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.topics, args.latency, args.concurrency), indent=2))
@@ -0,0 +1,76 @@
+# Peak memory of the vectorize step, CountVectorizer against the hashing mode (VECTORIZER=hashing), on the
+# same seeded corpus. Each mode runs in a fresh interpreter so the RSS high-water mark is its own.
+# Reports the tracemalloc peak during fit_transform, the process peak RSS, the size of the resulting
+# matrix and the time of an untraced run.
+#
+# Usage: python benchmarks/bench_vectorize.py --rows 100000 1000000 --vocabulary-size 50000
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(mode: str, n_rows: int, args) -> dict:
+    import vectorizers
+    from corpus import make_reviews
+
+    texts = [text.lower() for text in make_reviews(n_rows, args.seed, vocabulary_size=args.vocabulary_size)]
+    vectorizers.VECTORIZER = mode
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    tracemalloc.start()
+    counts = vectorizers.make_vectorizer().fit_transform(texts)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    # tracing slows every allocation down, the time comes from a second, untraced run
+    del counts
+    start = time.perf_counter()
+    counts = vectorizers.make_vectorizer().fit_transform(texts)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "rows": n_rows,
+        "columns": counts.shape[1],
+        "dtype": str(counts.dtype),
+        "seconds": round(elapsed, 2),
+        "traced_peak_mb": round(traced_peak / 1024 / 1024, 1),
+        # ru_maxrss is in KB on Linux
+        "rss_before_mb": round(rss_before, 1),
+        "peak_rss_mb": round(peak_rss, 1),
+        "matrix_mb": round((counts.data.nbytes + counts.indices.nbytes + counts.indptr.nbytes) / 1024 / 1024, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--vocabulary-size", type=int, default=50_000)
+    parser.add_argument("--measure", nargs=2, metavar=("MODE", "ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure[0], int(args.measure[1]), args)))
+        sys.exit(0)
+
+    report = []
+    for n_rows in args.rows:
+        for mode in ("count", "hashing"):
+            output = subprocess.run(
+                [sys.executable, __file__, "--measure", mode, str(n_rows), "--seed", str(args.seed),
+                 "--vocabulary-size", str(args.vocabulary_size)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            report.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,100 @@
+# Seeded synthetic review exports shaped like the files customers upload
+
+import csv
+import random
+
+COLUMNS = ["", "Clothing ID", "Age", "Title", "Review Text", "Rating", "Recommended IND",
+           "Positive Feedback Count", "Division Name", "Department Name", "Class Name"]
+
+OPENERS = ["I love this", "Really disappointed with this", "Absolutely gorgeous", "Not sure about this",
+           "Great value for this", "Returned this", "So comfortable, this", "Beautiful color on this"]
+PRODUCTS = ["dress", "top", "skirt", "sweater", "jacket", "blouse", "jeans", "cardigan"]
+DETAILS = ["fits true to size", "runs small so size up", "the fabric is soft and thick",
+           "the material feels cheap", "the length hits just below the knee", "it shrank after one wash",
+           "the zipper broke quickly", "i get compliments every time", "it is see-through in the light",
+           "perfect for work and weekends", "the stitching came apart", "the petite size is perfect"]
+CLOSERS = ["Would buy again!", "Highly recommend.", "Sending it back.", "Meh.", "Five stars.",
+           "Wish it came in more colors.", "Worth the price.", "Not worth it at all."]
+
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "dri", "sto", "fle", "gra", "bel", "mon"]
+
+
+def make_vocabulary(size: int, seed: int = 42) -> list:
+    # Made-up product words (brands, fabrics, colors) that widen the vocabulary beyond the templates
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_review(rng: random.Random, vocabulary: list = None) -> str:
+    details = rng.sample(DETAILS, rng.randint(1, 4))
+    review = f"{rng.choice(OPENERS)} {rng.choice(PRODUCTS)}, {', '.join(details)}. {rng.choice(CLOSERS)}"
+    if vocabulary:
+        review += " Also " + " ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 6))) + "."
+    return review
+
+
+EDITS = ["really", "very", "honestly", "so", "just"]
+
+
+def make_near_duplicate(rng: random.Random, review: str) -> str:
+    # The same review with one word dropped or one filler word added, like a template filled in twice
+    words = review.split()
+    position = rng.randrange(len(words))
+    if len(words) > 8 and rng.random() < 0.5:
+        del words[position]
+    else:
+        words.insert(position, rng.choice(EDITS))
+    return " ".join(words)
+
+
+def make_reviews(n_rows: int, seed: int = 42, duplicate_rate: float = 0.0, vocabulary_size: int = 0,
+                 near_duplicate_rate: float = 0.0, distinct_reviews: int = 0) -> list:
+    # duplicate_rate is the share of rows that repeat an earlier review word for word,
+    # near_duplicate_rate the share that repeat one with a one-word edit,
+    # vocabulary_size adds that many extra words on top of the template phrases,
+    # distinct_reviews draws every row from that many reviews, like a templated export
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size, seed) if vocabulary_size else None
+    if distinct_reviews:
+        templates = [make_review(rng, vocabulary) for _ in range(distinct_reviews)]
+        return [rng.choice(templates) for _ in range(n_rows)]
+    reviews = []
+    for _ in range(n_rows):
+        if reviews and rng.random() < duplicate_rate:
+            reviews.append(rng.choice(reviews))
+        elif near_duplicate_rate and reviews and rng.random() < near_duplicate_rate:
+            reviews.append(make_near_duplicate(rng, rng.choice(reviews)))
+        else:
+            reviews.append(make_review(rng, vocabulary))
+    return reviews
+
+
+def write_synthetic_csv(path: str, n_rows: int, seed: int = 42, duplicate_rate: float = 0.0,
+                        vocabulary_size: int = 0, bad_line_rate: float = 0.0, near_duplicate_rate: float = 0.0,
+                        multiline_rate: float = 0.0, distinct_reviews: int = 0, short_row_rate: float = 0.0) -> str:
+    # bad_line_rate is the share of rows written with extra fields, which ingestion skips as bad lines,
+    # short_row_rate the share cut short (sometimes before the review), which ingestion keeps,
+    # multiline_rate the share of reviews with a line break and quotes inside the quoted field
+    rng = random.Random(seed)
+    reviews = make_reviews(n_rows, seed, duplicate_rate, vocabulary_size, near_duplicate_rate, distinct_reviews)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for i in range(n_rows):
+            row = [
+                i, rng.randint(1, 1200), rng.randint(18, 80), "", reviews[i], rng.randint(1, 5),
+                rng.randint(0, 1), rng.randint(0, 50), "General", rng.choice(["Dresses", "Tops", "Bottoms"]),
+                rng.choice(PRODUCTS).title(),
+            ]
+            if bad_line_rate and rng.random() < bad_line_rate:
+                row += ["unexpected", "extra fields"]
+            elif short_row_rate and rng.random() < short_row_rate:
+                row = row[:rng.randint(1, len(row) - 1)]
+            if multiline_rate and rng.random() < multiline_rate:
+                row[4] = row[4].replace(". ", '.\n"Update": ', 1)
+            writer.writerow(row)
+    return path
@@ -0,0 +1,13 @@
+# Builds SQS events the way S3 -> SQS -> Lambda delivers them, for running the handler locally
+
+import json
+import urllib.parse
+
+
+def s3_sqs_record(message_id: str, bucket: str, key: str) -> dict:
+    body = {"Records": [{"s3": {"bucket": {"name": bucket}, "object": {"key": urllib.parse.quote_plus(key, safe="/")}}}]}
+    return {"messageId": message_id, "receiptHandle": f"handle-{message_id}", "body": json.dumps(body), "eventSource": "aws:sqs"}
+
+
+def sqs_event(records: list) -> dict:
+    return {"Records": records}
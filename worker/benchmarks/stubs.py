@@ -0,0 +1,31 @@
+# Stand-ins for external services used by the benchmarks
+
+import time
+import threading
+from types import SimpleNamespace
+
+
+class StubCompletions:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create(self, messages, timeout=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        content = f"Stub summary for a prompt of {len(messages[0]['content'])} characters."
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class StubLLMClient:
+    # Mimics the parts of openai.OpenAI the worker uses, with a fixed latency per call
+
+    def __init__(self, latency: float = 1.0):
+        self.api_key = "stub"
+        self.chat = SimpleNamespace(completions=StubCompletions(latency))
+
+    @property
+    def calls(self) -> int:
+        return self.chat.completions.calls
@@ -0,0 +1,34 @@
+from typing import Dict
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import AnalyticsCounter
+
+# Counter names, shared with the backend's admin analytics
+UPLOADS = "uploads"
+ANALYSIS_RESULTS = "analysis_results"
+STATUS_PREFIX = "uploads_status:"
+
+
+def status_counter(status: str) -> str:
+    return f"{STATUS_PREFIX}{status}"
+
+
+def bump_counters(db_session, deltas: Dict[str, int]):
+    # Adds the deltas in the session's transaction, so they commit or roll back with the change they count.
+    # Rows are locked in name order, so concurrent records can't deadlock on them.
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    insert = postgresql.insert if db_session.bind.dialect.name == "postgresql" else sqlite.insert
+    stmt = insert(AnalyticsCounter).values([
+        {"name": name, "value": delta} for name, delta in sorted(deltas.items())
+    ])
+    db_session.execute(stmt.on_conflict_do_update(
+        index_elements=[AnalyticsCounter.name],
+        set_={"value": AnalyticsCounter.value + stmt.excluded.value},
+    ))
+
+
+def status_change(old_status: str, new_status: str) -> Dict[str, int]:
+    return {status_counter(old_status): -1, status_counter(new_status): 1}
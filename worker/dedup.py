@@ -0,0 +1,123 @@
+import os
+import logging
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from sklearn.feature_extraction.text import HashingVectorizer
+
+logger = logging.getLogger(__name__)
+
+# Exports are full of copied and templated reviews. Each group of near-identical reviews is modelled once,
+# by its first review, with the group size as its weight.
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+# Jaccard similarity of the shingle sets above which two reviews count as the same review
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+# Shingles are runs of 1 up to this many words
+DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", "2"))
+# LSH banding of the MinHash signature. With 8 bands of 4 rows a pair at 0.8 similarity
+# becomes a candidate 98.5% of the time, candidates are then checked against the exact similarity.
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "8"))
+DEDUP_ROWS_PER_BAND = int(os.getenv("DEDUP_ROWS_PER_BAND", "4"))
+
+# Documents hashed at a time, and candidate pairs checked at a time, to keep memory bounded
+_BLOCK_SIZE = 20000
+
+
+def _shingle_matrix(texts) -> sparse.csr_matrix:
+    # One row per text, a 1 for every hashed shingle it contains
+    vectorizer = HashingVectorizer(
+        ngram_range=(1, DEDUP_SHINGLE_SIZE), n_features=2 ** 24, binary=True, norm=None,
+        alternate_sign=False, dtype=np.float32,
+    )
+    return vectorizer.transform(texts)
+
+
+def minhash_signatures(shingles: sparse.csr_matrix, n_hashes: int, seed: int = 42) -> np.ndarray:
+    # Smallest value of n_hashes random hash functions over each row's shingles (multiply-shift hashing).
+    # Rows without shingles keep the maximum value in every column.
+    rng = np.random.RandomState(seed)
+    multipliers = rng.randint(1, 2 ** 62, size=n_hashes, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+    offsets = rng.randint(0, 2 ** 62, size=n_hashes, dtype=np.int64).astype(np.uint64)
+
+    n_docs = shingles.shape[0]
+    signatures = np.full((n_docs, n_hashes), np.iinfo(np.uint32).max, dtype=np.uint32)
+    for start in range(0, n_docs, _BLOCK_SIZE):
+        block = shingles[start:start + _BLOCK_SIZE]
+        rows = np.flatnonzero(np.diff(block.indptr))
+        if not len(rows): continue
+        ids = block.indices.astype(np.uint64)
+        # each row's segment ends where the next non-empty row starts
+        segment_starts = block.indptr[rows]
+        for column in range(n_hashes):
+            hashes = ((ids * multipliers[column] + offsets[column]) >> np.uint64(32)).astype(np.uint32)
+            signatures[start + rows, column] = np.minimum.reduceat(hashes, segment_starts)
+    return signatures
+
+
+def _candidate_pairs(signatures: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    # Pairs (first member of a bucket, other member) for every LSH bucket shared by more than one row
+    pairs = []
+    mixers = np.random.RandomState(0).randint(1, 2 ** 62, size=DEDUP_ROWS_PER_BAND, dtype=np.int64).astype(np.uint64)
+    for band in range(DEDUP_BANDS):
+        columns = signatures[rows, band * DEDUP_ROWS_PER_BAND:(band + 1) * DEDUP_ROWS_PER_BAND].astype(np.uint64)
+        # a colliding key only costs one extra exact check
+        keys = (columns * mixers).sum(axis=1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        new_bucket = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+        leaders = order[np.flatnonzero(new_bucket)[np.cumsum(new_bucket) - 1]]
+        followers = leaders != order
+        pairs.append(np.column_stack([rows[leaders[followers]], rows[order[followers]]]))
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def _similar_pairs(shingles: sparse.csr_matrix, pairs: np.ndarray) -> np.ndarray:
+    # Keeps the candidate pairs whose exact Jaccard similarity reaches the threshold
+    if not len(pairs): return pairs
+    sizes = np.diff(shingles.indptr)
+    keep = []
+    for start in range(0, len(pairs), _BLOCK_SIZE):
+        left, right = pairs[start:start + _BLOCK_SIZE].T
+        shared = np.asarray(shingles[left].multiply(shingles[right]).sum(axis=1)).ravel()
+        similarity = shared / (sizes[left] + sizes[right] - shared)
+        keep.append(similarity >= DEDUP_THRESHOLD)
+    return pairs[np.concatenate(keep)]
+
+
+def collapse_duplicates(texts: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    # Groups identical and near-identical texts. Returns the group of every text, numbered in the order
+    # the groups first appear, and the position of each group's first text (its representative).
+    if not DEDUP_ENABLED:
+        # every row is kept as its own document
+        positions = np.arange(len(texts))
+        return positions, positions
+
+    codes, uniques = pd.factorize(texts)
+    groups = np.arange(len(uniques))
+
+    if len(uniques) > 1:
+        shingles = _shingle_matrix(uniques)
+        n_hashes = DEDUP_BANDS * DEDUP_ROWS_PER_BAND
+        signatures = minhash_signatures(shingles, n_hashes)
+        # texts without any shingle would all share one bucket, they are left on their own
+        rows = np.flatnonzero(np.diff(shingles.indptr))
+        pairs = _similar_pairs(shingles, _candidate_pairs(signatures, rows)) if len(rows) > 1 else np.empty((0, 2), dtype=np.int64)
+        graph = sparse.coo_matrix(
+            (np.ones(len(pairs), dtype=np.int8), (pairs[:, 0], pairs[:, 1])), shape=(len(uniques), len(uniques))
+        )
+        _, components = connected_components(graph, directed=False)
+        # renumber so groups are in order of first appearance, like the codes of factorize
+        groups, _ = pd.factorize(components)
+
+    row_groups = groups[codes]
+    _, representatives = np.unique(row_groups, return_index=True)
+
+    logger.info(
+        f"Collapsed {len(texts)} reviews into {len(representatives)} ({len(texts) - len(uniques)} exact duplicates, "
+        f"{len(uniques) - len(representatives)} near duplicates)",
+        extra={"dedup_rows": len(texts), "dedup_unique": len(uniques), "dedup_groups": len(representatives)},
+    )
+    return row_groups, representatives
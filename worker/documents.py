@@ -0,0 +1,92 @@
+import os
+import uuid
+import logging
+from typing import Optional
+
+import numpy as np
+
+from ingest import iter_review_chunks
+from storage import get_file_store
+
+logger = logging.getLogger(__name__)
+
+# Per-review results of an upload (topic, topic probabilities, sentiment and the review itself), kept so
+# single reviews can be looked up later without reprocessing the file. Each analysis of an upload gets three
+# objects under DOCUMENTS_PREFIX/<user_id>/<upload_id>/<version>/ in DOCUMENTS_BUCKET, all laid out to be
+# memory-mapped so the API only reads the rows it returns:
+#   documents.npy          one record per analyzed review, ordered by topic_id and then sentiment
+#   probability_order.npy  positions into documents.npy, ordered by topic_id and then topic probability (highest first)
+#   reviews.bin            the raw review texts back to back, each record points at its text_offset/text_length
+# No bucket means the results aren't kept.
+DOCUMENTS_BUCKET = os.getenv("DOCUMENTS_BUCKET", "")
+DOCUMENTS_PREFIX = os.getenv("DOCUMENTS_PREFIX", "documents")
+DOCUMENT_FILES = ("documents.npy", "probability_order.npy", "reviews.bin")
+
+
+def document_dtype(n_topics: int) -> np.dtype:
+    return np.dtype([
+        ("doc_id", "<i8"),
+        ("topic_id", "<i2"),
+        ("sentiment", "<f4"),
+        ("topic_probability", "<f4"),
+        ("text_offset", "<i8"),
+        ("text_length", "<i4"),
+        ("probabilities", "<f4", (n_topics,)),
+    ])
+
+
+def _write_reviews(filepath: str, doc_ids: np.ndarray, destination: str):
+    # Streams the file once more and writes the raw text of the analyzed reviews in file order.
+    # doc_ids must be sorted, returns the (offsets, lengths) of their texts in the same order.
+    offsets = np.zeros(len(doc_ids), dtype=np.int64)
+    lengths = np.zeros(len(doc_ids), dtype=np.int32)
+    position = 0
+    with open(destination, "wb") as f:
+        for chunk in iter_review_chunks(filepath):
+            first = np.searchsorted(doc_ids, chunk.index[0])
+            last = np.searchsorted(doc_ids, chunk.index[-1], side="right")
+            if first == last: continue
+            texts = chunk.to_numpy()[doc_ids[first:last] - chunk.index[0]]
+            encoded = [text.encode("utf-8") if isinstance(text, str) else b"" for text in texts]
+            lengths[first:last] = [len(data) for data in encoded]
+            offsets[first:last] = position + np.concatenate([[0], np.cumsum(lengths[first:last])[:-1]])
+            position += int(lengths[first:last].sum())
+            f.write(b"".join(encoded))
+    return offsets, lengths
+
+
+def write_document_artifact(
+    directory: str, filepath: str, doc_ids: np.ndarray, topic_ids: np.ndarray, sentiment: np.ndarray, probabilities: np.ndarray,
+):
+    # One entry per analyzed review, doc_ids in file order
+    os.makedirs(directory, exist_ok=True)
+    offsets, lengths = _write_reviews(filepath, doc_ids, os.path.join(directory, "reviews.bin"))
+
+    order = np.lexsort((sentiment, topic_ids))
+    records = np.empty(len(doc_ids), dtype=document_dtype(probabilities.shape[1]))
+    records["doc_id"] = doc_ids[order]
+    records["topic_id"] = topic_ids[order]
+    records["sentiment"] = sentiment[order]
+    records["probabilities"] = probabilities[order]
+    records["topic_probability"] = probabilities[order, topic_ids[order]]
+    records["text_offset"] = offsets[order]
+    records["text_length"] = lengths[order]
+    np.save(os.path.join(directory, "documents.npy"), records)
+
+    probability_order = np.lexsort((-records["topic_probability"], records["topic_id"])).astype(np.int32)
+    np.save(os.path.join(directory, "probability_order.npy"), probability_order)
+
+
+def store_document_artifact(directory: str, user_id: int, upload_id: int) -> Optional[str]:
+    # Uploads the artifact written to directory, returns its key prefix. A reprocessed upload gets a new
+    # prefix, so the files under a prefix never change and the API can cache them by it.
+    if not DOCUMENTS_BUCKET: return None
+    documents_key = f"{DOCUMENTS_PREFIX}/{user_id}/{upload_id}/{uuid.uuid4().hex}"
+    for name in DOCUMENT_FILES:
+        get_file_store().upload(os.path.join(directory, name), DOCUMENTS_BUCKET, f"{documents_key}/{name}")
+    return documents_key
+
+
+def delete_document_artifact(documents_key: str):
+    for name in DOCUMENT_FILES:
+        get_file_store().delete(DOCUMENTS_BUCKET, f"{documents_key}/{name}")
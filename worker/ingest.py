@@ -0,0 +1,169 @@
+import os
+import csv
+import io
+import logging
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow.csv as pa_csv
+
+logger = logging.getLogger(__name__)
+
+REVIEW_COLUMN = "Review Text"
+
+# Size of each block handed to the parser, memory is bounded by this rather than the file size
+INGEST_BLOCK_SIZE_MB = float(os.getenv("INGEST_BLOCK_SIZE_MB", "8"))
+
+
+class IngestStats:
+    def __init__(self):
+        self.rows = 0
+        # rows with too many fields, skipped
+        self.bad_lines = 0
+        # rows with too few fields, kept with the missing columns empty
+        self.short_rows = 0
+
+
+class _InvalidRows:
+    # Rows the parser rejected, by their row number in the file (the header is row 1).
+    # pyarrow skips rows with too few fields where pandas padded them with NaN, so those are parsed
+    # again here and put back in place by iter_review_chunks, keeping the doc_ids pandas gave.
+    def __init__(self, review_index: int):
+        self.review_index = review_index
+        # rows are reported in file order
+        self.numbers = deque()
+        self.reviews = {}
+
+    def add(self, row, stats: IngestStats) -> str:
+        if row.number is None or row.number < 0:
+            # without a position the row can't be put back
+            stats.bad_lines += 1
+            return "skip"
+
+        self.numbers.append(row.number)
+        fields = None
+        if row.actual_columns < row.expected_columns:
+            try:
+                fields = next(csv.reader(io.StringIO(row.text), strict=True), [])
+            except csv.Error:
+                # a quote left open at the end of a truncated file, pandas skipped those too
+                pass
+        if fields is None:
+            stats.bad_lines += 1
+        else:
+            self.reviews[row.number] = fields[self.review_index] if self.review_index < len(fields) else None
+            stats.short_rows += 1
+        return "skip"
+
+    def merge(self, values: List[Optional[str]], number: int, last: bool = False):
+        # Puts the short rows back among the values the parser kept, the first of which is row `number`.
+        # Rows found right after the last value wait for the next batch, unless this is the last one.
+        # Returns the merged reviews and the number of the row that comes next.
+        merged = []
+        position = 0
+        while self.numbers:
+            end = position + self.numbers[0] - number
+            if end > len(values) or (end == len(values) and not last):
+                break
+            merged.extend(values[position:end])
+            invalid = self.numbers.popleft()
+            if invalid in self.reviews:
+                merged.append(self.reviews.pop(invalid))
+            position = end
+            number = invalid + 1
+        merged.extend(values[position:])
+        return merged, number + len(values) - position
+
+
+def _review_index(filepath: str) -> int:
+    with open(filepath, newline="", encoding="utf-8-sig", errors="replace") as f:
+        header = next(csv.reader(f), [])
+    return header.index(REVIEW_COLUMN) if REVIEW_COLUMN in header else -1
+
+
+def _open_reader(filepath: str, stats: IngestStats, invalid_rows: _InvalidRows):
+    try:
+        return pa_csv.open_csv(
+            filepath,
+            read_options=pa_csv.ReadOptions(block_size=int(INGEST_BLOCK_SIZE_MB * 1024 * 1024)),
+            parse_options=pa_csv.ParseOptions(
+                newlines_in_values=True, invalid_row_handler=lambda row: invalid_rows.add(row, stats),
+            ),
+            # Only the review column is ever materialized, everything else is dropped by the parser
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=[REVIEW_COLUMN],
+                column_types={REVIEW_COLUMN: "string"},
+                strings_can_be_null=True,
+            ),
+        )
+    except KeyError:
+        raise ValueError(f"Required column '{REVIEW_COLUMN}' is missing from the input file.")
+
+
+def iter_review_chunks(filepath: str, stats: IngestStats = None) -> Iterator[pd.Series]:
+    # Streams the review column block by block. Each chunk is indexed by doc_id, the position of the
+    # row in the file once bad lines are skipped. Short rows keep their place, see _InvalidRows.
+    stats = stats or IngestStats()
+    invalid_rows = _InvalidRows(_review_index(filepath))
+    reader = _open_reader(filepath, stats, invalid_rows)
+    # the header is row 1
+    number = 2
+
+    for batch in reader:
+        values = batch.column(0).to_pylist() if invalid_rows.numbers else None
+        if values is None:
+            chunk = batch.column(0).to_pandas()
+            number += len(chunk)
+        else:
+            values, number = invalid_rows.merge(values, number)
+            chunk = pd.Series(values, dtype=object)
+        if len(chunk) == 0: continue
+        chunk.index = pd.RangeIndex(stats.rows, stats.rows + len(chunk), name="doc_id")
+        stats.rows += len(chunk)
+        yield chunk
+
+    # short rows at the very end of the file
+    values, number = invalid_rows.merge([], number, last=True)
+    if values:
+        chunk = pd.Series(values, dtype=object, index=pd.RangeIndex(stats.rows, stats.rows + len(values), name="doc_id"))
+        stats.rows += len(chunk)
+        yield chunk
+
+
+def read_cleaned_reviews(filepath: str, clean: Callable[[pd.Series], pd.Series], stats: IngestStats = None) -> pd.DataFrame:
+    # Runs each chunk through cleaning as it is read and keeps only the non-empty cleaned text.
+    # The raw reviews are not kept around, use fetch_reviews to get them back for a few doc_ids.
+    stats = stats or IngestStats()
+    parts = []
+    for chunk in iter_review_chunks(filepath, stats):
+        cleaned = clean(chunk)
+        parts.append(cleaned[cleaned != ""])
+
+    logger.info(
+        f"Read {stats.rows} rows from {filepath}, skipped {stats.bad_lines} bad lines, "
+        f"padded {stats.short_rows} short rows",
+        extra={"ingest_rows": stats.rows, "ingest_bad_lines": stats.bad_lines, "ingest_short_rows": stats.short_rows},
+    )
+
+    if not parts:
+        return pd.DataFrame({"doc_id": pd.Series(dtype="int64"), "cleaned_feedback": pd.Series(dtype="object")})
+
+    cleaned_feedback = pd.concat(parts)
+    return pd.DataFrame({"doc_id": cleaned_feedback.index.to_numpy(), "cleaned_feedback": cleaned_feedback.to_numpy()})
+
+
+def fetch_reviews(filepath: str, doc_ids: Iterable[int]) -> Dict[int, str]:
+    # Second streaming pass that maps doc_ids to their raw review text, missing reviews are left out
+    pending = set(doc_ids)
+    found = {}
+    if not pending: return found
+
+    for chunk in iter_review_chunks(filepath):
+        hits = chunk[chunk.index.isin(pending)].dropna()
+        found.update(hits.items())
+        pending.difference_update(hits.index)
+        if not pending or chunk.index[-1] >= max(pending):
+            break
+
+    return found
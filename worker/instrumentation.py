@@ -0,0 +1,79 @@
+import logging
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _peak_rss_mb() -> float:
+    # High-water mark of the process, ru_maxrss is reported in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _children_cpu_seconds() -> float:
+    # CPU used by finished worker processes (sentiment and topic sweep pools)
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageMetrics:
+    # Collects the spans of one job. Spans of the same stage (e.g. every LLM call) are added up.
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, wall_seconds: float, cpu_seconds: float, peak_rss_mb: float):
+        with self._lock:
+            entry = self._stages.setdefault(
+                stage, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "max_wall_seconds": 0.0, "peak_rss_mb": 0.0}
+            )
+            entry["calls"] += 1
+            entry["wall_seconds"] += wall_seconds
+            entry["cpu_seconds"] += cpu_seconds
+            entry["max_wall_seconds"] = max(entry["max_wall_seconds"], wall_seconds)
+            entry["peak_rss_mb"] = max(entry["peak_rss_mb"], peak_rss_mb)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                stage: {key: round(value, 4) if isinstance(value, float) else value for key, value in entry.items()}
+                for stage, entry in self._stages.items()
+            }
+
+
+@contextmanager
+def span(stage: str, metrics: Optional[StageMetrics] = None, per_thread: bool = False, **fields):
+    # Times a block: wall time, CPU time and the process's peak RSS when it ends.
+    # per_thread counts only the calling thread's CPU, for spans that run side by side (LLM calls),
+    # otherwise the whole process and its finished child processes are counted.
+    if per_thread:
+        cpu_clock = time.thread_time
+    else:
+        cpu_clock = lambda: time.process_time() + _children_cpu_seconds()
+    start_wall, start_cpu = time.perf_counter(), cpu_clock()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        wall_seconds = time.perf_counter() - start_wall
+        cpu_seconds = cpu_clock() - start_cpu
+        peak_rss_mb = _peak_rss_mb()
+        if metrics is not None:
+            metrics.record(stage, wall_seconds, cpu_seconds, peak_rss_mb)
+        logger.info(
+            f"Stage {stage} {'failed' if failed else 'finished'} in {wall_seconds:.2f}s",
+            extra={
+                "stage": stage,
+                "stage_failed": failed,
+                "wall_seconds": round(wall_seconds, 4),
+                "cpu_seconds": round(cpu_seconds, 4),
+                "peak_rss_mb": round(peak_rss_mb, 1),
+                **fields,
+            },
+        )
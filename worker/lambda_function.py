@@ -1,122 +1,335 @@
 import json
 import re
-import boto3
 import os
+import shutil
+import tempfile
+import threading
 import urllib.parse
-from worker import process_feedback_file
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, insert, or_, update
+from sqlalchemy.exc import IntegrityError
 from database import SessionLocal, engine
 from models import Base, Upload, AnalysisResult
 import logging
 from logging_config import setup_logging
+from storage import get_file_store
+from counters import ANALYSIS_RESULTS, UPLOADS, bump_counters, status_change, status_counter
+from notify import notify_status
+from instrumentation import StageMetrics, span
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
-s3_client = boto3.client("s3")
+SQS_RECORD_WORKERS = int(os.getenv("SQS_RECORD_WORKERS", "4"))
+# A 'processing' upload whose claim is older than this was left behind by an invocation that died.
+# At least the function timeout, so a claim never expires while its invocation still runs.
+UPLOAD_CLAIM_LEASE_SECONDS = int(os.getenv("UPLOAD_CLAIM_LEASE_SECONDS", "900"))
+DEFAULT_PRODUCT_LINE = "default"
 
-# Stores the analysis results to the database
+# Heavy dependencies are loaded on first use and then reused by the warm container
+_schema_ready = False
+_startup_lock = threading.Lock()
+
+
+class InvalidMessageError(ValueError):
+    # A message that can never be processed, retrying it would not help
+    pass
+
+
+def ensure_schema():
+    # create_all costs a round-trip per table, so it only runs once per container
+    global _schema_ready
+    if not _schema_ready:
+        with _startup_lock:
+            if not _schema_ready:
+                Base.metadata.create_all(bind=engine)
+                _schema_ready = True
+
+
+# Stores the analysis results to the database.
+# All rows go out as one multi-row INSERT, the caller commits them together with the upload status
+# and the analytics counters.
 def save_results_to_db(results: list, upload_id: int, db_session):
+    rows = [
+        {
+            "upload_id": upload_id,
+            "topic": res.get("top_words"),
+            "summary": res.get("ai_summary"),
+            "sentiment_score": res.get("avg_sentiment"),
+            "review_count": res.get("review_count"),
+            "sentiment_details": res.get("sentiment_dict"),
+            "prompt_tokens": res.get("prompt_tokens"),
+            "topic_id": res.get("topic_id"),
+        }
+        for res in results
+    ]
+    if rows:
+        db_session.execute(insert(AnalysisResult), rows)
+        bump_counters(db_session, {ANALYSIS_RESULTS: len(rows)})
+
+
+def claim_upload(upload, message_id: str, db_session) -> bool:
+    # Takes over an upload that failed, or whose claim ran out, for this message. The check and the claim
+    # are a single conditional UPDATE, so of several deliveries of the same key only one gets the upload.
+    now = datetime.now(timezone.utc)
+    claimed = db_session.execute(
+        update(Upload)
+        .where(
+            Upload.id == upload.id,
+            Upload.status == upload.status,
+            or_(
+                Upload.status == 'failed',
+                Upload.claimed_at.is_(None),
+                Upload.claimed_at < now - timedelta(seconds=UPLOAD_CLAIM_LEASE_SECONDS),
+            ),
+        )
+        .values(status='processing', claimed_by=message_id, claimed_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    return claimed.rowcount == 1
+
+
+def parse_record(record) -> tuple:
+    # Pulls (bucket, file_key, user_id, filename) out of an SQS record wrapping an S3 event
+    sqs_body_str = record['body']
+
     try:
-        for res in results:
-            db_result = AnalysisResult(
-                upload_id=upload_id,
-                topic=res.get("top_words"),
-                summary=res.get("ai_summary"),
-                sentiment_score=res.get("avg_sentiment"),
-                review_count=res.get("review_count"),
-                sentiment_details=res.get("sentiment_dict")
-            )
-            db_session.add(db_result)
-        db_session.commit()
-        logger.info(f"Successfully saved {len(results)} analysis results to the database.")
-    except Exception as e:
-        db_session.rollback()
-        logger.error(f"Error saving to database: {e}")
-        raise
+        s3_event_data = json.loads(sqs_body_str)
+    except json.JSONDecodeError:
+        raise InvalidMessageError(f"Received non-JSON message body from SQS, skipping: {sqs_body_str}")
 
-# Entry Point
-def lambda_handler(event, context):
+    if 'Records' not in s3_event_data or not isinstance(s3_event_data.get('Records'), list) or not s3_event_data.get('Records'):
+        raise InvalidMessageError(f"Received SQS message that is not a valid S3 event notification, skipping: {s3_event_data}")
 
-    logger.info("Lambda function triggered by SQS event.")
+    s3_record = s3_event_data['Records'][0]
 
-    Base.metadata.create_all(bind=engine)
-    
-    for record in event['Records']:
-        sqs_body_str = record['body']
-
-        try:
-            s3_event_data = json.loads(sqs_body_str)
-        except json.JSONDecodeError:
-            logger.warning(f"Received non-JSON message body from SQS, skipping: {sqs_body_str}")
-            return {'statusCode': 400, 'body': json.dumps('Invalid SQS message format')}
-
-        if 'Records' not in s3_event_data or not isinstance(s3_event_data.get('Records'), list) or not s3_event_data.get('Records'):
-            logger.warning(f"Received SQS message that is not a valid S3 event notification, skipping: {s3_event_data}")
-            return {'statusCode': 400, 'body': json.dumps('Invalid S3 event format')}
-
-        s3_record = s3_event_data['Records'][0]
-
-        if 's3' not in s3_record or 'bucket' not in s3_record.get('s3', {}) or 'object' not in s3_record.get('s3', {}):
-            logger.warning(f"S3 event record is missing critical keys, skipping: {s3_record}")
-            return {'statusCode': 400, 'body': json.dumps('Invalid S3 event record format')}
-        
-        bucket_name = s3_record['s3']['bucket']['name']
-        file_key = urllib.parse.unquote_plus(s3_record['s3']['object']['key'])
-
-        try:
-            user_id_str, actual_filename = file_key.split('/', 1)
-            user_id = int(user_id_str)
-        except (ValueError, IndexError):
-            logger.error(f"Could not parse user_id from S3 key: {file_key}")
-            return {'statusCode': 400, 'body': json.dumps('Invalid S3 key format')}
-        
-        if re.search(r"[^a-zA-Z0-9._-]", actual_filename):
-            logger.error(f"Invalid filename '{actual_filename}' in S3 key: {file_key}")
-            return {'statusCode': 400, 'body': json.dumps('Invalid filename format')}
-
-        db = SessionLocal()
-        existing_upload = db.query(Upload).filter(
-            Upload.user_id == user_id,
-            Upload.filename == actual_filename
-        ).first()
+    if 's3' not in s3_record or 'bucket' not in s3_record.get('s3', {}) or 'object' not in s3_record.get('s3', {}):
+        raise InvalidMessageError(f"S3 event record is missing critical keys, skipping: {s3_record}")
 
-        if existing_upload:
-            logger.info(f"Upload record already exists for user {user_id} with filename {actual_filename}. Skipping processing.")
+    bucket_name = s3_record['s3']['bucket']['name']
+    file_key = urllib.parse.unquote_plus(s3_record['s3']['object']['key'])
+
+    try:
+        user_id_str, actual_filename = file_key.split('/', 1)
+        user_id = int(user_id_str)
+    except (ValueError, IndexError):
+        raise InvalidMessageError(f"Could not parse user_id from S3 key: {file_key}")
+
+    if re.search(r"[^a-zA-Z0-9._-]", actual_filename):
+        raise InvalidMessageError(f"Invalid filename '{actual_filename}' in S3 key: {file_key}")
+
+    return bucket_name, file_key, user_id, actual_filename
+
+
+def analysis_options(object_metadata: dict) -> tuple:
+    # (product_line, incremental) from the metadata the file was uploaded with.
+    # The product line names the stored model, so anything that isn't a plain name falls back to the default one.
+    product_line = object_metadata.get('product-line') or DEFAULT_PRODUCT_LINE
+    if not re.fullmatch(r"[a-zA-Z0-9._-]{1,100}", product_line):
+        logger.warning(f"Invalid product line '{product_line}', using '{DEFAULT_PRODUCT_LINE}'")
+        product_line = DEFAULT_PRODUCT_LINE
+    return product_line, object_metadata.get('analysis-mode') == 'incremental'
+
+
+def process_record(record):
+    # Analyzes the file behind one SQS record. Raises when the message should be redelivered.
+    bucket_name, file_key, user_id, actual_filename = parse_record(record)
+
+    ensure_schema()
+    db = SessionLocal()
+    existing_upload = db.query(Upload).filter(
+        Upload.user_id == user_id,
+        Upload.filename == actual_filename
+    ).first()
+
+    # A message is redelivered when an attempt failed after the upload row was committed, or died midway.
+    # That upload is analyzed again in place, only a finished one is skipped.
+    if existing_upload and existing_upload.status not in ('processing', 'failed'):
+        logger.info(f"Upload record already exists for user {user_id} with filename {actual_filename}. Skipping processing.")
+        db.close()
+        return
+
+    message_id = record.get('messageId')
+    if existing_upload:
+        previous_status = existing_upload.status
+        if not claim_upload(existing_upload, message_id, db):
+            db.rollback()
+            db.refresh(existing_upload)
             db.close()
-            return {'statusCode': 200, 'body': json.dumps('Upload already processed')}
-    
-        logger.info(f"Processing file: {file_key} from bucket: {bucket_name}")
-
-        download_path = f'/tmp/{os.path.basename(file_key)}'
-        s3_client.download_file(bucket_name, file_key, download_path)
-        
-        upload_record = None
-        try:
-            upload_record = Upload(filename=actual_filename, status='processing', user_id=user_id)
-            db.add(upload_record)
-            db.commit()
-            db.refresh(upload_record)
+            if existing_upload.status == 'processing' and existing_upload.claimed_by == message_id:
+                # an earlier delivery of this message died holding the claim, SQS retries until the lease runs out
+                raise RuntimeError(f"Upload {existing_upload.id} is still claimed by an earlier attempt of this message")
+            logger.info(f"Upload {existing_upload.id} is analyzed for another message. Skipping processing.")
+            return
+        # whatever an abandoned attempt saved is replaced by this one's results
+        deleted = db.execute(delete(AnalysisResult).where(AnalysisResult.upload_id == existing_upload.id)).rowcount
+        deltas = {ANALYSIS_RESULTS: -deleted}
+        if previous_status != 'processing':
+            deltas.update(status_change(previous_status, 'processing'))
+        bump_counters(db, deltas)
+        db.refresh(existing_upload)
+        notify_status(db, existing_upload)
+        db.commit()
+
+    logger.info(f"Processing file: {file_key} from bucket: {bucket_name}")
+
+    # Records are processed side by side, and two of them can carry the same key, so every record
+    # downloads to a path of its own
+    fd, download_path = tempfile.mkstemp(dir='/tmp', prefix=f'{user_id}_', suffix=f'_{os.path.basename(file_key)}')
+    os.close(fd)
+    documents_dir = f'{download_path}.documents'
+
+    # a claimed upload is committed as 'processing' already, so it too is marked as failed below
+    upload_record = existing_upload
+    try:
+        metrics = StageMetrics()
+        # pandas, scikit-learn and nltk are only loaded once there is a file to analyze
+        from sharding import should_shard
+        with span("download", metrics, file_key=file_key):
+            store = get_file_store()
+            product_line, incremental = analysis_options(store.metadata(bucket_name, file_key))
+            # Files too large for one invocation are analyzed in shards straight from the bucket
+            sharded = should_shard(store.size(bucket_name, file_key))
+            if not sharded:
+                store.download(bucket_name, file_key, download_path)
+
+        if existing_upload:
+            new_upload = existing_upload
+            new_upload.product_line = product_line
+        else:
+            new_upload = Upload(
+                filename=actual_filename, status='processing', user_id=user_id, product_line=product_line,
+                claimed_by=message_id, claimed_at=datetime.now(timezone.utc),
+            )
+            db.add(new_upload)
+            try:
+                db.flush()
+            except IntegrityError:
+                # another record of the same key created the upload first and analyzes it
+                db.rollback()
+                logger.info(f"Upload of {file_key} was already claimed by another message, skipping processing.")
+                return
+            bump_counters(db, {UPLOADS: 1, status_counter('processing'): 1})
+            notify_status(db, new_upload)
+        db.commit()
+        upload_record = new_upload
+        if existing_upload:
+            logger.info(f"Reprocessing upload record with ID: {upload_record.id}")
+        else:
             logger.info(f"Created new upload record with ID: {upload_record.id}")
 
-            analysis_results = process_feedback_file(download_path)
-            
-            if analysis_results:
+        from worker import process_feedback_file
+        from sharding import analyze_sharded
+        from documents import DOCUMENTS_BUCKET, delete_document_artifact, store_document_artifact
+
+        run_metadata = {}
+        if sharded:
+            # always a full fit, and without per-review results
+            analysis_results = analyze_sharded(bucket_name, file_key, run_metadata, metrics, model_key=f"{user_id}/{product_line}")
+        else:
+            analysis_results = process_feedback_file(
+                download_path, run_metadata, metrics, model_key=f"{user_id}/{product_line}", incremental=incremental,
+                documents_dir=documents_dir if DOCUMENTS_BUCKET else None,
+            )
+        upload_record.n_topics = run_metadata.get('n_topics')
+        upload_record.topic_sweep = run_metadata.get('topic_sweep')
+        upload_record.model_version = run_metadata.get('model_version')
+
+        # the per-review results of an earlier analysis don't match the new results
+        previous_documents_key = upload_record.documents_key
+        upload_record.documents_key = None
+        if analysis_results and DOCUMENTS_BUCKET and not sharded:
+            try:
+                with span("store_documents", metrics, upload_id=upload_record.id):
+                    upload_record.documents_key = store_document_artifact(documents_dir, user_id, upload_record.id)
+            except Exception as e:
+                # the aggregated results are still saved, only the drill-down is missing
+                logger.error(f"Could not store the per-review results of upload {upload_record.id}: {e}")
+
+        # Results and the final status are written in a single transaction
+        if analysis_results:
+            with span("persist", metrics, upload_id=upload_record.id):
                 save_results_to_db(analysis_results, upload_record.id, db)
-                upload_record.status = 'completed'
-            else:
-                upload_record.status = 'failed'
-            
+            upload_record.status = 'completed'
+        else:
+            upload_record.status = 'failed'
+        upload_record.stage_metrics = metrics.as_dict()
+        bump_counters(db, status_change('processing', upload_record.status))
+        notify_status(db, upload_record)
+
+        db.commit()
+        logger.info(f"Saved {len(analysis_results or [])} analysis results, upload {upload_record.id} is {upload_record.status}.")
+
+        if previous_documents_key:
+            try:
+                delete_document_artifact(previous_documents_key)
+            except Exception as e:
+                logger.warning(f"Could not delete the earlier per-review results {previous_documents_key}: {e}")
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"A top-level error occurred: {e}")
+        if upload_record:
+            upload_record.status = 'failed'
+            bump_counters(db, status_change('processing', 'failed'))
+            notify_status(db, upload_record)
             db.commit()
+        raise
 
-        except Exception as e:
-            db.rollback()
-            logger.error(f"A top-level error occurred: {e}")
-            if upload_record:
-                upload_record.status = 'failed'
-                db.commit()
-            raise
-        
-        finally:
-            db.close()
+    finally:
+        db.close()
+        # /tmp survives between invocations of a warm container
+        if os.path.exists(download_path):
+            os.remove(download_path)
+        shutil.rmtree(documents_dir, ignore_errors=True)
+
+
+def _shard_task(record) -> Optional[dict]:
+    # A task of a sharded analysis run by another invocation (sharding.SQSBackend), not an S3 event
+    try:
+        message = json.loads(record['body'])
+    except (json.JSONDecodeError, TypeError):
+        return None
+    return message if isinstance(message, dict) and 'shard_task' in message else None
+
+
+def _process_record_safely(record) -> bool:
+    # True when the record is done with (processed or dropped), False when SQS should redeliver it
+    try:
+        shard_task = _shard_task(record)
+        if shard_task:
+            from sharding import run_queued_task
+            run_queued_task(shard_task)
+        else:
+            process_record(record)
+        return True
+    except InvalidMessageError as e:
+        logger.warning(str(e))
+        return True
+    except Exception as e:
+        logger.error(f"Failed to process SQS message {record.get('messageId')}: {e}")
+        return False
+
+
+# Entry Point
+def lambda_handler(event, context):
+
+    logger.info("Lambda function triggered by SQS event.")
+
+    records = event.get('Records', [])
+    if not records:
+        return {'batchItemFailures': []}
+
+    # Records of a batch are independent, so they are processed concurrently. Only the ones that
+    # failed are reported back, SQS then redelivers just those (needs ReportBatchItemFailures).
+    with ThreadPoolExecutor(max_workers=max(1, min(SQS_RECORD_WORKERS, len(records))), thread_name_prefix="record") as executor:
+        outcomes = list(executor.map(_process_record_safely, records))
 
-    return {'statusCode': 200, 'body': json.dumps('Processing complete!')}
\ No newline at end of file
+    failures = [{'itemIdentifier': record['messageId']} for record, ok in zip(records, outcomes) if not ok]
+    logger.info(
+        f"Processed {len(records)} SQS records, {len(failures)} failed",
+        extra={"sqs_records": len(records), "sqs_failures": len(failures)},
+    )
+    return {'batchItemFailures': failures}
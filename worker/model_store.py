@@ -0,0 +1,72 @@
+import io
+import os
+import time
+import hashlib
+import logging
+from typing import Optional
+
+import joblib
+
+from storage import get_file_store
+
+logger = logging.getLogger(__name__)
+
+# Fitted topic models (vectorizer and LDA) are kept per user and product line, so later exports of the
+# same product can be analyzed against them instead of refitting. Artifacts go to MODEL_STORE_BUCKET
+# through the same store as the uploads (S3, or local:/dir), no bucket means models aren't kept.
+MODEL_STORE_BUCKET = os.getenv("MODEL_STORE_BUCKET", "")
+MODEL_STORE_PREFIX = os.getenv("MODEL_STORE_PREFIX", "models")
+# Incremental uploads also update the stored model with their documents and save it as a new version
+INCREMENTAL_PARTIAL_FIT = os.getenv("INCREMENTAL_PARTIAL_FIT", "false").lower() == "true"
+
+
+class TopicModel:
+    def __init__(self, vectorizer, lda, version: str):
+        self.vectorizer = vectorizer
+        self.lda = lda
+        self.version = version
+
+
+def _model_dir(model_key: str) -> str:
+    return f"{MODEL_STORE_PREFIX}/{model_key}"
+
+
+def load_latest_model(model_key: str) -> Optional[TopicModel]:
+    # The newest model saved under model_key ("<user_id>/<product_line>"), None when there is none
+    if not MODEL_STORE_BUCKET: return None
+    store = get_file_store()
+
+    latest = store.read(MODEL_STORE_BUCKET, f"{_model_dir(model_key)}/latest")
+    if latest is None: return None
+    version = latest.decode().strip()
+
+    data = store.read(MODEL_STORE_BUCKET, f"{_model_dir(model_key)}/{version}.joblib")
+    if data is None:
+        logger.warning(f"Model {model_key}/{version} is listed as the latest but its artifact is missing")
+        return None
+    artifact = joblib.load(io.BytesIO(data))
+    logger.info(f"Loaded topic model {model_key}/{version}", extra={"model_version": f"{model_key}/{version}"})
+    return TopicModel(artifact["vectorizer"], artifact["lda"], f"{model_key}/{version}")
+
+
+def save_model(model_key: str, vectorizer, lda, parent: Optional[str] = None) -> Optional[str]:
+    # Saves a new version and makes it the latest. Versions are never overwritten, so an upload's
+    # model_version always points at the exact model its results came from.
+    if not MODEL_STORE_BUCKET: return None
+    store = get_file_store()
+
+    # the terms dropped by min_df/max_df are only kept for inspection and can be larger than the model
+    vectorizer.stop_words_ = None
+    buffer = io.BytesIO()
+    joblib.dump({"vectorizer": vectorizer, "lda": lda, "parent": parent}, buffer, compress=3)
+    data = buffer.getvalue()
+
+    version = f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{hashlib.sha256(data).hexdigest()[:8]}"
+    store.write(MODEL_STORE_BUCKET, f"{_model_dir(model_key)}/{version}.joblib", data)
+    # two uploads of the same product line finishing together both save, the last one becomes the latest
+    store.write(MODEL_STORE_BUCKET, f"{_model_dir(model_key)}/latest", version.encode())
+    logger.info(
+        f"Saved topic model {model_key}/{version} ({len(data) / 1024:.0f} KB)",
+        extra={"model_version": f"{model_key}/{version}", "model_parent": parent, "model_bytes": len(data)},
+    )
+    return f"{model_key}/{version}"
@@ -0,0 +1,47 @@
+import json
+import os
+import logging
+
+import httpx
+from sqlalchemy import event, func, select
+
+logger = logging.getLogger(__name__)
+
+# The API LISTENs on this channel and pushes status changes to the browser
+UPLOAD_EVENTS_CHANNEL = os.getenv("UPLOAD_EVENTS_CHANNEL", "upload_status")
+# Without postgres there is no NOTIFY, a local run posts the events to an API with NOTIFIER_BACKEND=memory
+# instead, e.g. http://localhost:8000/api/v1/uploads/events (the token is the API's UPLOAD_EVENTS_TOKEN)
+UPLOAD_EVENTS_URL = os.getenv("UPLOAD_EVENTS_URL", "")
+UPLOAD_EVENTS_TOKEN = os.getenv("UPLOAD_EVENTS_TOKEN", "")
+
+
+def _post_events(db_session):
+    upload_ids = db_session.info.pop("pending_upload_events", set())
+    for upload_id in sorted(upload_ids):
+        try:
+            httpx.post(
+                UPLOAD_EVENTS_URL, json={"upload_id": upload_id},
+                headers={"X-Upload-Events-Token": UPLOAD_EVENTS_TOKEN}, timeout=5,
+            ).raise_for_status()
+        except httpx.HTTPError as e:
+            # the browser still sees the new status when it next refetches
+            logger.warning(f"Could not post the status event of upload {upload_id}: {e}")
+
+
+def _drop_events(db_session):
+    db_session.info.pop("pending_upload_events", None)
+
+
+def notify_status(db_session, upload):
+    # Postgres delivers a NOTIFY when the transaction commits and drops it on rollback,
+    # so listeners never hear about a status that wasn't saved
+    if db_session.bind.dialect.name != "postgresql":
+        if UPLOAD_EVENTS_URL:
+            # posted the same way, once the transaction commits
+            if not event.contains(db_session, "after_commit", _post_events):
+                event.listen(db_session, "after_commit", _post_events)
+                event.listen(db_session, "after_rollback", _drop_events)
+            db_session.info.setdefault("pending_upload_events", set()).add(upload.id)
+        return
+    payload = json.dumps({"upload_id": upload.id, "user_id": upload.user_id, "status": upload.status})
+    db_session.execute(select(func.pg_notify(UPLOAD_EVENTS_CHANNEL, payload)))
@@ -0,0 +1,111 @@
+import os
+import logging
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+# CPU-bound work spread over processes. Every worker is a plain Process that sends its results back
+# through a Pipe. Unlike ProcessPoolExecutor that needs no semaphores, so it runs on Lambda too, which
+# has no /dev/shm. Workers come from a forkserver rather than a fork of this process: records are
+# analyzed on threads of their own, and a forked child can inherit a lock some other thread held.
+_context = multiprocessing.get_context("forkserver")
+_preload = set()
+
+# None until the first parallel_map finds out whether processes can be started here
+_processes_available = None
+_probe_lock = threading.Lock()
+
+
+def worker_count(setting: str) -> int:
+    # Workers configured by an environment variable, 0 (the default) means one per core
+    return int(os.getenv(setting, "0")) or os.cpu_count() or 1
+
+
+def preload(module: str):
+    # The forkserver imports the module once, so workers don't each import it again.
+    # Only modules registered before the first parallel_map of the container are preloaded.
+    _preload.add(module)
+    _context.set_forkserver_preload(sorted(_preload))
+
+
+def _noop():
+    pass
+
+
+def processes_available() -> bool:
+    global _processes_available
+    if _processes_available is None:
+        with _probe_lock:
+            if _processes_available is None:
+                try:
+                    process = _context.Process(target=_noop, daemon=True)
+                    process.start()
+                    process.join()
+                    _processes_available = process.exitcode == 0
+                except (OSError, NotImplementedError) as e:
+                    logger.warning(f"Worker processes unavailable, parallel work runs on threads: {e}")
+                    _processes_available = False
+    return _processes_available
+
+
+def parallelism(workers: int) -> int:
+    # How many CPU-bound tasks really run at once with this many workers: no more than there are cores,
+    # and one on threads, which hold the GIL
+    workers = min(workers, os.cpu_count() or 1)
+    return workers if workers > 1 and processes_available() else 1
+
+
+def _run_slice(fn: Callable, items: list, connection):
+    try:
+        connection.send((True, [fn(item) for item in items]))
+    except BaseException:
+        connection.send((False, traceback.format_exc()))
+    finally:
+        connection.close()
+
+
+def _map_in_processes(fn: Callable, items: list, workers: int, name: str) -> list:
+    # Worker i gets items i, i + workers, ... so every worker is started once, whatever the number of items
+    started = []
+    try:
+        for i in range(workers):
+            receiver, sender = _context.Pipe(duplex=False)
+            process = _context.Process(target=_run_slice, args=(fn, items[i::workers], sender), name=f"{name}-{i}", daemon=True)
+            process.start()
+            sender.close()
+            started.append((process, receiver))
+
+        results = [None] * len(items)
+        for i, (process, receiver) in enumerate(started):
+            try:
+                ok, payload = receiver.recv()
+            except EOFError:
+                process.join()
+                raise RuntimeError(f"{name} worker {i} exited with code {process.exitcode}")
+            if not ok:
+                raise RuntimeError(f"{name} worker {i} failed:\n{payload}")
+            results[i::workers] = payload
+        return results
+    finally:
+        for process, receiver in started:
+            receiver.close()
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+
+def parallel_map(fn: Callable, items, workers: int, name: str) -> List:
+    # [fn(item) for item in items] on up to `workers` processes, in order. fn and the items must pickle.
+    # Falls back to threads where processes can't be started.
+    items = list(items)
+    workers = min(workers, len(items))
+    if workers <= 1:
+        return [fn(item) for item in items]
+    if processes_available():
+        return _map_in_processes(fn, items, workers, name)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name) as executor:
+        return list(executor.map(fn, items))
@@ -0,0 +1,86 @@
+import os
+import logging
+import threading
+from typing import List
+
+import nltk
+import numpy as np
+import pandas as pd
+from nltk.sentiment.vader import SentimentIntensityAnalyzer
+
+import pools
+
+logger = logging.getLogger(__name__)
+
+# Make sure that nltk finds its data files
+nltk.data.path.append(os.path.join(os.path.dirname(__file__), "nltk_data"))
+
+SENTIMENT_WORKERS = pools.worker_count("SENTIMENT_WORKERS")
+# Below this many unique texts the pool startup costs more than it saves
+SENTIMENT_PARALLEL_THRESHOLD = int(os.getenv("SENTIMENT_PARALLEL_THRESHOLD", "20000"))
+SENTIMENT_MEMO_SIZE = int(os.getenv("SENTIMENT_MEMO_SIZE", "200000"))
+
+# Built on first use and then kept for the life of the container
+sia = None
+_sia_lock = threading.Lock()
+
+# Compound scores of texts already seen by this container
+_memo = {}
+
+
+def get_analyzer() -> SentimentIntensityAnalyzer:
+    global sia
+    if sia is None:
+        with _sia_lock:
+            if sia is None:
+                sia = SentimentIntensityAnalyzer()
+    return sia
+
+
+def _score_batch(texts: List[str]) -> List[float]:
+    analyzer = get_analyzer()
+    return [analyzer.polarity_scores(text)['compound'] for text in texts]
+
+
+pools.preload(__name__)
+
+
+def _score_parallel(texts: List[str]) -> List[float]:
+    # one chunk per worker process, each scores its chunk with its own analyzer
+    chunk_size = -(-len(texts) // SENTIMENT_WORKERS)
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    return [score for chunk_scores in pools.parallel_map(_score_batch, chunks, SENTIMENT_WORKERS, "sentiment") for score in chunk_scores]
+
+
+def compound_scores(texts: pd.Series) -> np.ndarray:
+    # Scores every unique text exactly once and returns one compound score per input row
+    codes, uniques = pd.factorize(texts)
+    unique_scores = np.empty(len(uniques), dtype=np.float64)
+
+    to_score = []
+    to_score_positions = []
+    for position, text in enumerate(uniques):
+        score = _memo.get(text)
+        if score is None:
+            to_score.append(text)
+            to_score_positions.append(position)
+        else:
+            unique_scores[position] = score
+
+    if to_score:
+        # threads wouldn't score any faster, so without worker processes everything is scored here
+        if pools.parallelism(SENTIMENT_WORKERS) > 1 and len(to_score) >= SENTIMENT_PARALLEL_THRESHOLD:
+            scores = _score_parallel(to_score)
+        else:
+            scores = _score_batch(to_score)
+        unique_scores[to_score_positions] = scores
+
+        if len(_memo) + len(to_score) > SENTIMENT_MEMO_SIZE:
+            _memo.clear()
+        _memo.update(zip(to_score[:SENTIMENT_MEMO_SIZE], scores))
+
+    logger.info(
+        f"Scored sentiment for {len(texts)} rows, {len(uniques)} unique, {len(to_score)} new",
+        extra={"sentiment_rows": len(texts), "sentiment_unique": len(uniques), "sentiment_scored": len(to_score)},
+    )
+    return unique_scores[codes]
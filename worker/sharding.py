@@ -0,0 +1,513 @@
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from typing import List, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+from ingest import IngestStats, fetch_reviews, read_cleaned_reviews
+from instrumentation import StageMetrics, span
+from model_store import MODEL_STORE_BUCKET, save_model
+import pools
+from sentiment import compound_scores, get_analyzer
+from storage import get_file_store
+from summarizer import SUMMARY_MAX_REVIEWS, pack_feedback, summarize_topics
+from topics import fit_topic_model, select_n_topics
+from vectorizers import MAX_DF, MIN_DF, pruning_mask, weighted_doc_freq
+from worker import clean_series, clean_text
+
+logger = logging.getLogger(__name__)
+
+# Files too large for one invocation are analyzed map-reduce style. The object is split into byte ranges
+# that start and end on row boundaries, map tasks parse, clean, count and score one range each and write
+# their partial statistics to SHARD_BUCKET, and the reduce merges them, fits the topic model and builds
+# the usual results. Only the counts come back to the reduce, never the reviews themselves.
+# Off unless both a threshold and a bucket are set.
+SHARD_THRESHOLD_MB = float(os.getenv("SHARD_THRESHOLD_MB", "0"))
+SHARD_SIZE_MB = float(os.getenv("SHARD_SIZE_MB", "64"))
+SHARD_BUCKET = os.getenv("SHARD_BUCKET", "")
+# "process" runs the tasks in a local process pool, "sqs" sends them to other invocations of the function
+# through SHARD_QUEUE_URL, and "queue" hands them to consumer processes through a directory standing in
+# for SQS, to run the same way locally
+SHARD_BACKEND = os.getenv("SHARD_BACKEND", "process")
+SHARD_WORKERS = pools.worker_count("SHARD_WORKERS")
+SHARD_QUEUE_DIR = os.getenv("SHARD_QUEUE_DIR", "/tmp/shard-queue")
+# A claimed task that isn't done after this long is handed out again, like the SQS visibility timeout
+SHARD_TASK_TIMEOUT_SECONDS = float(os.getenv("SHARD_TASK_TIMEOUT_SECONDS", "900"))
+# The function must consume this queue too (an event source mapping with ReportBatchItemFailures)
+SHARD_QUEUE_URL = os.getenv("SHARD_QUEUE_URL", "")
+# How long the coordinating invocation waits for the outcomes of its queued tasks, within its own timeout
+SHARD_WAIT_SECONDS = float(os.getenv("SHARD_WAIT_SECONDS", "840"))
+
+# The object is scanned for row boundaries this many bytes at a time
+_SCAN_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def should_shard(size_bytes: int) -> bool:
+    return bool(SHARD_THRESHOLD_MB and SHARD_BUCKET) and size_bytes > SHARD_THRESHOLD_MB * 1024 * 1024
+
+
+def plan_shards(bucket: str, key: str, shard_bytes: int) -> dict:
+    # Byte ranges of about shard_bytes that each hold whole rows, and where the header row ends.
+    # A newline only ends a row outside quotes. Quotes inside a field are doubled, so a newline is outside
+    # quotes exactly when an even number of quotes comes before it, which takes one pass over the object.
+    store = get_file_store()
+    size = store.size(bucket, key)
+    header_end = None
+    boundaries = []
+    next_target = None
+    parity = 0
+    position = 0
+    while position < size:
+        block = np.frombuffer(store.read_range(bucket, key, position, min(position + _SCAN_BLOCK_SIZE, size)), dtype=np.uint8)
+        # quote parity after every byte, a uint8 running count overflows but keeps its parity
+        inside_quotes = (np.cumsum(block == ord('"'), dtype=np.uint8) + parity) & 1
+        row_starts = position + np.flatnonzero((block == ord('\n')) & (inside_quotes == 0)) + 1
+        parity = int(inside_quotes[-1])
+
+        if header_end is None and len(row_starts):
+            header_end = int(row_starts[0])
+            boundaries.append(header_end)
+            next_target = header_end + shard_bytes
+        while next_target is not None:
+            i = np.searchsorted(row_starts, next_target)
+            if i == len(row_starts): break
+            boundaries.append(int(row_starts[i]))
+            next_target = int(row_starts[i]) + shard_bytes
+        position += len(block)
+
+    if header_end is None:
+        # a header without rows
+        return {"header_end": size, "shards": []}
+    if boundaries[-1] < size:
+        boundaries.append(size)
+    return {"header_end": header_end, "shards": [[start, end] for start, end in zip(boundaries, boundaries[1:])]}
+
+
+def _read_shard(task: dict, destination: str):
+    # The header followed by the shard's rows, a small CSV file of its own
+    store = get_file_store()
+    with open(destination, "wb") as f:
+        f.write(store.read_range(task["bucket"], task["key"], 0, task["header_end"]))
+        f.write(store.read_range(task["bucket"], task["key"], task["start"], task["end"]))
+
+
+def map_shard(task: dict) -> dict:
+    # Parses, cleans and counts one shard and scores the sentiment of its reviews. Identical reviews
+    # are counted once, codes maps every row to its unique review. Rows are numbered from the shard start.
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "shard.csv")
+        _read_shard(task, path)
+        stats = IngestStats()
+        modeling_df = read_cleaned_reviews(path, clean_series, stats)
+
+    codes, uniques = pd.factorize(modeling_df['cleaned_feedback'])
+    terms, counts = np.array([], dtype=object), sparse.csr_matrix((len(uniques), 0), dtype=np.int32)
+    if len(uniques):
+        vectorizer = CountVectorizer(stop_words='english')
+        try:
+            counts = vectorizer.fit_transform(uniques).astype(np.int32)
+            terms = vectorizer.get_feature_names_out()
+        except ValueError:
+            # nothing but stop words in this shard
+            pass
+
+    partial = {
+        "rows": stats.rows,
+        "doc_ids": modeling_df['doc_id'].to_numpy(),
+        "codes": codes.astype(np.int32),
+        "terms": terms,
+        "counts": counts,
+        "sentiment": compound_scores(pd.Series(uniques, dtype=object)).astype(np.float32),
+    }
+    buffer = io.BytesIO()
+    joblib.dump(partial, buffer)
+    output_key = f"shards/{task['job_id']}/map-{task['shard']}.joblib"
+    get_file_store().write(SHARD_BUCKET, output_key, buffer.getvalue())
+    logger.info(
+        f"Mapped shard {task['shard']}: {stats.rows} rows, {len(uniques)} unique reviews",
+        extra={"shard": task["shard"], "shard_rows": stats.rows, "shard_bad_lines": stats.bad_lines},
+    )
+    return {"output_key": output_key, "rows": stats.rows}
+
+
+def fetch_shard_reviews(task: dict) -> dict:
+    # Raw text of a few rows of one shard, rows numbered from the shard start
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "shard.csv")
+        _read_shard(task, path)
+        found = fetch_reviews(path, task["rows"])
+    return {"texts": {str(row): text for row, text in found.items()}}
+
+
+TASKS = {"map": map_shard, "fetch": fetch_shard_reviews}
+pools.preload(__name__)
+
+
+def _run_task(task_name: str, payload: dict) -> dict:
+    # The outcome a queue consumer reports back, a failed task is not retried
+    try:
+        return {"result": TASKS[task_name](payload)}
+    except Exception as e:
+        logger.error(f"Shard task {task_name} of shard {payload.get('shard')} failed: {e}")
+        return {"error": str(e)}
+
+
+def _results(outcomes: List[dict]) -> List[dict]:
+    failed = [outcome["error"] for outcome in outcomes if "error" in outcome]
+    if failed:
+        raise RuntimeError(f"{len(failed)} shard tasks failed, the first with: {failed[0]}")
+    return [outcome["result"] for outcome in outcomes]
+
+
+class ProcessPoolBackend:
+    # Shard tasks on worker processes of this invocation
+    def __init__(self, workers: int):
+        self.workers = workers
+
+    def run(self, task_name: str, tasks: List[dict]) -> List[dict]:
+        return pools.parallel_map(TASKS[task_name], tasks, self.workers, "shard")
+
+
+class FilesystemQueueBackend:
+    # Stand-in for SQS and the invocations consuming it. A message is a JSON file in <directory>/pending.
+    # A consumer claims it by renaming it into claimed/ (only one rename can win), runs it and writes the
+    # outcome to done/. Claims older than the visibility timeout go back to pending for another consumer.
+    def __init__(self, directory: str, consumers: int, visibility_timeout: float):
+        self.directory = directory
+        self.consumers = consumers
+        self.visibility_timeout = visibility_timeout
+
+    def _path(self, state: str, name: str = "") -> str:
+        return os.path.join(self.directory, state, name)
+
+    def _start_consumer(self) -> subprocess.Popen:
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__), "--consume", self.directory])
+
+    def _requeue_stale_claims(self):
+        for name in os.listdir(self._path("claimed")):
+            try:
+                if time.time() - os.path.getmtime(self._path("claimed", name)) > self.visibility_timeout:
+                    os.rename(self._path("claimed", name), self._path("pending", name))
+                    logger.warning(f"Shard task {name} timed out, queueing it again")
+            except FileNotFoundError:
+                pass
+
+    def run(self, task_name: str, tasks: List[dict]) -> List[dict]:
+        if not tasks: return []
+        for state in ("pending", "claimed", "done"):
+            os.makedirs(self._path(state), exist_ok=True)
+
+        batch = uuid.uuid4().hex
+        names = [f"{batch}-{i:05d}.json" for i in range(len(tasks))]
+        for name, task in zip(names, tasks):
+            _write_json(self._path("pending", name), {"task": task_name, "payload": task})
+
+        consumers = [self._start_consumer() for _ in range(min(self.consumers, len(tasks)))]
+        try:
+            while not all(os.path.exists(self._path("done", name)) for name in names):
+                self._requeue_stale_claims()
+                # consumers leave once the queue is empty, a task that came back needs a new one
+                if os.listdir(self._path("pending")) and all(c.poll() is not None for c in consumers):
+                    consumers.append(self._start_consumer())
+                time.sleep(0.1)
+        finally:
+            for consumer in consumers:
+                if consumer.poll() is None:
+                    consumer.terminate()
+                consumer.wait()
+
+        outcomes = []
+        for name in names:
+            with open(self._path("done", name)) as f:
+                outcomes.append(json.load(f))
+            os.remove(self._path("done", name))
+        return _results(outcomes)
+
+
+class SQSBackend:
+    # Shard tasks on other invocations of the function. Every task is a message on the shard queue,
+    # lambda_handler passes those to run_queued_task, which writes the task's outcome to SHARD_BUCKET.
+    # This invocation waits until every outcome is there. SQS hands a task whose invocation died to
+    # another one once the queue's visibility timeout runs out.
+    def __init__(self, queue_url: str, wait_seconds: float):
+        self.queue_url = queue_url
+        self.wait_seconds = wait_seconds
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    self._client = boto3.client("sqs")
+        return self._client
+
+    def _send(self, messages: List[dict]):
+        # at most 10 messages per request
+        for start in range(0, len(messages), 10):
+            entries = [
+                {"Id": str(i), "MessageBody": json.dumps(message)}
+                for i, message in enumerate(messages[start:start + 10], start)
+            ]
+            response = self.client.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            if response.get("Failed"):
+                raise RuntimeError(f"Could not queue {len(response['Failed'])} shard tasks: {response['Failed'][0].get('Message')}")
+
+    def run(self, task_name: str, tasks: List[dict]) -> List[dict]:
+        if not tasks: return []
+        store = get_file_store()
+        batch = uuid.uuid4().hex
+        outcome_keys = [f"shards/{task['job_id']}/outcomes/{batch}-{i:05d}.json" for i, task in enumerate(tasks)]
+        outcomes = {}
+        try:
+            self._send([
+                {"shard_task": task_name, "payload": task, "outcome_key": outcome_key}
+                for task, outcome_key in zip(tasks, outcome_keys)
+            ])
+            deadline = time.monotonic() + self.wait_seconds
+            while True:
+                for outcome_key in outcome_keys:
+                    if outcome_key not in outcomes:
+                        data = store.read(SHARD_BUCKET, outcome_key)
+                        if data is not None:
+                            outcomes[outcome_key] = json.loads(data)
+                if len(outcomes) == len(outcome_keys): break
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{len(outcome_keys) - len(outcomes)} of {len(outcome_keys)} shard tasks not done after {self.wait_seconds}s")
+                time.sleep(1)
+        finally:
+            # a late redelivery can still write its outcome, a lifecycle rule on shards/ clears those up
+            for outcome_key in outcome_keys:
+                store.delete(SHARD_BUCKET, outcome_key)
+        return _results([outcomes[outcome_key] for outcome_key in outcome_keys])
+
+
+def run_queued_task(message: dict):
+    # Runs a task sent by an SQSBackend and reports its outcome through SHARD_BUCKET.
+    # Raises when the outcome can't be written, SQS then redelivers the message.
+    outcome = _run_task(message["shard_task"], message["payload"])
+    get_file_store().write(SHARD_BUCKET, message["outcome_key"], json.dumps(outcome).encode())
+
+
+def _write_json(path: str, payload: dict):
+    # readers never see a half written message
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(payload, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def consume(directory: str):
+    # Runs queued shard tasks until the queue is empty
+    backend = FilesystemQueueBackend(directory, 0, SHARD_TASK_TIMEOUT_SECONDS)
+    while True:
+        pending = sorted(name for name in os.listdir(backend._path("pending")) if name.endswith(".json"))
+        if not pending: return
+        for name in pending:
+            claimed = backend._path("claimed", name)
+            try:
+                os.rename(backend._path("pending", name), claimed)
+            except FileNotFoundError:
+                # another consumer got it first
+                continue
+            # the claim starts the visibility timeout
+            os.utime(claimed)
+            with open(claimed) as f:
+                message = json.load(f)
+            outcome = _run_task(message["task"], message["payload"])
+            _write_json(backend._path("done", name), outcome)
+            try:
+                os.remove(claimed)
+            except FileNotFoundError:
+                pass
+            break
+
+
+def get_backend():
+    if SHARD_BACKEND == "sqs":
+        return SQSBackend(SHARD_QUEUE_URL, SHARD_WAIT_SECONDS)
+    if SHARD_BACKEND == "queue":
+        return FilesystemQueueBackend(SHARD_QUEUE_DIR, SHARD_WORKERS, SHARD_TASK_TIMEOUT_SECONDS)
+    return ProcessPoolBackend(SHARD_WORKERS)
+
+
+def _merge_counts(parts: List[dict]):
+    # One count matrix over the unique reviews of all shards, in shard order, on the merged vocabulary.
+    # Pruned like the single-file vectorizer, on document frequencies merged over every row of every shard.
+    # Each row is weighted by how many rows of its shard repeat that review.
+    weights = [np.bincount(part["codes"], minlength=part["counts"].shape[0]) for part in parts]
+    n_docs = sum(len(part["codes"]) for part in parts)
+    doc_freq = pd.concat([
+        pd.Series(weighted_doc_freq(part["counts"], part_weights), index=part["terms"])
+        for part, part_weights in zip(parts, weights) if len(part["terms"])
+    ] or [pd.Series(dtype=np.int64)]).groupby(level=0).sum()
+    vocabulary = np.sort(doc_freq.index[pruning_mask(doc_freq.to_numpy(), n_docs, MIN_DF, MAX_DF)].to_numpy())
+
+    columns = pd.Index(vocabulary)
+    matrices = []
+    for part, part_weights in zip(parts, weights):
+        counts = part["counts"].tocoo()
+        mapped = columns.get_indexer(part["terms"])[counts.col] if len(part["terms"]) else counts.col
+        keep = mapped >= 0
+        matrix = sparse.csr_matrix(
+            (counts.data[keep], (counts.row[keep], mapped[keep])), shape=(counts.shape[0], len(vocabulary)), dtype=np.int32
+        )
+        matrices.append(
+            sparse.diags(part_weights, dtype=np.int32) @ matrix if len(part_weights) and part_weights.max() > 1 else matrix
+        )
+    return vocabulary, sparse.vstack(matrices).tocsr()
+
+
+def analyze_sharded(
+    bucket: str, key: str, metadata: Optional[dict] = None, metrics: Optional[StageMetrics] = None,
+    model_key: Optional[str] = None,
+) -> Optional[List[dict]]:
+    # Same results as process_feedback_file for an object that is never downloaded as a whole.
+    # Copies are collapsed within a shard only, near-duplicate detection needs all reviews in one place.
+    metadata = metadata if metadata is not None else {}
+    logger.info(f"--- Starting sharded AI Analysis on {bucket}/{key} ---")
+
+    store = get_file_store()
+    backend = get_backend()
+    job_id = uuid.uuid4().hex
+    output_keys = []
+    try:
+        with span("plan_shards", metrics):
+            plan = plan_shards(bucket, key, int(SHARD_SIZE_MB * 1024 * 1024))
+        shard_tasks = [
+            {"job_id": job_id, "shard": i, "bucket": bucket, "key": key, "header_end": plan["header_end"], "start": start, "end": end}
+            for i, (start, end) in enumerate(plan["shards"])
+        ]
+        metadata["shards"] = len(shard_tasks)
+        if not shard_tasks: return []
+
+        logger.info(f"Mapping {len(shard_tasks)} shards...")
+        with span("map", metrics, shards=len(shard_tasks)):
+            mapped = backend.run("map", shard_tasks)
+        output_keys = [m["output_key"] for m in mapped]
+
+        with span("reduce", metrics):
+            parts = [joblib.load(io.BytesIO(store.read(SHARD_BUCKET, output_key))) for output_key in output_keys]
+            if not sum(len(part["doc_ids"]) for part in parts): return []
+            vocabulary, text_counts = _merge_counts(parts)
+
+        with span("select_topics", metrics):
+            n_topics, topic_sweep = select_n_topics(text_counts)
+        metadata["n_topics"] = n_topics
+        metadata["topic_sweep"] = topic_sweep
+        logger.info(f"Identifying {n_topics} topics with LDA...")
+        with span("lda", metrics, n_topics=n_topics):
+            lda, doc_topic = fit_topic_model(text_counts, n_topics)
+
+        metadata["model_version"] = None
+        if MODEL_STORE_BUCKET and model_key:
+            try:
+                with span("save_model", metrics):
+                    vectorizer = CountVectorizer(stop_words='english', vocabulary=vocabulary)
+                    metadata["model_version"] = save_model(model_key, vectorizer, lda)
+            except Exception as e:
+                logger.error(f"Could not save the topic model for {model_key}: {e}")
+
+        with span("aggregate", metrics):
+            unique_topics = doc_topic.argmax(axis=1)
+            review_count = np.zeros(n_topics, dtype=np.int64)
+            sentiment_sum = np.zeros(n_topics)
+            sample_doc_ids = [[] for _ in range(n_topics)]
+            # file-wide doc_id of the first row of every unique review, in the order of the count matrix
+            representatives = []
+            row_offset = 0
+            unique_offset = 0
+            for part in parts:
+                n_unique = len(part["sentiment"])
+                row_topics = unique_topics[unique_offset:unique_offset + n_unique][part["codes"]]
+                review_count += np.bincount(row_topics, minlength=n_topics)
+                sentiment_sum += np.bincount(row_topics, weights=part["sentiment"][part["codes"]], minlength=n_topics)
+
+                doc_ids = part["doc_ids"] + row_offset
+                # the first 50 reviews of each topic go into its sentiment breakdown, like in the unsharded run
+                for topic_id in range(n_topics):
+                    missing = 50 - len(sample_doc_ids[topic_id])
+                    if missing > 0:
+                        sample_doc_ids[topic_id].extend(doc_ids[row_topics == topic_id][:missing].tolist())
+                _, first_rows = np.unique(part["codes"], return_index=True)
+                representatives.append(doc_ids[first_rows])
+                row_offset += part["rows"]
+                unique_offset += n_unique
+            representatives = np.concatenate(representatives)
+
+            # the reviews that belong most clearly to each topic are the candidates for its summary
+            candidate_doc_ids = []
+            for topic_id in range(n_topics):
+                members = np.flatnonzero(unique_topics == topic_id)
+                best = members[np.argsort(-doc_topic[members, topic_id], kind='stable')[:SUMMARY_MAX_REVIEWS * 2]]
+                candidate_doc_ids.append(representatives[best].tolist())
+
+        # Raw text of the candidates and samples, each shard is read again only for its own rows
+        with span("fetch_reviews", metrics):
+            wanted = sorted({doc_id for doc_ids in candidate_doc_ids + sample_doc_ids for doc_id in doc_ids})
+            shard_row_offsets = np.concatenate([[0], np.cumsum([part["rows"] for part in parts])])
+            shard_of = np.searchsorted(shard_row_offsets, wanted, side="right") - 1
+            fetch_tasks = []
+            for shard in np.unique(shard_of):
+                rows = (np.asarray(wanted)[shard_of == shard] - shard_row_offsets[shard]).tolist()
+                fetch_tasks.append(dict(shard_tasks[shard], rows=rows))
+            raw_reviews = {}
+            for task, fetched in zip(fetch_tasks, backend.run("fetch", fetch_tasks)):
+                offset = int(shard_row_offsets[task["shard"]])
+                raw_reviews.update({int(row) + offset: text for row, text in fetched["texts"].items()})
+
+        final_results = []
+        summary_jobs = []
+        feature_names = vocabulary
+        for topic_id in range(n_topics):
+            if review_count[topic_id] == 0: continue
+            top_words = " ".join(feature_names[i] for i in lda.components_[topic_id].argsort()[:-6:-1])
+
+            sentiment_text_sample = " ".join(clean_text(raw_reviews[doc_id]) for doc_id in sample_doc_ids[topic_id] if doc_id in raw_reviews)
+            feedback_list, prompt_tokens = pack_feedback(
+                (raw_reviews[doc_id] for doc_id in candidate_doc_ids[topic_id] if doc_id in raw_reviews), top_words
+            )
+            summary_jobs.append((feedback_list, top_words))
+            final_results.append({
+                "topic_id": topic_id,
+                "top_words": top_words,
+                "review_count": int(review_count[topic_id]),
+                "avg_sentiment": sentiment_sum[topic_id] / review_count[topic_id],
+                "sentiment_dict": get_analyzer().polarity_scores(sentiment_text_sample),
+                "prompt_tokens": prompt_tokens,
+            })
+
+        with span("summarize", metrics, topics=len(summary_jobs)):
+            summaries = summarize_topics(summary_jobs, metrics=metrics)
+        for topic_result, ai_summary in zip(final_results, summaries):
+            topic_result["ai_summary"] = ai_summary
+
+        logger.info("--- Sharded AI Analysis Complete ---")
+        return final_results
+    except Exception as e:
+        logger.error(f"An unexpected error occurred in sharded worker: {e}")
+        return None
+    finally:
+        for output_key in output_keys:
+            store.delete(SHARD_BUCKET, output_key)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--consume", metavar="QUEUE_DIR", required=True, help="run queued shard tasks until the queue is empty")
+    args = parser.parse_args()
+    consume(args.consume)
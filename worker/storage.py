@@ -0,0 +1,124 @@
+import os
+import json
+import shutil
+import threading
+from typing import Optional
+
+# Where uploaded files are read from. "s3" (the default) or "local:/some/dir", where the
+# local store keeps objects at <dir>/<bucket>/<key> and stands in for S3 when running without AWS.
+# Any S3-compatible service works too, boto3 picks up its address from AWS_ENDPOINT_URL_S3.
+WORKER_FILE_STORE = os.getenv("WORKER_FILE_STORE", "s3")
+
+
+class S3FileStore:
+    def __init__(self):
+        # boto3 is slow to import, so the client is only built on the first download
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    self._client = boto3.client("s3")
+        return self._client
+
+    def download(self, bucket: str, key: str, destination: str):
+        self.client.download_file(bucket, key, destination)
+
+    def metadata(self, bucket: str, key: str) -> dict:
+        # the x-amz-meta-* fields the object was uploaded with, without the prefix
+        return self.client.head_object(Bucket=bucket, Key=key).get("Metadata", {})
+
+    def read(self, bucket: str, key: str) -> Optional[bytes]:
+        try:
+            return self.client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def write(self, bucket: str, key: str, data: bytes):
+        self.client.put_object(Bucket=bucket, Key=key, Body=data)
+
+    def upload(self, source: str, bucket: str, key: str):
+        # multipart for large files
+        self.client.upload_file(source, bucket, key)
+
+    def size(self, bucket: str, key: str) -> int:
+        return self.client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+
+    def read_range(self, bucket: str, key: str, start: int, end: int) -> bytes:
+        # bytes [start, end) of the object
+        return self.client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end - 1}")["Body"].read()
+
+    def delete(self, bucket: str, key: str):
+        self.client.delete_object(Bucket=bucket, Key=key)
+
+
+class LocalFileStore:
+    def __init__(self, root: str):
+        self.root = root
+
+    def path_for(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, key)
+
+    def download(self, bucket: str, key: str, destination: str):
+        shutil.copyfile(self.path_for(bucket, key), destination)
+
+    def metadata(self, bucket: str, key: str) -> dict:
+        # kept next to the object as <key>.metadata.json
+        path = self.path_for(bucket, key) + ".metadata.json"
+        if not os.path.exists(path): return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def read(self, bucket: str, key: str) -> Optional[bytes]:
+        path = self.path_for(bucket, key)
+        if not os.path.exists(path): return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def write(self, bucket: str, key: str, data: bytes):
+        path = self.path_for(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # readers never see a half written object
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(data)
+        os.replace(temporary_path, path)
+
+    def upload(self, source: str, bucket: str, key: str):
+        path = self.path_for(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(source, path)
+
+    def size(self, bucket: str, key: str) -> int:
+        return os.path.getsize(self.path_for(bucket, key))
+
+    def read_range(self, bucket: str, key: str, start: int, end: int) -> bytes:
+        with open(self.path_for(bucket, key), "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def delete(self, bucket: str, key: str):
+        try:
+            os.remove(self.path_for(bucket, key))
+        except FileNotFoundError:
+            pass
+
+
+_file_store = None
+_file_store_lock = threading.Lock()
+
+
+def get_file_store():
+    global _file_store
+    if _file_store is None:
+        with _file_store_lock:
+            if _file_store is None:
+                if WORKER_FILE_STORE.startswith("local:"):
+                    _file_store = LocalFileStore(WORKER_FILE_STORE[len("local:"):])
+                else:
+                    _file_store = S3FileStore()
+    return _file_store
@@ -0,0 +1,185 @@
+import os
+import random
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+import openai
+from dotenv import load_dotenv
+
+from summary_cache import make_cache_key, summary_cache
+from instrumentation import StageMetrics, span
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+SUMMARY_MODEL = "google/gemma-3-27b-it:free"
+
+PROMPT_TEMPLATE = (
+    "You are a product analyst summarizing customer feedback about '{topic_keywords}'.\n"
+    "Here is the raw feedback:\n- {feedback_str}\n\n"
+    "Please write a single, coherent paragraph that summarizes the key points and sentiments expressed."
+)
+
+# Tuning knobs for the summarization stage
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_MAX_RETRIES = int(os.getenv("SUMMARY_MAX_RETRIES", "3"))
+SUMMARY_TIMEOUT_SECONDS = float(os.getenv("SUMMARY_TIMEOUT_SECONDS", "30"))
+SUMMARY_BACKOFF_SECONDS = float(os.getenv("SUMMARY_BACKOFF_SECONDS", "1"))
+
+# Prompt size, which sets the cost and latency of every call. Tokens are estimated from the length
+# (about 4 characters per token of English text), close enough to keep calls under the budget
+# without loading the model's tokenizer.
+SUMMARY_PROMPT_TOKENS = int(os.getenv("SUMMARY_PROMPT_TOKENS", "1200"))
+SUMMARY_REVIEW_MAX_TOKENS = int(os.getenv("SUMMARY_REVIEW_MAX_TOKENS", "200"))
+SUMMARY_MAX_REVIEWS = int(os.getenv("SUMMARY_MAX_REVIEWS", "10"))
+CHARS_PER_TOKEN = 4
+# Not worth adding a review when less than this much of the budget is left for it
+MIN_REVIEW_TOKENS = 16
+
+# Built on first use and then kept for the life of the container
+client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> openai.OpenAI:
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                # Configure client for openrouter.ai
+                # Retries are handled by us, so the sdk should not retry on its own
+                client = openai.OpenAI(
+                    base_url="https://openrouter.ai/api/v1",
+                    api_key=os.getenv("OPENROUTER_API_KEY") or "",
+                    max_retries=0,
+                )
+    return client
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    # Cuts the text at the last whole word that fits
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars: return text
+    cut = text[:max_chars - 3]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut + "..."
+
+
+def build_prompt(feedback_list: List[str], topic_keywords: str) -> str:
+    return PROMPT_TEMPLATE.format(topic_keywords=topic_keywords, feedback_str="\n- ".join(feedback_list))
+
+
+def pack_feedback(reviews: Iterable[str], topic_keywords: str) -> Tuple[List[str], int]:
+    # Takes reviews best first and keeps as many as fit in the prompt budget, skipping repeats and
+    # cutting each one to SUMMARY_REVIEW_MAX_TOKENS. Returns them with the estimated tokens of the prompt.
+    feedback_list = []
+    seen = set()
+    used = estimate_tokens(build_prompt([], topic_keywords))
+    for review in reviews:
+        # one line per review, so the list in the prompt stays a list
+        text = " ".join(review.split())
+        if not text or text.lower() in seen: continue
+        seen.add(text.lower())
+
+        # each review after the first also costs a separator
+        remaining = SUMMARY_PROMPT_TOKENS - used - (1 if feedback_list else 0)
+        if remaining < MIN_REVIEW_TOKENS: break
+        text = truncate_to_tokens(text, min(SUMMARY_REVIEW_MAX_TOKENS, remaining))
+        used += estimate_tokens(text) + (1 if feedback_list else 0)
+        feedback_list.append(text)
+        if len(feedback_list) == SUMMARY_MAX_REVIEWS: break
+
+    return feedback_list, estimate_tokens(build_prompt(feedback_list, topic_keywords))
+
+
+def _is_retryable(error: Exception) -> bool:
+    # Rate limits, server errors and network problems are worth another try
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _summarize(feedback_list: List[str], topic_keywords: str, metrics: Optional[StageMetrics] = None) -> Tuple[str, str]:
+    # Returns (summary, source) where source is 'memory', 'db', 'llm' or 'error'
+    client = get_client()
+    if not client.api_key: return "OpenRouter API key not found.", "error"
+
+    cache_key = make_cache_key(SUMMARY_MODEL, PROMPT_TEMPLATE, topic_keywords, feedback_list)
+    cached_summary, tier = summary_cache.get(cache_key)
+    if cached_summary is not None:
+        return cached_summary, tier
+
+    prompt = build_prompt(feedback_list, topic_keywords)
+
+    attempt = 0
+    while True:
+        try:
+            with span(
+                "llm_call", metrics, per_thread=True,
+                topic_keywords=topic_keywords, attempt=attempt, prompt_tokens=estimate_tokens(prompt),
+            ):
+                response = client.chat.completions.create(
+                    # we can change the url here
+                    extra_headers={"HTTP-Referer": "http://localhost:3000", "X-Title": "ProductPulse"},
+                    model=SUMMARY_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=250, temperature=0.7,
+                    timeout=SUMMARY_TIMEOUT_SECONDS,
+                )
+            summary = response.choices[0].message.content.strip()
+            summary_cache.set(cache_key, SUMMARY_MODEL, summary)
+            return summary, "llm"
+        except Exception as e:
+            if attempt < SUMMARY_MAX_RETRIES and _is_retryable(e):
+                # Exponential backoff with jitter so parallel calls don't retry in lockstep
+                delay = SUMMARY_BACKOFF_SECONDS * (2 ** attempt) + random.uniform(0, SUMMARY_BACKOFF_SECONDS)
+                attempt += 1
+                logger.warning(f"Summary call for '{topic_keywords}' failed ({e}), retry {attempt}/{SUMMARY_MAX_RETRIES} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            return f"AI summary could not be generated due to an API error: {e}", "error"
+
+
+def get_ai_summary(feedback_list: List[str], topic_keywords: str) -> str:
+    # Used free model from openrouter for summarization, answered from the cache when possible
+    return _summarize(feedback_list, topic_keywords)[0]
+
+
+def summarize_topics(jobs: List[Tuple[List[str], str]], max_workers: Optional[int] = None, metrics: Optional[StageMetrics] = None) -> List[str]:
+    # Sends all topic prompts at once, bounded by the concurrency cap.
+    # jobs is a list of (feedback_list, topic_keywords), summaries come back in the same order.
+    if not jobs: return []
+
+    max_workers = max(1, min(max_workers or SUMMARY_CONCURRENCY, len(jobs)))
+    logger.info(f"Generating {len(jobs)} topic summaries with concurrency {max_workers}...")
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summary") as executor:
+        outcomes = list(executor.map(lambda job: _summarize(*job, metrics=metrics), jobs))
+
+    sources = Counter(source for _, source in outcomes)
+    hits = sources["memory"] + sources["db"]
+    logger.info(
+        f"Summary cache: {hits} hits, {sources['llm']} misses",
+        extra={
+            "summary_cache_hits": hits,
+            "summary_cache_memory_hits": sources["memory"],
+            "summary_cache_db_hits": sources["db"],
+            "summary_cache_misses": sources["llm"],
+            "summary_errors": sources["error"],
+        },
+    )
+    summary_cache.purge_expired()
+
+    return [summary for summary, _ in outcomes]
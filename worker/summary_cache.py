@@ -0,0 +1,131 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "512"))
+SUMMARY_CACHE_TTL_HOURS = float(os.getenv("SUMMARY_CACHE_TTL_HOURS", "720"))
+SUMMARY_CACHE_PERSIST = os.getenv("SUMMARY_CACHE_PERSIST", "true").lower() == "true"
+
+
+def make_cache_key(model: str, prompt_template: str, topic_keywords: str, feedback_list: List[str]) -> str:
+    # Same model, prompt and input always produce the same key
+    payload = json.dumps([model, prompt_template, topic_keywords, feedback_list], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    # Two tier cache for AI summaries: an in-process LRU in front of the summary_cache table
+
+    def __init__(self, max_size: int = SUMMARY_CACHE_SIZE, ttl_hours: float = SUMMARY_CACHE_TTL_HOURS, persist: bool = SUMMARY_CACHE_PERSIST):
+        self.max_size = max_size
+        self.ttl = timedelta(hours=ttl_hours)
+        self.persist = persist
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._session_factory = None
+
+    def _open_session(self):
+        # The database is only imported once the persistent tier is used, so the worker modules import
+        # without one (benchmarks, notebooks). When none is configured the cache stays memory-only.
+        if self._session_factory is None:
+            try:
+                from database import SessionLocal
+            except (ImportError, ValueError, SQLAlchemyError) as e:
+                logger.warning(f"No database for the summary cache, keeping summaries in memory only: {e}")
+                self.persist = False
+                return None
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def get(self, key: str) -> Tuple[Optional[str], Optional[str]]:
+        # Returns (summary, tier) where tier is 'memory', 'db' or None on a miss
+        now = datetime.now(timezone.utc)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                summary, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    return summary, "memory"
+                del self._entries[key]
+
+        db = self._open_session() if self.persist else None
+        if db is None:
+            return None, None
+
+        from models import SummaryCacheEntry
+        try:
+            row = db.get(SummaryCacheEntry, key)
+            if row is None or _as_utc(row.expires_at) <= now:
+                return None, None
+            self._remember(key, row.summary, _as_utc(row.expires_at))
+            return row.summary, "db"
+        except SQLAlchemyError as e:
+            logger.warning(f"Summary cache lookup failed, treating as a miss: {e}")
+            return None, None
+        finally:
+            db.close()
+
+    def set(self, key: str, model: str, summary: str):
+        expires_at = datetime.now(timezone.utc) + self.ttl
+        self._remember(key, summary, expires_at)
+
+        db = self._open_session() if self.persist else None
+        if db is None:
+            return
+
+        from models import SummaryCacheEntry
+        try:
+            db.merge(SummaryCacheEntry(cache_key=key, model=model, summary=summary, expires_at=expires_at))
+            db.commit()
+        except SQLAlchemyError as e:
+            # Another job may have stored the same key first, the cache is best effort anyway
+            db.rollback()
+            logger.warning(f"Could not persist summary cache entry: {e}")
+        finally:
+            db.close()
+
+    def purge_expired(self) -> int:
+        # TTL eviction for the persistent tier
+        db = self._open_session() if self.persist else None
+        if db is None:
+            return 0
+
+        from models import SummaryCacheEntry
+        try:
+            deleted = db.query(SummaryCacheEntry).filter(
+                SummaryCacheEntry.expires_at <= datetime.now(timezone.utc)
+            ).delete(synchronize_session=False)
+            db.commit()
+            return deleted
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.warning(f"Could not purge expired summary cache entries: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def _remember(self, key: str, summary: str, expires_at: datetime):
+        with self._lock:
+            self._entries[key] = (summary, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # sqlite hands back naive datetimes, postgres aware ones
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+summary_cache = SummaryCache()
@@ -0,0 +1,59 @@
+# The worker reads its configuration at import time, so the tests point it at sqlite and a local
+# file store before anything imports it
+
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+WORKER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_tmp = tempfile.mkdtemp(prefix="worker-tests-")
+
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_tmp}/worker.db",
+    WORKER_FILE_STORE=f"local:{_tmp}/store",
+    OPENROUTER_API_KEY="test",
+    N_TOPICS="5",
+    SUMMARY_CACHE_PERSIST="false",
+    DOCUMENTS_BUCKET="",
+    MODEL_STORE_BUCKET="",
+    UPLOAD_EVENTS_URL="",
+)
+sys.path[:0] = [WORKER_DIR, os.path.join(WORKER_DIR, "benchmarks")]
+
+BUCKET = "uploads"
+
+
+@pytest.fixture
+def database():
+    # empty tables for every test
+    import database
+    from models import Base
+
+    Base.metadata.drop_all(bind=database.engine)
+    Base.metadata.create_all(bind=database.engine)
+    return database
+
+
+@pytest.fixture
+def put_file():
+    # Puts a copy of the sample reviews into the bucket under the given key
+    def put(key: str, source: str = os.path.join(WORKER_DIR, "sample.csv")):
+        path = os.path.join(_tmp, "store", BUCKET, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copy(source, path)
+    return put
+
+
+@pytest.fixture(autouse=True)
+def stub_llm(monkeypatch):
+    import summarizer
+    from stubs import StubLLMClient
+
+    monkeypatch.setattr(summarizer, "client", StubLLMClient(0))
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_tmp, ignore_errors=True)
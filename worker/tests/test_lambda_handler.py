@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta, timezone
+
+import lambda_function
+import worker
+from conftest import BUCKET
+from counters import ANALYSIS_RESULTS, UPLOADS, status_counter
+from events import s3_sqs_record, sqs_event
+from models import AnalysisResult, AnalyticsCounter, Upload
+
+
+def _state(database):
+    # (uploads as (filename, status), number of results, counters by name)
+    db = database.SessionLocal()
+    try:
+        uploads = sorted((u.filename, u.status) for u in db.query(Upload))
+        results = db.query(AnalysisResult).count()
+        counters = {c.name: c.value for c in db.query(AnalyticsCounter) if c.value}
+        return uploads, results, counters
+    finally:
+        db.close()
+
+
+def _failing_analysis(*args, **kwargs):
+    raise RuntimeError("analysis failed")
+
+
+def test_mixed_batch_reports_only_the_failed_record(database, put_file):
+    put_file("1/good.csv")
+    not_json = {"messageId": "m-invalid", "body": "not json"}
+    event = sqs_event([
+        s3_sqs_record("m-good", BUCKET, "1/good.csv"),
+        s3_sqs_record("m-missing", BUCKET, "1/missing.csv"),
+        not_json,
+    ])
+
+    response = lambda_function.lambda_handler(event, None)
+
+    # the missing file is retried, the invalid message is dropped
+    assert response == {"batchItemFailures": [{"itemIdentifier": "m-missing"}]}
+    uploads, results, counters = _state(database)
+    assert uploads == [("good.csv", "completed")]
+    assert results > 0
+    assert counters == {UPLOADS: 1, status_counter("completed"): 1, ANALYSIS_RESULTS: results}
+
+
+def test_redelivered_message_reanalyzes_the_failed_upload(database, put_file, monkeypatch):
+    put_file("1/reviews.csv")
+    event = sqs_event([s3_sqs_record("m1", BUCKET, "1/reviews.csv")])
+
+    with monkeypatch.context() as patch:
+        patch.setattr(worker, "process_feedback_file", _failing_analysis)
+        assert lambda_function.lambda_handler(event, None) == {"batchItemFailures": [{"itemIdentifier": "m1"}]}
+    assert _state(database) == ([("reviews.csv", "failed")], 0, {UPLOADS: 1, status_counter("failed"): 1})
+
+    assert lambda_function.lambda_handler(event, None) == {"batchItemFailures": []}
+    uploads, results, counters = _state(database)
+    assert uploads == [("reviews.csv", "completed")]
+    assert counters == {UPLOADS: 1, status_counter("completed"): 1, ANALYSIS_RESULTS: results}
+
+    # once completed, further deliveries change nothing
+    assert lambda_function.lambda_handler(event, None) == {"batchItemFailures": []}
+    assert _state(database) == (uploads, results, counters)
+
+
+def test_duplicate_key_in_one_batch_is_analyzed_once(database, put_file):
+    put_file("1/reviews.csv")
+    event = sqs_event([s3_sqs_record(f"m{i}", BUCKET, "1/reviews.csv") for i in range(3)])
+
+    assert lambda_function.lambda_handler(event, None) == {"batchItemFailures": []}
+
+    uploads, results, counters = _state(database)
+    db = database.SessionLocal()
+    topics = db.query(AnalysisResult.topic_id).distinct().count()
+    db.close()
+    assert uploads == [("reviews.csv", "completed")]
+    # one result per topic, not one set per delivery
+    assert results == topics
+    assert counters == {UPLOADS: 1, status_counter("completed"): 1, ANALYSIS_RESULTS: results}
+
+
+def _leave_processing(database, filename: str, message_id: str, claimed_at: datetime):
+    # An upload whose analysis died midway, with the results it had saved and its counters
+    db = database.SessionLocal()
+    upload = Upload(filename=filename, status="processing", user_id=1, claimed_by=message_id, claimed_at=claimed_at)
+    db.add(upload)
+    db.flush()
+    db.add(AnalysisResult(upload_id=upload.id, topic="stale", review_count=1))
+    db.add_all([
+        AnalyticsCounter(name=UPLOADS, value=1),
+        AnalyticsCounter(name=status_counter("processing"), value=1),
+        AnalyticsCounter(name=ANALYSIS_RESULTS, value=1),
+    ])
+    db.commit()
+    db.close()
+
+
+def test_abandoned_claim_is_taken_over_and_its_results_replaced(database, put_file):
+    put_file("1/reviews.csv")
+    _leave_processing(database, "reviews.csv", "m-dead", datetime.now(timezone.utc) - timedelta(hours=1))
+
+    event = sqs_event([s3_sqs_record("m-new", BUCKET, "1/reviews.csv")])
+    assert lambda_function.lambda_handler(event, None) == {"batchItemFailures": []}
+
+    uploads, results, counters = _state(database)
+    db = database.SessionLocal()
+    assert db.query(AnalysisResult).filter(AnalysisResult.topic == "stale").count() == 0
+    db.close()
+    assert uploads == [("reviews.csv", "completed")]
+    assert counters == {UPLOADS: 1, status_counter("completed"): 1, ANALYSIS_RESULTS: results}
+
+
+def test_live_claim_is_left_alone(database, put_file):
+    put_file("1/reviews.csv")
+    _leave_processing(database, "reviews.csv", "m-other", datetime.now(timezone.utc))
+    before = _state(database)
+
+    # a duplicate delivery is acknowledged, the message holding the claim does the work
+    event = sqs_event([s3_sqs_record("m-duplicate", BUCKET, "1/reviews.csv")])
+    assert lambda_function.lambda_handler(event, None) == {"batchItemFailures": []}
+    assert _state(database) == before
+
+    # the holder's own redelivery is retried until its claim runs out
+    event = sqs_event([s3_sqs_record("m-other", BUCKET, "1/reviews.csv")])
+    assert lambda_function.lambda_handler(event, None) == {"batchItemFailures": [{"itemIdentifier": "m-other"}]}
+    assert _state(database) == before
@@ -0,0 +1,224 @@
+import os
+import time
+import logging
+from functools import partial
+from typing import Optional, Tuple
+
+import numpy as np
+from sklearn.decomposition import LatentDirichletAllocation
+
+import pools
+
+logger = logging.getLogger(__name__)
+
+# Above this many documents LDA switches from batch to online (mini-batch) learning
+LDA_ONLINE_THRESHOLD = int(os.getenv("LDA_ONLINE_THRESHOLD", "50000"))
+LDA_BATCH_SIZE = int(os.getenv("LDA_BATCH_SIZE", "4096"))
+LDA_MAX_EPOCHS = int(os.getenv("LDA_MAX_EPOCHS", "10"))
+# Online learning stops once an epoch improves perplexity by less than this fraction
+LDA_PERPLEXITY_TOL = float(os.getenv("LDA_PERPLEXITY_TOL", "0.01"))
+LDA_EVAL_SAMPLE = int(os.getenv("LDA_EVAL_SAMPLE", "5000"))
+
+# Topic count sweep. Setting N_TOPICS skips the sweep and uses a fixed count.
+N_TOPICS = os.getenv("N_TOPICS")
+DEFAULT_N_TOPICS = 7
+TOPIC_COUNT_MIN = int(os.getenv("TOPIC_COUNT_MIN", "3"))
+TOPIC_COUNT_MAX = int(os.getenv("TOPIC_COUNT_MAX", "12"))
+TOPIC_SWEEP_SAMPLE = int(os.getenv("TOPIC_SWEEP_SAMPLE", "2000"))
+TOPIC_SWEEP_WORKERS = pools.worker_count("TOPIC_SWEEP_WORKERS")
+TOPIC_SWEEP_BUDGET_SECONDS = float(os.getenv("TOPIC_SWEEP_BUDGET_SECONDS", "15"))
+# EM iterations per round of successive halving, half of the candidates are dropped after each round
+TOPIC_SWEEP_ROUNDS = [int(n) for n in os.getenv("TOPIC_SWEEP_ROUNDS", "3,10").split(",")]
+# Coherence of a model fitted for fewer EM iterations than this says little about its k
+TOPIC_SWEEP_MIN_ITER = int(os.getenv("TOPIC_SWEEP_MIN_ITER", "3"))
+
+
+def fit_online_lda(text_counts, n_topics: int, random_state: int = 42) -> LatentDirichletAllocation:
+    # Streams the documents through partial_fit one mini-batch at a time, using every core for the E-step
+    n_docs = text_counts.shape[0]
+    rng = np.random.RandomState(random_state)
+    eval_rows = rng.choice(n_docs, size=min(LDA_EVAL_SAMPLE, n_docs), replace=False)
+    eval_counts = text_counts[eval_rows]
+
+    lda = LatentDirichletAllocation(
+        n_components=n_topics,
+        learning_method='online',
+        batch_size=LDA_BATCH_SIZE,
+        total_samples=n_docs,
+        n_jobs=-1,
+        random_state=random_state,
+    )
+
+    previous_perplexity = None
+    for epoch in range(LDA_MAX_EPOCHS):
+        order = rng.permutation(n_docs)
+        for start in range(0, n_docs, LDA_BATCH_SIZE):
+            lda.partial_fit(text_counts[order[start:start + LDA_BATCH_SIZE]])
+
+        perplexity = lda.perplexity(eval_counts)
+        logger.info(f"Online LDA epoch {epoch + 1}: perplexity {perplexity:.1f}")
+        if previous_perplexity is not None and (previous_perplexity - perplexity) / previous_perplexity < LDA_PERPLEXITY_TOL:
+            break
+        previous_perplexity = perplexity
+
+    return lda
+
+
+def fit_topic_model(text_counts, n_topics: int, random_state: int = 42) -> Tuple[LatentDirichletAllocation, np.ndarray]:
+    # Returns the fitted model and the document-topic matrix
+    start = time.perf_counter()
+
+    if text_counts.shape[0] > LDA_ONLINE_THRESHOLD:
+        logger.info(f"Large corpus ({text_counts.shape[0]} documents), using online LDA")
+        lda = fit_online_lda(text_counts, n_topics, random_state)
+        doc_topic = lda.transform(text_counts)
+    else:
+        lda = LatentDirichletAllocation(n_components=n_topics, random_state=random_state)
+        doc_topic = lda.fit_transform(text_counts)
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Topic model fitted in {elapsed:.1f}s", extra={"lda_seconds": elapsed})
+    return lda, doc_topic
+
+
+def umass_coherence(components: np.ndarray, occurrence, n_words: int = 10) -> float:
+    # Mean UMass coherence of the topics (Mimno et al., 2011). For every pair of a topic's top words it is
+    # log((D(w_i, w_j) + 1) / D(w_j)), with D counting the documents that contain the words and w_j the
+    # more likely word. Unlike held-out perplexity it doesn't keep getting worse as k grows.
+    pair_rows, pair_columns = np.tril_indices(n_words, -1)
+    scores = []
+    for top in components.argsort(axis=1)[:, :-(n_words + 1):-1]:
+        columns = occurrence[:, top]
+        co_occurrence = (columns.T @ columns).toarray()
+        doc_freq = np.maximum(np.diag(co_occurrence), 1)
+        scores.append(np.mean(np.log((co_occurrence[pair_rows, pair_columns] + 1) / doc_freq[pair_columns])))
+    return float(np.mean(scores))
+
+
+def _score_candidate(sample_counts, occurrence, n_topics: int, max_iter: int, random_state: int) -> Tuple[float, float]:
+    # Coherence of a k-topic model fitted on the sample, and how long the fit took
+    start = time.perf_counter()
+    lda = LatentDirichletAllocation(n_components=n_topics, max_iter=max_iter, random_state=random_state)
+    lda.fit(sample_counts)
+    seconds = time.perf_counter() - start
+    return umass_coherence(lda.components_, occurrence, min(10, sample_counts.shape[1])), seconds
+
+
+def _affordable_iterations(n_candidates: int, max_iter: int, setup_seconds: float, seconds_per_iteration: float,
+                           remaining: float) -> int:
+    # EM iterations the candidates of a round can all run and still be done within the remaining budget.
+    # On a sample this small a fit costs about the same for every k: a fixed setup plus the iterations.
+    # The candidates run in waves of as many fits as really run at once, one wave without worker processes.
+    waves = -(-n_candidates // pools.parallelism(TOPIC_SWEEP_WORKERS))
+    if seconds_per_iteration <= 0:
+        return max_iter
+    return min(max_iter, int((remaining / waves - setup_seconds) / seconds_per_iteration))
+
+
+def _affordable_candidates(candidates: list, setup_seconds: float, seconds_per_iteration: float, remaining: float) -> list:
+    # As many candidates, spread over the range, as can run TOPIC_SWEEP_MIN_ITER iterations in the budget
+    fit_seconds = setup_seconds + TOPIC_SWEEP_MIN_ITER * seconds_per_iteration
+    affordable = int(remaining // fit_seconds) * pools.parallelism(TOPIC_SWEEP_WORKERS) if fit_seconds > 0 else len(candidates)
+    if affordable >= len(candidates):
+        return candidates
+    if affordable < 2:
+        return []
+    return [candidates[i] for i in np.unique(np.linspace(0, len(candidates) - 1, affordable).round().astype(int))]
+
+
+def _calibrate(sample_counts, n_topics: int, random_state: int) -> Tuple[float, float]:
+    # (setup seconds, seconds per EM iteration) of a fit on the sample, from a 1 and a 3 iteration fit
+    timings = []
+    for max_iter in (1, 3):
+        start = time.perf_counter()
+        LatentDirichletAllocation(n_components=n_topics, max_iter=max_iter, random_state=random_state).fit(sample_counts)
+        timings.append(time.perf_counter() - start)
+    seconds_per_iteration = max((timings[1] - timings[0]) / 2, timings[1] / 10)
+    return max(timings[0] - seconds_per_iteration, 0.0), seconds_per_iteration
+
+
+def _fallback_n_topics(candidates: list) -> int:
+    return min(max(DEFAULT_N_TOPICS, candidates[0]), candidates[-1])
+
+
+pools.preload(__name__)
+
+
+def select_n_topics(text_counts, random_state: int = 42) -> Tuple[int, Optional[dict]]:
+    # Picks the topic count whose topics are most coherent on a subsample of the shared count matrix.
+    # Returns the chosen k and a record of the sweep (None when the count is fixed).
+    if N_TOPICS:
+        return int(N_TOPICS), None
+
+    start = time.perf_counter()
+    deadline = start + TOPIC_SWEEP_BUDGET_SECONDS
+    n_docs = text_counts.shape[0]
+
+    # A model needs at least a couple of documents per topic
+    candidates = [k for k in range(TOPIC_COUNT_MIN, TOPIC_COUNT_MAX + 1) if k * 2 <= n_docs]
+    if len(candidates) < 2:
+        return (candidates[0] if candidates else min(DEFAULT_N_TOPICS, max(1, n_docs))), None
+
+    rng = np.random.RandomState(random_state)
+    sample_rows = rng.permutation(n_docs)[:min(TOPIC_SWEEP_SAMPLE, n_docs)]
+    sample_counts = text_counts[sample_rows]
+    occurrence = (sample_counts > 0).astype(np.float64).tocsr()
+
+    # Fits aren't interrupted once they run, so instead every round gets only as many EM iterations as
+    # fit in the remaining budget. Starting the worker processes counts against the budget too.
+    # More fits than there are cores would only take turns, so no more workers than that are started.
+    workers = pools.parallelism(TOPIC_SWEEP_WORKERS)
+    setup_seconds, seconds_per_iteration = _calibrate(sample_counts, candidates[-1], random_state)
+    all_candidates = candidates
+    candidates = _affordable_candidates(candidates, setup_seconds, seconds_per_iteration, deadline - time.perf_counter())
+
+    scores = {}
+    rounds = []
+    timed_out = len(candidates) < len(all_candidates)
+    for planned_iter in TOPIC_SWEEP_ROUNDS:
+        if len(candidates) < 2:
+            break
+        max_iter = _affordable_iterations(
+            len(candidates), planned_iter, setup_seconds, seconds_per_iteration, deadline - time.perf_counter(),
+        )
+        if max_iter < planned_iter:
+            timed_out = True
+        # too short to tell the counts apart, or no longer than the last round (which would only repeat it)
+        if max_iter < TOPIC_SWEEP_MIN_ITER or (rounds and max_iter <= rounds[-1]["max_iter"]):
+            break
+
+        # sklearn's LDA holds the GIL for most of a fit, so candidates run in worker processes.
+        # Every fit of the round was sized to end within the budget, so all of them are waited for.
+        score = partial(_score_candidate, sample_counts, occurrence, max_iter=max_iter, random_state=random_state)
+        round_results = []
+        scores = {}
+        for k, (coherence, seconds) in zip(candidates, pools.parallel_map(score, candidates, workers, "topic-sweep")):
+            scores[k] = coherence
+            round_results.append({"n_topics": k, "coherence": round(coherence, 4), "seconds": round(seconds, 3)})
+            seconds_per_iteration = max(seconds_per_iteration, (seconds - setup_seconds) / max_iter)
+
+        rounds.append({"max_iter": max_iter, "candidates": sorted(round_results, key=lambda r: r["n_topics"])})
+        if timed_out:
+            break
+
+        # Successive halving: only the more coherent half goes on to the longer round
+        candidates = sorted(scores, key=scores.get, reverse=True)[:max(1, len(scores) // 2)]
+
+    if scores:
+        chosen = max(scores, key=scores.get)
+    else:
+        chosen = _fallback_n_topics(all_candidates)
+        logger.warning(
+            f"Topic sweep budget of {TOPIC_SWEEP_BUDGET_SECONDS}s too small for {TOPIC_SWEEP_MIN_ITER} EM iterations, "
+            f"using {chosen} topics",
+            extra={"n_topics": chosen},
+        )
+    sweep = {
+        "chosen": chosen,
+        "sample_size": len(sample_rows),
+        "seconds": round(time.perf_counter() - start, 3),
+        "timed_out": timed_out,
+        "rounds": rounds,
+    }
+    logger.info(f"Selected {chosen} topics in {sweep['seconds']}s", extra={"topic_sweep_seconds": sweep["seconds"], "n_topics": chosen})
+    return chosen, sweep
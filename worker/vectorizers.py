@@ -0,0 +1,160 @@
+import os
+import logging
+from collections import Counter
+from numbers import Integral
+from typing import List, Optional
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+from sklearn.utils import murmurhash3_32
+
+logger = logging.getLogger(__name__)
+
+# "count" builds the usual vocabulary, "hashing" keeps memory bounded on large files: CountVectorizer holds
+# a dict of every token before min_df prunes most of them, and its matrix is int64. Hashing maps tokens
+# straight to HASHING_N_FEATURES columns, filters them on document frequency and keeps float32 counts.
+VECTORIZER = os.getenv("VECTORIZER", "count")
+HASHING_N_FEATURES = int(os.getenv("HASHING_N_FEATURES", str(2 ** 20)))
+# Documents hashed at a time, only one batch is held unpruned
+HASHING_BATCH_SIZE = int(os.getenv("HASHING_BATCH_SIZE", "10000"))
+
+# Pruning shared by both modes
+MIN_DF = 5
+MAX_DF = 0.9
+
+
+def weighted_doc_freq(counts, weights: np.ndarray) -> np.ndarray:
+    # How many documents contain each column when row i stands for weights[i] identical documents.
+    # counts must be CSR without repeated entries in a row, as the vectorizers produce it.
+    row_weights = np.repeat(weights, np.diff(counts.indptr))
+    return np.bincount(counts.indices, weights=row_weights, minlength=counts.shape[1]).astype(np.int64)
+
+
+def pruning_mask(doc_freq: np.ndarray, n_docs: int, min_df=MIN_DF, max_df=MAX_DF) -> np.ndarray:
+    # The columns CountVectorizer keeps for these document frequencies, with its errors
+    high = max_df if isinstance(max_df, Integral) else max_df * n_docs
+    low = min_df if isinstance(min_df, Integral) else min_df * n_docs
+    if high < low:
+        raise ValueError("max_df corresponds to < documents than min_df")
+    mask = (doc_freq >= low) & (doc_freq <= high)
+    if not mask.any():
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+    return mask
+
+
+class HashedCountVectorizer:
+    # Term counts like CountVectorizer(min_df, max_df, stop_words='english'), with hashed columns.
+    # Fitting reads the texts twice: the first pass only counts document frequencies per hash column,
+    # the second hashes again and keeps the surviving columns. Column names aren't known until
+    # name_columns looks them up, see top_words.
+    def __init__(self, n_features: int = HASHING_N_FEATURES, min_df: int = MIN_DF, max_df: float = MAX_DF,
+                 batch_size: int = HASHING_BATCH_SIZE):
+        self.n_features = n_features
+        self.min_df = min_df
+        self.max_df = max_df
+        self.batch_size = batch_size
+        self.hasher = HashingVectorizer(
+            n_features=n_features, stop_words='english', alternate_sign=False, norm=None, dtype=np.float32,
+        )
+        # hash columns kept by fit, in order, and the names found for them so far
+        self.columns_ = None
+        self.feature_names_ = {}
+
+    def _batches(self, texts):
+        texts = np.asarray(texts, dtype=object)
+        for start in range(0, len(texts), self.batch_size):
+            yield self.hasher.transform(texts[start:start + self.batch_size])
+
+    def fit(self, texts, weights: Optional[np.ndarray] = None):
+        # weights[i] is how many documents text i stands for, see fit_counts
+        if weights is None:
+            weights = np.ones(len(texts), dtype=np.int64)
+        doc_freq = np.zeros(self.n_features, dtype=np.int64)
+        position = 0
+        for batch in self._batches(texts):
+            doc_freq += weighted_doc_freq(batch, weights[position:position + batch.shape[0]])
+            position += batch.shape[0]
+        self.columns_ = np.flatnonzero(pruning_mask(doc_freq, int(weights.sum()), self.min_df, self.max_df)).astype(np.int32)
+        self.feature_names_ = {}
+        logger.info(
+            f"Hashed vocabulary: {len(self.columns_)} of {np.count_nonzero(doc_freq)} columns kept",
+            extra={"hashed_columns": len(self.columns_)},
+        )
+        return self
+
+    def transform(self, texts):
+        parts = [batch[:, self.columns_] for batch in self._batches(texts)]
+        if not parts:
+            return sparse.csr_matrix((0, len(self.columns_)), dtype=np.float32)
+        return sparse.vstack(parts, format="csr")
+
+    def fit_transform(self, texts, weights: Optional[np.ndarray] = None):
+        return self.fit(texts, weights).transform(texts)
+
+    def column_of(self, token: str) -> int:
+        # The hash column of a token, computed like sklearn's feature hasher
+        h = murmurhash3_32(token, seed=0)
+        if h == -2 ** 31:
+            return (2 ** 31 - 1 - (self.n_features - 1)) % self.n_features
+        return abs(h) % self.n_features
+
+    def name_columns(self, columns, texts) -> dict:
+        # Names the given (kept) columns by the token that hashes into each of them most often in texts.
+        # Only tokens of the wanted columns are counted, so this stays as small as the request.
+        # hash column -> position in the kept columns
+        wanted = {int(self.columns_[column]): int(column) for column in columns if int(column) not in self.feature_names_}
+        if wanted:
+            analyzer = self.hasher.build_analyzer()
+            token_counts = Counter()
+            seen = {}
+            for text in texts:
+                for token in analyzer(text):
+                    if token not in seen:
+                        # a column outside the request is remembered as None
+                        seen[token] = wanted.get(self.column_of(token))
+                    if seen[token] is not None:
+                        token_counts[token] += 1
+                if len(seen) > 100_000:
+                    # bounded, at the cost of hashing some tokens twice
+                    seen = {token: column for token, column in seen.items() if column is not None}
+            for token, _ in token_counts.most_common():
+                self.feature_names_.setdefault(seen[token], token)
+        return {column: self.feature_names_.get(int(column), f"#{int(column)}") for column in columns}
+
+
+def make_vectorizer():
+    if VECTORIZER == "hashing":
+        return HashedCountVectorizer()
+    return CountVectorizer(max_df=MAX_DF, min_df=MIN_DF, stop_words='english')
+
+
+def fit_counts(vectorizer, texts, weights: Optional[np.ndarray] = None):
+    # fit_transform in which text i counts as weights[i] documents towards min_df/max_df, so a review that
+    # stands for collapsed copies prunes the vocabulary like the copies themselves would.
+    # Only the pruning is weighted, the returned counts are one row per text.
+    if isinstance(vectorizer, HashedCountVectorizer):
+        return vectorizer.fit_transform(texts, weights)
+    if weights is None:
+        return vectorizer.fit_transform(texts)
+
+    min_df, max_df = vectorizer.min_df, vectorizer.max_df
+    vectorizer.set_params(min_df=1, max_df=1.0)
+    try:
+        counts = vectorizer.fit_transform(texts)
+    finally:
+        vectorizer.set_params(min_df=min_df, max_df=max_df)
+    kept = np.flatnonzero(pruning_mask(weighted_doc_freq(counts, weights), int(weights.sum()), min_df, max_df))
+    vectorizer.vocabulary_ = {term: i for i, term in enumerate(vectorizer.get_feature_names_out()[kept])}
+    return counts[:, kept]
+
+
+def top_words(vectorizer, components: np.ndarray, texts, n_words: int = 5) -> List[str]:
+    # The n_words heaviest terms of every topic, as space separated words.
+    # A hashed column is named after the texts it was counted from, only for the columns shown here.
+    top_columns = components.argsort(axis=1)[:, :-(n_words + 1):-1]
+    if isinstance(vectorizer, HashedCountVectorizer):
+        names = vectorizer.name_columns(np.unique(top_columns), texts)
+    else:
+        names = vectorizer.get_feature_names_out()
+    return [" ".join(names[i] for i in columns) for columns in top_columns]
@@ -1,14 +1,22 @@
-import pandas as pd
 import re
-import os
-import nltk
 from typing import Optional, List
 
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.decomposition import LatentDirichletAllocation
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-import openai
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from scipy import sparse
+
 from dotenv import load_dotenv
+from summarizer import SUMMARY_MAX_REVIEWS, pack_feedback, summarize_topics
+from ingest import read_cleaned_reviews, fetch_reviews
+from dedup import collapse_duplicates
+from documents import write_document_artifact
+from sentiment import compound_scores, get_analyzer
+from topics import fit_topic_model, select_n_topics
+from vectorizers import fit_counts, make_vectorizer, top_words
+from instrumentation import StageMetrics, span
+from model_store import INCREMENTAL_PARTIAL_FIT, MODEL_STORE_BUCKET, load_latest_model, save_model
 
 import logging
 from logging_config import setup_logging
@@ -18,17 +26,6 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-# Configure client for openrouter.ai
-client = openai.OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-)
-
-# Make sure that nltk finds its data files
-nltk.data.path.append(os.path.join(os.path.dirname(__file__), "nltk_data"))
-
-sia = SentimentIntensityAnalyzer()
-
 
 def clean_text(text: str) -> str:
     # Clean the text
@@ -40,95 +37,180 @@ def clean_text(text: str) -> str:
     return text.strip()
 
 
-def get_ai_summary(feedback_list: List[str], topic_keywords: str) -> str:
-    # Used free model from openrouter for summarization
-    if not client.api_key: return "OpenRouter API key not found."
+# ASCII spellings of the \w and \s classes used by clean_text (python also treats \x1c-\x1f as whitespace),
+# re2 would read \w and \s differently so they are spelled out here
+_ASCII_PUNCTUATION = pc.ReplaceSubstringOptions(r'[^A-Za-z0-9_ \t\n\r\f\v\x1c-\x1f]', '')
+# Single spaces are left alone, which is much cheaper than rewriting every whitespace run
+_ASCII_WHITESPACE = pc.ReplaceSubstringOptions(r'[ \t\n\r\f\v\x1c-\x1f]{2,}|[\t\n\r\f\v\x1c-\x1f]', ' ')
 
-    feedback_str = "\n- ".join(feedback_list)
-    prompt = (
-        f"You are a product analyst summarizing customer feedback about '{topic_keywords}'.\n"
-        f"Here is the raw feedback:\n- {feedback_str}\n\n"
-        f"Please write a single, coherent paragraph that summarizes the key points and sentiments expressed."
-    )
-    
+
+def clean_series(texts: pd.Series) -> pd.Series:
+    # Same output as texts.apply(clean_text), but ASCII rows are cleaned in one pass over the whole chunk.
+    # Rows with other characters go through clean_text so the unicode rules stay exactly the same.
     try:
-        response = client.chat.completions.create(
-            # we can change the url here 
-            extra_headers={"HTTP-Referer": "http://localhost:3000", "X-Title": "ProductPulse"},
-            model="google/gemma-3-27b-it:free",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=250, temperature=0.7,
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"AI summary could not be generated due to an API error: {e}"
+        arr = pc.fill_null(pa.array(texts, type=pa.string(), from_pandas=True), "")
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return texts.apply(clean_text)
+
+    cleaned = pc.ascii_lower(arr)
+    cleaned = pc.replace_substring_regex(cleaned, options=_ASCII_PUNCTUATION)
+    cleaned = pc.replace_substring_regex(cleaned, options=_ASCII_WHITESPACE)
+    cleaned = pc.utf8_trim(cleaned, characters=" ").to_numpy(zero_copy_only=False)
+
+    non_ascii = np.flatnonzero(~pc.string_is_ascii(arr).to_numpy(zero_copy_only=False))
+    if len(non_ascii):
+        cleaned[non_ascii] = [clean_text(text) for text in texts.to_numpy()[non_ascii]]
+
+    return pd.Series(cleaned, index=texts.index, dtype=object)
 
-def process_feedback_file(filepath: str) -> Optional[List[dict]]:
+
+def process_feedback_file(
+    filepath: str, metadata: Optional[dict] = None, metrics: Optional[StageMetrics] = None,
+    model_key: Optional[str] = None, incremental: bool = False, documents_dir: Optional[str] = None,
+) -> Optional[List[dict]]:
     # This funciton gets file and does the AI analysis
+    # Details about the run (chosen topic count, sweep timings) are added to metadata when it is given,
+    # the time and memory every stage took are recorded in metrics.
+    # model_key ("<user_id>/<product_line>") is where the fitted model is kept, incremental reuses the stored one.
+    # The per-review results are written to documents_dir when it is given.
+    metadata = metadata if metadata is not None else {}
 
     logger.info(f"--- Starting AI Analysis on {filepath} ---")
 
     try:
-        df = pd.read_csv(filepath, engine='python', on_bad_lines='skip')
+        # Streams only the 'Review Text' column through cleaning, chunk by chunk
+        with span("ingest", metrics):
+            modeling_df = read_cleaned_reviews(filepath, clean_series)
+        if modeling_df.empty: return []
 
-        if "Review Text" not in df.columns:
-            logger.error("Required column 'Review Text' is missing from the input file.")
-            raise ValueError("Required column 'Review Text' is missing from the input file.")
+        # Copies of a review are modelled once, weighted by how many there are
+        with span("dedup", metrics):
+            groups, representatives = collapse_duplicates(modeling_df['cleaned_feedback'])
+        modeling_df['group'] = groups
+        unique_texts = modeling_df['cleaned_feedback'].iloc[representatives]
+        weights = np.bincount(groups)
 
-        df['cleaned_feedback'] = df['Review Text'].apply(clean_text)
-        df.reset_index(inplace=True); df.rename(columns={'index': 'doc_id'}, inplace=True)
-        
-        modeling_df = df[df['cleaned_feedback'] != ''].copy()
-        if modeling_df.empty: return []
+        # Incremental uploads are analyzed with the stored model of their product line, when there is one
+        stored_model = load_latest_model(model_key) if incremental and model_key else None
+        if incremental and stored_model is None:
+            logger.info(f"No stored topic model for {model_key}, fitting a new one")
 
         logger.info("Vectorizing text...")
-        vectorizer = CountVectorizer(max_df=0.9, min_df=5, stop_words='english')
-        text_counts = vectorizer.fit_transform(modeling_df['cleaned_feedback'])
+        with span("vectorize", metrics, documents=len(unique_texts)):
+            if stored_model:
+                vectorizer = stored_model.vectorizer
+                text_counts = vectorizer.transform(unique_texts)
+            else:
+                # min_df/max_df count every review of a group, as if the copies hadn't been collapsed
+                vectorizer = make_vectorizer()
+                text_counts = fit_counts(vectorizer, unique_texts, weights)
+            # A review that stands for n copies counts n times towards the topics, in the matrix's own dtype
+            if weights.max() > 1:
+                text_counts = sparse.diags(weights.astype(text_counts.dtype)) @ text_counts
         
-        # For now we fixed the topic count to 7
-        n_topics = 7
-        logger.info(f"Identifying {n_topics} topics with LDA...")
-        lda = LatentDirichletAllocation(n_components=n_topics, random_state=42)
-        modeling_df['topic_id'] = lda.fit_transform(text_counts).argmax(axis=1)
+        if stored_model:
+            lda = stored_model.lda
+            n_topics, topic_sweep = lda.n_components, None
+            logger.info(f"Assigning documents to the {n_topics} topics of model {stored_model.version}...")
+            with span("lda", metrics, n_topics=n_topics, model_version=stored_model.version):
+                if INCREMENTAL_PARTIAL_FIT:
+                    lda.partial_fit(text_counts)
+                doc_topic = lda.transform(text_counts)
+        else:
+            # The topic count is picked per file, unless N_TOPICS pins it
+            with span("select_topics", metrics):
+                n_topics, topic_sweep = select_n_topics(text_counts)
+            logger.info(f"Identifying {n_topics} topics with LDA...")
+            with span("lda", metrics, n_topics=n_topics):
+                lda, doc_topic = fit_topic_model(text_counts, n_topics)
+        metadata["n_topics"] = n_topics
+        metadata["topic_sweep"] = topic_sweep
+
+        # A model fitted or updated here is kept for the next upload of the product line
+        metadata["model_version"] = stored_model.version if stored_model else None
+        if MODEL_STORE_BUCKET and model_key and (stored_model is None or INCREMENTAL_PARTIAL_FIT):
+            try:
+                with span("save_model", metrics):
+                    metadata["model_version"] = save_model(
+                        model_key, vectorizer, lda, parent=stored_model.version if stored_model else None
+                    )
+            except Exception as e:
+                # the analysis itself is fine, only the next incremental upload will have to refit
+                logger.error(f"Could not save the topic model for {model_key}: {e}")
+                metadata["model_version"] = None
+        modeling_df['topic_id'] = doc_topic.argmax(axis=1)[groups]
+
+        # Every group is scored once, the topic loop only aggregates
+        with span("sentiment", metrics):
+            modeling_df['sentiment'] = compound_scores(unique_texts)[groups]
+
+        # Per-review results for drill-down, the caller uploads them once the job succeeded
+        if documents_dir:
+            try:
+                with span("documents", metrics, documents=len(modeling_df)):
+                    write_document_artifact(
+                        documents_dir, filepath, modeling_df['doc_id'].to_numpy(), modeling_df['topic_id'].to_numpy(),
+                        modeling_df['sentiment'].to_numpy(), doc_topic[groups],
+                    )
+            except Exception as e:
+                # the aggregated results don't depend on them
+                logger.error(f"Could not write the per-review results: {e}")
 
         logger.info("Analyzing topics, sentiment, and generating summaries with OpenRouter...")
 
         final_results = []
-        feature_names = vectorizer.get_feature_names_out()
-
-        for topic_id in range(n_topics):
-            top_words_indices = lda.components_[topic_id].argsort()[:-6:-1]
-            top_words = " ".join([feature_names[i] for i in top_words_indices])
-            topic_docs_df = modeling_df[modeling_df['topic_id'] == topic_id]
-            
-            if topic_docs_df.empty: continue
-
-            # Calculate the average compound sentiment score
-            sentiment_scores = topic_docs_df['cleaned_feedback'].apply(lambda t: sia.polarity_scores(t)['compound'])
-            avg_sentiment_score = sentiment_scores.mean()
-
-            # Get a sentiment dictionary for the entire topic
-            sentiment_text_sample = " ".join(topic_docs_df.head(50)['cleaned_feedback'])
-            topic_sentiment_dict = sia.polarity_scores(sentiment_text_sample)
-            
-            # Get raw feedback for the AI summary
-            summary_docs = topic_docs_df.head(10)
-            raw_feedback_list = df.loc[summary_docs['doc_id']]['Review Text'].dropna().tolist()
-            ai_summary = get_ai_summary(raw_feedback_list, top_words)
-
-            topic_result = {
-                "topic_id": topic_id,
-                "top_words": top_words,
-                "review_count": len(topic_docs_df),
-                "avg_sentiment": avg_sentiment_score,
-                "sentiment_dict": topic_sentiment_dict,
-                "ai_summary": ai_summary
-            }
-            final_results.append(topic_result)
+        summary_doc_ids = []
+
+        with span("aggregate", metrics):
+            topic_top_words = top_words(vectorizer, lda.components_, unique_texts)
+            for topic_id in range(n_topics):
+                topic_docs_df = modeling_df[modeling_df['topic_id'] == topic_id]
+                
+                if topic_docs_df.empty: continue
+
+                # Calculate the average compound sentiment score
+                avg_sentiment_score = topic_docs_df['sentiment'].mean()
+
+                # Get a sentiment dictionary for the entire topic
+                sentiment_text_sample = " ".join(topic_docs_df.head(50)['cleaned_feedback'])
+                topic_sentiment_dict = get_analyzer().polarity_scores(sentiment_text_sample)
+                
+                # Candidates for the AI summary, the reviews that belong most clearly to the topic first,
+                # one per group of near-identical reviews. The prompt is packed from them once their text is fetched.
+                candidates = topic_docs_df.drop_duplicates('group')
+                topic_probability = doc_topic[candidates['group'].to_numpy(), topic_id]
+                candidates = candidates.iloc[np.argsort(-topic_probability, kind='stable')[:SUMMARY_MAX_REVIEWS * 2]]
+                summary_doc_ids.append(candidates['doc_id'].tolist())
+
+                topic_result = {
+                    "topic_id": topic_id,
+                    "top_words": topic_top_words[topic_id],
+                    "review_count": len(topic_docs_df),
+                    "avg_sentiment": avg_sentiment_score,
+                    "sentiment_dict": topic_sentiment_dict,
+                }
+                final_results.append(topic_result)
+
+        # Get raw feedback for the AI summaries in one more pass over the file
+        with span("fetch_reviews", metrics):
+            raw_reviews = fetch_reviews(filepath, [doc_id for doc_ids in summary_doc_ids for doc_id in doc_ids])
+        summary_jobs = []
+        for doc_ids, topic_result in zip(summary_doc_ids, final_results):
+            feedback_list, prompt_tokens = pack_feedback(
+                (raw_reviews[doc_id] for doc_id in doc_ids if doc_id in raw_reviews), topic_result["top_words"]
+            )
+            topic_result["prompt_tokens"] = prompt_tokens
+            summary_jobs.append((feedback_list, topic_result["top_words"]))
+
+        # The LLM round-trips dominate the job time, so all topics are summarized concurrently
+        with span("summarize", metrics, topics=len(summary_jobs)):
+            summaries = summarize_topics(summary_jobs, metrics=metrics)
+        for topic_result, ai_summary in zip(final_results, summaries):
+            topic_result["ai_summary"] = ai_summary
         
         logger.info("--- AI Analysis Complete ---")
 
         return final_results
     except Exception as e:
         logger.error(f"An unexpected error occurred in worker: {e}")
-        return None
\ No newline at end of file
+        return None